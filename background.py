@@ -0,0 +1,163 @@
+"""Background jobs for the Streamlit UIs, so a slow LLM call never blocks a rerun.
+
+Jobs run on one thread pool shared by every browser session and are kept in
+the session's st.session_state by name (starting a job cancels the previous
+one of that name). watch() shows running ones in a fragment that polls
+every SASSY_UI_POLL seconds: an st.status with the text streamed so far and
+a Cancel button. Once a job finishes it reruns the page so the script can
+render the result. Jobs that run longer than SASSY_UI_TIMEOUT are abandoned.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+WORKERS = int(os.getenv("SASSY_UI_WORKERS", "16"))
+TIMEOUT = float(os.getenv("SASSY_UI_TIMEOUT", "90"))
+POLL = float(os.getenv("SASSY_UI_POLL", "0.5"))
+
+
+class Cancelled(Exception):
+    """Raised inside a job that was cancelled or ran out of time."""
+
+
+class Job:
+    def __init__(self, label: str, timeout: float):
+        self.label = label
+        self.timeout = timeout
+        self.started = time.monotonic()
+        self.parts = []  # text streamed so far
+        self.reason = None  # "cancelled" or "timed out"
+        self.announced = False  # the page has been rerun for its result
+        self._stop = threading.Event()
+        self.future = None
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts).strip()
+
+    @property
+    def state(self) -> str:
+        """running, done, failed, cancelled or timed out."""
+        if self.reason:
+            return self.reason
+        if not self.future.done():
+            if self.elapsed > self.timeout:
+                self.cancel("timed out")
+                return self.reason
+            return "running"
+        return "failed" if self.future.exception() else "done"
+
+    def result(self):
+        return self.future.result() if self.state == "done" else None
+
+    @property
+    def error(self):
+        return self.future.exception() if self.state == "failed" else None
+
+    def cancel(self, reason: str = "cancelled"):
+        """Stop the job: it is dropped if queued, stops at its next check() if running."""
+        if self.reason is None and not self.future.done():
+            self.reason = reason
+        self._stop.set()
+        self.future.cancel()
+
+    def check(self):
+        """Raise Cancelled if the job should stop; jobs call this between steps."""
+        if self._stop.is_set():
+            raise Cancelled(self.reason)
+        if self.elapsed > self.timeout:
+            self.reason = self.reason or "timed out"
+            raise Cancelled(self.reason)
+
+    def stream(self, deltas) -> str:
+        """Collect text deltas as they arrive, hanging up early if cancelled."""
+        try:
+            for text in deltas:
+                self.check()
+                self.parts.append(text)
+        finally:
+            close = getattr(deltas, "close", None)
+            if close:
+                close()
+        return self.text
+
+
+@st.cache_resource
+def _pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="sassy-ui")
+
+
+def _jobs() -> dict:
+    return st.session_state.setdefault("_background_jobs", {})
+
+
+def start(name: str, fn, *args, label: str, timeout: float = TIMEOUT) -> Job:
+    """Run fn(job, *args) in the background as this session's job `name`."""
+    cancel(name)
+    job = Job(label, timeout)
+    job.future = _pool().submit(fn, job, *args)
+    _jobs()[name] = job
+    return job
+
+
+def get(name: str):
+    return _jobs().get(name)
+
+
+def pop(name: str):
+    return _jobs().pop(name, None)
+
+
+def rename(name: str, new_name: str):
+    """Hand a job over to another name (e.g. a prefetch becoming the current one)."""
+    job = pop(name)
+    if job is not None:
+        cancel(new_name)
+        _jobs()[new_name] = job
+    return job
+
+
+def cancel(name: str):
+    job = pop(name)
+    if job is not None:
+        job.cancel()
+
+
+def running(names) -> bool:
+    return any(job.state == "running" for job in map(get, names) if job is not None)
+
+
+def watch(*names: str):
+    """Show these jobs while they run and rerun the page when one of them finishes."""
+    for name in names:
+        job = get(name)
+        if job is not None and job.state != "running":
+            job.announced = True  # this run renders it already
+    st.fragment(_watch, run_every=POLL if running(names) else None)(names)
+
+
+def _watch(names: tuple):
+    finished = False
+    for name in names:
+        job = get(name)
+        if job is None:
+            continue
+        if job.state == "running":
+            with st.status(f"{job.label} ({job.elapsed:.0f}s)", state="running", expanded=bool(job.parts)):
+                if job.parts:
+                    st.markdown(job.text)
+                if st.button("Cancel", key=f"cancel_{name}"):
+                    job.cancel()
+                    finished = True
+        elif not job.announced:
+            job.announced = True
+            finished = True
+    if finished:
+        st.rerun()
@@ -0,0 +1,147 @@
+"""Offline batches in the OpenAI Batch API file format.
+
+Each request is one JSONL line:
+    {"custom_id": "item-0", "method": "POST", "url": "/v1/chat/completions", "body": {...}}
+and each result line carries the same custom_id with either a response body
+or an error. OpenAIBatchBackend submits through the real Batch API;
+LocalBatchBackend keeps everything in a directory and works the file off
+itself, for tests and for running against the stub server.
+"""
+import asyncio
+import json
+import os
+import uuid
+
+ENDPOINT = "/v1/chat/completions"
+
+
+def request_line(custom_id: str, model: str, prompt: str, temperature: float, max_tokens: int) -> dict:
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": ENDPOINT,
+        "body": {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        },
+    }
+
+
+def output_text(line: dict):
+    """Return (text, error) from one Batch API output line."""
+    response = line.get("response") or {}
+    if line.get("error") or response.get("status_code") != 200:
+        error = line.get("error") or response.get("body", {}).get("error") or "request failed"
+        return None, error.get("message", str(error)) if isinstance(error, dict) else str(error)
+    try:
+        return response["body"]["choices"][0]["message"]["content"].strip(), None
+    except (KeyError, IndexError, TypeError, AttributeError):
+        return None, "malformed response"
+
+
+def _parse_jsonl(text: str) -> list:
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+class OpenAIBatchBackend:
+    """Submit through the OpenAI Files and Batches APIs (24h completion window)."""
+
+    def __init__(self, client):
+        self.client = client
+
+    async def submit(self, lines: list) -> str:
+        data = "".join(json.dumps(line) + "\n" for line in lines).encode()
+        upload = await self.client.files.create(file=("batch.jsonl", data), purpose="batch")
+        batch = await self.client.batches.create(
+            input_file_id=upload.id, endpoint=ENDPOINT, completion_window="24h"
+        )
+        return batch.id
+
+    async def status(self, batch_id: str) -> str:
+        return (await self.client.batches.retrieve(batch_id)).status
+
+    async def output(self, batch_id: str) -> list:
+        batch = await self.client.batches.retrieve(batch_id)
+        lines = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                lines += _parse_jsonl((await self.client.files.content(file_id)).text)
+        return lines
+
+
+class LocalBatchBackend:
+    """Directory-backed stand-in for the Batch API.
+
+    submit() writes <id>.input.jsonl and works through it in the background
+    with complete(body) -> chat completion dict, writing <id>.output.jsonl
+    in the Batch API output format when done.
+    """
+
+    def __init__(self, directory: str, complete, concurrency: int = 4):
+        self.directory = directory
+        self.complete = complete
+        self.concurrency = concurrency
+        self.tasks = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, batch_id: str, kind: str) -> str:
+        return os.path.join(self.directory, f"{batch_id}.{kind}")
+
+    async def submit(self, lines: list) -> str:
+        batch_id = f"local_batch_{uuid.uuid4().hex[:12]}"
+        with open(self._path(batch_id, "input.jsonl"), "w") as f:
+            f.writelines(json.dumps(line) + "\n" for line in lines)
+        self.tasks[batch_id] = asyncio.create_task(self._run(batch_id, lines))
+        return batch_id
+
+    async def _run(self, batch_id: str, lines: list):
+        limit = asyncio.Semaphore(self.concurrency)
+
+        async def one(line):
+            async with limit:
+                try:
+                    body = await self.complete(line["body"])
+                    response = {"status_code": 200, "request_id": uuid.uuid4().hex, "body": body}
+                    return {"id": f"batch_req_{uuid.uuid4().hex[:12]}", "custom_id": line["custom_id"],
+                            "response": response, "error": None}
+                except Exception as e:
+                    return {"id": f"batch_req_{uuid.uuid4().hex[:12]}", "custom_id": line["custom_id"],
+                            "response": None, "error": {"code": "local_error", "message": str(e)}}
+
+        results = await asyncio.gather(*(one(line) for line in lines))
+        with open(self._path(batch_id, "output.jsonl"), "w") as f:
+            f.writelines(json.dumps(result) + "\n" for result in results)
+
+    async def status(self, batch_id: str) -> str:
+        if os.path.exists(self._path(batch_id, "output.jsonl")):
+            return "completed"
+        task = self.tasks.get(batch_id)
+        if task is not None and not task.done():
+            return "in_progress"
+        if os.path.exists(self._path(batch_id, "input.jsonl")):
+            # Input without a running worker: the process restarted mid-batch.
+            return "failed"
+        raise KeyError(batch_id)
+
+    async def output(self, batch_id: str) -> list:
+        with open(self._path(batch_id, "output.jsonl")) as f:
+            return _parse_jsonl(f.read())
+
+    async def stop(self):
+        for task in self.tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+
+
+def save_meta(directory: str, batch_id: str, meta: dict):
+    """Remember what each custom_id was for, so results can be post-processed later."""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, f"{batch_id}.meta.json"), "w") as f:
+        json.dump(meta, f)
+
+
+def load_meta(directory: str, batch_id: str) -> dict:
+    with open(os.path.join(directory, f"{batch_id}.meta.json")) as f:
+        return json.load(f)
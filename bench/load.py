@@ -0,0 +1,238 @@
+"""Load generator for the API, driven against the stub OpenAI server.
+
+Starts bench/stub_openai.py and main.py with uvicorn (unless --target is
+given), fires requests at a fixed concurrency and prints p50/p95/p99
+latency, requests/sec and upstream calls per request. Runs fully offline.
+
+    python -m bench.load --scenario mix --concurrency 50 --requests 500
+    python -m bench.load --scenario ask --stream --latency 0.8
+    python -m bench.load --json bench.json --max-p95 1500   # fail CI on regressions
+
+SASSY_* env vars are passed through to the app, so cache/pool settings
+can be compared run to run.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+
+import httpx
+
+ASK = [
+    "What is a list comprehension?",
+    "explain list comprehensions pls",
+    "What does the yield keyword do?",
+    "Difference between a tuple and a list?",
+    "How do decorators work?",
+    "What is __init__ for?",
+    "Why is my for loop not running?",
+    "What does *args mean?",
+]
+CODE = [
+    "for i in range(3)\nprint(i)",                 # missing colon, answered locally
+    "def add(a, b):\nreturn a + b",                 # indentation, answered locally
+    "def add(a, b):\n    return a + b\nprint(add(1, 2))",
+    "nums = [1, 2, 3]\nsquares = []\nfor n in nums:\n    squares.append(n * n)\nprint(squares)",
+    "x = input('Number: ')\nprint(x + 1)",
+]
+SCENARIOS = ["ask", "code", "quiz", "roast", "mix"]
+
+
+def make_request(scenario: str, unique: float, stream: bool):
+    """Return (label, path, json body) for one request of a scenario."""
+    if scenario == "mix":
+        scenario = random.choices(["ask", "code", "quiz", "roast"], weights=[4, 2, 3, 1])[0]
+    suffix = f" #{random.randint(1, 10**9)}" if random.random() < unique else ""
+    chat = "/chat/stream" if stream else "/chat"
+    if scenario == "ask":
+        return "ask", chat, {"mode": "ask", "content": random.choice(ASK) + suffix}
+    if scenario == "code":
+        code = random.choice(CODE) + (f"\n# {suffix}" if suffix else "")
+        return "code", chat, {"mode": "code", "content": code}
+    if scenario == "quiz":
+        return "quiz", chat, {"mode": "quiz"}
+    return "roast", "/roast/stream" if stream else "/roast", {
+        "question": "What will print(2 ** 3) output?" + suffix,
+        "user_answer": random.choice(["6", "9", "Error"]),
+        "correct_answer": "8",
+    }
+
+
+async def one_request(client: httpx.AsyncClient, label: str, path: str, body: dict) -> dict:
+    """Send a request and time it; for SSE endpoints also time the first event."""
+    start = time.perf_counter()
+    first = None
+    ok = False
+    try:
+        if path.endswith("/stream"):
+            async with client.stream("POST", path, json=body) as res:
+                async for line in res.aiter_lines():
+                    if first is None and line.startswith("data:"):
+                        first = time.perf_counter() - start
+                    if line.startswith("event: error"):
+                        break
+                    if line.startswith("event: done"):
+                        ok = res.status_code == 200
+        else:
+            res = await client.post(path, json=body)
+            ok = res.status_code == 200
+    except httpx.HTTPError:
+        ok = False
+    return {"label": label, "ok": ok, "latency": time.perf_counter() - start, "ttfb": first}
+
+
+async def run_load(target: str, args) -> tuple:
+    queue = asyncio.Queue()
+    for _ in range(args.requests):
+        queue.put_nowait(make_request(args.scenario, args.unique, args.stream))
+    results = []
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=target, timeout=args.timeout, limits=limits) as client:
+        async def worker():
+            while not queue.empty():
+                results.append(await one_request(client, *queue.get_nowait()))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+    return results, elapsed
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize(results: list, elapsed: float, upstream_calls: int) -> dict:
+    report = {"requests": len(results), "elapsed_s": round(elapsed, 3), "endpoints": {}}
+    for label in sorted({r["label"] for r in results}) + ["all"]:
+        rows = [r for r in results if label in ("all", r["label"])]
+        latencies = [r["latency"] * 1000 for r in rows if r["ok"]]
+        ttfbs = [r["ttfb"] * 1000 for r in rows if r["ok"] and r["ttfb"] is not None]
+        report["endpoints"][label] = {
+            "count": len(rows),
+            "errors": sum(not r["ok"] for r in rows),
+            "p50_ms": round(percentile(latencies, 50), 1),
+            "p95_ms": round(percentile(latencies, 95), 1),
+            "p99_ms": round(percentile(latencies, 99), 1),
+            "ttfb_p50_ms": round(percentile(ttfbs, 50), 1) if ttfbs else None,
+        }
+    report["rps"] = round(len(results) / elapsed, 1) if elapsed else 0.0
+    report["upstream_calls"] = upstream_calls
+    report["upstream_per_request"] = round(upstream_calls / len(results), 3) if results else 0.0
+    report["error_rate"] = round(report["endpoints"]["all"]["errors"] / len(results), 4) if results else 0.0
+    return report
+
+
+def print_report(report: dict):
+    print(f"{'endpoint':<8} {'count':>6} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'ttfb p50':>9}")
+    for label, row in report["endpoints"].items():
+        ttfb = row["ttfb_p50_ms"] if row["ttfb_p50_ms"] is not None else "-"
+        print(f"{label:<8} {row['count']:>6} {row['errors']:>6} {row['p50_ms']:>8} "
+              f"{row['p95_ms']:>8} {row['p99_ms']:>8} {ttfb:>9}")
+    print(f"\n{report['rps']} req/s over {report['elapsed_s']} s, "
+          f"{report['upstream_calls']} upstream calls ({report['upstream_per_request']} per request)")
+
+
+def start_server(app: str, port: int, env: dict, workers: int = 1) -> subprocess.Popen:
+    """Start a uvicorn app in a subprocess and wait until it answers."""
+    cmd = [sys.executable, "-m", "uvicorn", app, "--port", str(port), "--log-level", "warning"]
+    if workers > 1:
+        cmd += ["--workers", str(workers)]
+    return wait_ready(subprocess.Popen(cmd, env=env), port, app)
+
+
+def wait_ready(proc: subprocess.Popen, port: int, name: str) -> subprocess.Popen:
+    """Wait until a server process answers on port; stop it if it never does."""
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/openapi.json", timeout=1)
+            return proc
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"{name} did not start on port {port}")
+
+
+def stub_stats(stub: str) -> dict:
+    return httpx.get(f"{stub}/stats", timeout=5).json()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=SCENARIOS, default="mix")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--unique", type=float, default=0.5, help="fraction of ask/code/roast requests made unique")
+    parser.add_argument("--stream", action="store_true", help="use the SSE endpoints")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--warmup", type=float, default=1.0, help="seconds to let the quiz pool fill")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the app")
+    parser.add_argument("--latency", type=float, default=0.3, help="stub latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--app-port", type=int, default=9200)
+    parser.add_argument("--stub-port", type=int, default=9100)
+    parser.add_argument("--target", help="benchmark an already running app instead of starting one")
+    parser.add_argument("--stub", help="stats URL of an already running stub, e.g. http://127.0.0.1:9100")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--max-p95", type=float, help="fail if overall p95 exceeds this many ms")
+    parser.add_argument("--max-error-rate", type=float, help="fail if the error rate exceeds this fraction")
+    parser.add_argument("--max-upstream-per-request", type=float, help="fail above this many upstream calls per request")
+    args = parser.parse_args(argv)
+
+    procs = []
+    try:
+        stub = args.stub
+        if not stub:
+            env = {**os.environ, "STUB_LATENCY": str(args.latency), "STUB_JITTER": str(args.jitter),
+                   "STUB_ERROR_RATE": str(args.error_rate)}
+            procs.append(start_server("bench.stub_openai:app", args.stub_port, env))
+            stub = f"http://127.0.0.1:{args.stub_port}"
+        target = args.target
+        if not target:
+            env = {**os.environ, "OPENAI_BASE_URL": f"{stub}/v1", "OPENAI_API_KEY": "stub"}
+            procs.append(start_server("main:app", args.app_port, env, args.workers))
+            target = f"http://127.0.0.1:{args.app_port}"
+            time.sleep(args.warmup)
+
+        before = stub_stats(stub)["calls"]
+        results, elapsed = asyncio.run(run_load(target, args))
+        report = summarize(results, elapsed, stub_stats(stub)["calls"] - before)
+        report["config"] = {k: v for k, v in vars(args).items() if not k.startswith("max_")}
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failures = []
+    overall = report["endpoints"]["all"]
+    if args.max_p95 is not None and overall["p95_ms"] > args.max_p95:
+        failures.append(f"p95 {overall['p95_ms']} ms > {args.max_p95} ms")
+    if args.max_error_rate is not None and report["error_rate"] > args.max_error_rate:
+        failures.append(f"error rate {report['error_rate']} > {args.max_error_rate}")
+    if args.max_upstream_per_request is not None and report["upstream_per_request"] > args.max_upstream_per_request:
+        failures.append(f"{report['upstream_per_request']} upstream calls/request > {args.max_upstream_per_request}")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
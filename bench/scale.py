@@ -0,0 +1,104 @@
+"""Throughput of the API as the worker count grows, against the stub upstream.
+
+For each --workers entry, starts serve.py with that many workers sharing a
+fresh SASSY_STATE_DB, fires the same load at it and reports requests/sec,
+latency and the most upstream calls the stub saw in flight at once (which
+stays at or under SASSY_UPSTREAM_CONCURRENCY however many workers there
+are; a call the app cancelled, like a hedge that lost, stops counting as
+soon as its connection closes). Runs fully offline.
+
+    python -m bench.scale --workers 1 2 4 --scenario ask --concurrency 200 --requests 4000
+    SASSY_UPSTREAM_CONCURRENCY=20 python -m bench.scale --workers 1 4   # the cap holds across workers
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from bench.load import SCENARIOS, run_load, start_server, stub_stats, summarize, wait_ready
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(workers: int, stub: str, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            "OPENAI_BASE_URL": f"{stub}/v1",
+            "OPENAI_API_KEY": "stub",
+            "SASSY_STATE_DB": os.path.join(tmp, "state.db"),
+            "SASSY_SESSION_DB": os.path.join(tmp, "sessions.db"),
+            "SASSY_QUIZ_BANK": os.path.join(tmp, "quiz_bank.db"),
+        }
+        cmd = [sys.executable, os.path.join(ROOT, "serve.py"), "--workers", str(workers),
+               "--port", str(args.app_port), "--log-level", "warning"]
+        proc = wait_ready(subprocess.Popen(cmd, env=env), args.app_port, "serve.py")
+        try:
+            time.sleep(args.warmup)
+            httpx.post(f"{stub}/reset", timeout=5)
+            results, elapsed = asyncio.run(run_load(f"http://127.0.0.1:{args.app_port}", args))
+            stats = stub_stats(stub)
+        finally:
+            proc.terminate()
+            proc.wait()
+    report = summarize(results, elapsed, stats["calls"])
+    overall = report["endpoints"]["all"]
+    return {
+        "workers": workers,
+        "rps": report["rps"],
+        "p50_ms": overall["p50_ms"],
+        "p95_ms": overall["p95_ms"],
+        "error_rate": report["error_rate"],
+        "upstream_per_request": report["upstream_per_request"],
+        "max_in_flight": stats["max_in_flight"],
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--scenario", choices=SCENARIOS, default="ask")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--unique", type=float, default=1.0, help="fraction of requests made unique (cache misses)")
+    parser.add_argument("--stream", action="store_true", help="use the SSE endpoints")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--warmup", type=float, default=1.0)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--app-port", type=int, default=9200)
+    parser.add_argument("--stub-port", type=int, default=9100)
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args(argv)
+
+    env = {**os.environ, "STUB_LATENCY": str(args.latency), "STUB_JITTER": str(args.jitter)}
+    stub_proc = start_server("bench.stub_openai:app", args.stub_port, env)
+    stub = f"http://127.0.0.1:{args.stub_port}"
+    report = []
+    print(f"{os.cpu_count()} CPUs, {args.scenario}, {args.concurrency} concurrent, {args.requests} requests\n")
+    print(f"{'workers':>7} {'req/s':>8} {'speedup':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7} "
+          f"{'up/req':>7} {'max in flight':>14}")
+    try:
+        for workers in args.workers:
+            row = measure(workers, stub, args)
+            row["speedup"] = round(row["rps"] / report[0]["rps"], 2) if report and report[0]["rps"] else 1.0
+            report.append(row)
+            print(f"{row['workers']:>7} {row['rps']:>8} {row['speedup']:>8} {row['p50_ms']:>8} {row['p95_ms']:>8} "
+                  f"{row['error_rate']:>7} {row['upstream_per_request']:>7} {row['max_in_flight']:>14}")
+    finally:
+        stub_proc.terminate()
+        stub_proc.wait()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""Lookup latency of the semantic ask cache as its index grows.
+
+Fills a SemanticCache with synthetic questions for each --sizes entry,
+then times get() for a mix of paraphrases of stored questions (hits) and
+unseen ones (misses). Nothing touches the network.
+
+    python -m bench.semantic
+    python -m bench.semantic --sizes 1000 10000 50000 --dim 2048 --queries 2000
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+from bench.load import percentile
+from semantic_cache import SemanticCache
+
+ASKED = ["what is {}", "explain {} pls", "how does {} work in python", "can you tell me about {}"]
+TOPICS = [
+    "list comprehension", "generator", "decorator", "context manager", "dict", "tuple", "set", "lambda",
+    "closure", "iterator", "dataclass", "metaclass", "exception", "f-string", "slice", "recursion",
+    "async function", "thread", "module", "package", "virtual environment", "type hint", "property",
+]
+
+
+def questions(count: int, rng: random.Random) -> list:
+    """Distinct topics: a known one plus two made-up words, e.g. "closure zorvak plimet"."""
+    syllables = ["ka", "zor", "vel", "pli", "met", "dru", "sna", "qui", "bor", "tep", "lum", "fex"]
+    seen, out = set(), []
+    while len(out) < count:
+        words = ["".join(rng.choices(syllables, k=3)) for _ in range(2)]
+        topic = f"{rng.choice(TOPICS)} {' '.join(words)}"
+        if topic not in seen:
+            seen.add(topic)
+            out.append(topic)
+    return out
+
+
+def measure(size: int, dim: int, queries: int, threshold: float, rng: random.Random) -> dict:
+    cache = SemanticCache(maxsize=size, threshold=threshold, dim=dim)
+    topics = questions(size + queries, rng)
+    start = time.perf_counter()
+    for topic in topics[:size]:
+        cache.set(ASKED[0].format(topic), topic)
+    store_us = (time.perf_counter() - start) / size * 1e6
+    times, hits, right = [], 0, 0
+    for i in range(queries):
+        # Even queries paraphrase a stored question, odd ones ask something new.
+        topic = rng.choice(topics[:size]) if i % 2 == 0 else topics[size + i]
+        question = rng.choice(ASKED[1:]).format(topic)
+        start = time.perf_counter()
+        reply = cache.get(question)
+        times.append((time.perf_counter() - start) * 1e6)
+        hits += reply is not None
+        right += (reply == topic) if i % 2 == 0 else (reply is None)
+    return {
+        "size": size,
+        "index_mb": round(cache.stats()["index_bytes"] / 2**20, 1),
+        "store_us": round(store_us, 1),
+        "lookup_p50_us": round(percentile(times, 50), 1),
+        "lookup_p95_us": round(percentile(times, 95), 1),
+        "hit_rate": round(hits / queries, 3),
+        "accuracy": round(right / queries, 3),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000, 20000])
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--threshold", type=float, default=0.85)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    report = []
+    print(f"{'size':>7} {'index MB':>9} {'store us':>9} {'p50 us':>8} {'p95 us':>8} {'hit rate':>9} {'accuracy':>9}")
+    for size in args.sizes:
+        row = measure(size, args.dim, args.queries, args.threshold, rng)
+        report.append(row)
+        print(f"{row['size']:>7} {row['index_mb']:>9} {row['store_us']:>9} {row['lookup_p50_us']:>8} "
+              f"{row['lookup_p95_us']:>8} {row['hit_rate']:>9} {row['accuracy']:>9}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""Startup and rerun cost of the Streamlit apps, plus cold import times.
+
+Every measurement runs in a fresh interpreter: a cold import of each of
+--modules, and the app loaded with Streamlit's AppTest, timing its first
+script run and --reruns further reruns. Nothing calls OpenAI; buttons are
+never clicked.
+
+    python -m bench.startup
+    python -m bench.startup --app streamlit_app.py --reruns 50 --repeat 5 --modules engine main
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from bench.load import percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_import(name: str) -> dict:
+    start = time.perf_counter()
+    __import__(name)
+    return {"import_ms": round((time.perf_counter() - start) * 1000, 1)}
+
+
+def measure_app(app: str, reruns: int) -> dict:
+    from streamlit.testing.v1 import AppTest
+
+    result = {}
+    app_test = AppTest.from_file(os.path.join(ROOT, app), default_timeout=60)
+    start = time.perf_counter()
+    app_test.run()
+    result["first_run_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    if app_test.exception:
+        raise RuntimeError(app_test.exception[0].message)
+    times = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        app_test.run()
+        times.append((time.perf_counter() - start) * 1000)
+    result["reruns_ms"] = times
+    return result
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app", default="streamlit_app.py")
+    parser.add_argument("--reruns", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=3, help="fresh interpreters to measure in")
+    parser.add_argument("--modules", nargs="*", default=["main"], help="modules to time a cold import of first")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--child-import", help=argparse.SUPPRESS)
+    parser.add_argument("--child-app", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child_import:
+        print(json.dumps(measure_import(args.child_import)))
+        return 0
+    if args.child_app:
+        print(json.dumps(measure_app(args.app, args.reruns)))
+        return 0
+
+    env = {**os.environ, "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "stub"), "PYTHONPATH": ROOT}
+
+    def child(*flags) -> dict:
+        out = subprocess.run([sys.executable, "-m", "bench.startup", *flags],
+                             cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+        return json.loads(out.stdout.strip().splitlines()[-1])
+
+    imports = {name: [] for name in args.modules}
+    runs = []
+    for _ in range(args.repeat):
+        for name in args.modules:
+            imports[name].append(child("--child-import", name)["import_ms"])
+        runs.append(child("--child-app", "--app", args.app, "--reruns", str(args.reruns)))
+
+    reruns = [t for run in runs for t in run["reruns_ms"]]
+    report = {
+        "app": args.app,
+        "imports_ms": {name: statistics.median(times) for name, times in imports.items()},
+        "first_run_ms": statistics.median(run["first_run_ms"] for run in runs),
+        "rerun_p50_ms": round(percentile(reruns, 50), 1),
+        "rerun_p95_ms": round(percentile(reruns, 95), 1),
+    }
+    for name, value in report["imports_ms"].items():
+        print(f"import {name:<20} {value:>8} ms")
+    print(f"{args.app} first run {report['first_run_ms']:>8} ms")
+    print(f"{args.app} rerun p50 {report['rerun_p50_ms']:>8} ms   p95 {report['rerun_p95_ms']} ms")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""Local stand-in for the OpenAI chat-completions endpoint.
+
+Run it with uvicorn and point the app at it with OPENAI_BASE_URL:
+
+    STUB_LATENCY=0.5 uvicorn bench.stub_openai:app --port 9100
+    OPENAI_BASE_URL=http://127.0.0.1:9100/v1 OPENAI_API_KEY=stub uvicorn main:app
+
+Behaviour is set with env vars:
+    STUB_LATENCY      seconds before a reply (or before the first chunk), default 0.3
+    STUB_JITTER       +/- uniform jitter added to the latency, default 0.1
+    STUB_ERROR_RATE   fraction of calls answered with HTTP 500, default 0
+    STUB_CHUNK_DELAY  seconds between streamed chunks, default 0.01
+    STUB_CHUNK_SIZE   characters per streamed chunk, default 8
+"""
+import asyncio
+import json
+import os
+import random
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+LATENCY = float(os.getenv("STUB_LATENCY", "0.3"))
+JITTER = float(os.getenv("STUB_JITTER", "0.1"))
+ERROR_RATE = float(os.getenv("STUB_ERROR_RATE", "0"))
+CHUNK_DELAY = float(os.getenv("STUB_CHUNK_DELAY", "0.01"))
+CHUNK_SIZE = int(os.getenv("STUB_CHUNK_SIZE", "8"))
+
+QUIZZES = [
+    {
+        "question": "What will the following code output?",
+        "code": "print(2 ** 3)",
+        "options": ["6", "8", "9", "Error"],
+        "answer": 1,
+        "hint": "Remember what ** means in Python.",
+        "score": 3,
+    },
+    {
+        "question": "What does len({'a': 1, 'b': 2}) return?",
+        "code": None,
+        "options": ["1", "2", "4", "TypeError"],
+        "answer": 1,
+        "hint": "Count the keys, genius.",
+        "score": 2,
+    },
+    {
+        "question": "Which of these creates an empty set?",
+        "code": None,
+        "options": ["{}", "set()", "[]", "()"],
+        "answer": 1,
+        "hint": "Curly braces alone are already taken.",
+        "score": 2,
+    },
+]
+TEXT = (
+    "Oh, you want to know that? Fine. It's simple enough that even you will get it: "
+    "Python does exactly what you told it, which is the problem. Here's a tiny example "
+    "and a short explanation, because I'm generous like that."
+)
+
+app = FastAPI(title="Stub OpenAI")
+# in_flight counts calls waiting out their latency, until they finish or their
+# client hangs up (a hedge the app cancelled); max_in_flight is its high-water mark.
+stats = {"calls": 0, "errors": 0, "streams": 0, "prompt_chars": 0, "in_flight": 0, "max_in_flight": 0,
+         "abandoned": 0}
+
+
+def _reply_text(prompt: str) -> str:
+    """Pick a plausible reply for whichever prompt the app sent."""
+    if "mapping each wrong answer" in prompt:
+        return json.dumps({"0": "Nope.", "2": "Try again.", "3": "Bold guess. Wrong."})
+    if "quiz" in prompt and "JSON" in prompt:
+        quiz = dict(random.choice(QUIZZES))
+        quiz["question"] += f" (#{random.randint(1, 10**6)})"
+        if '"roasts"' in prompt:
+            quiz["roasts"] = ["Nope." if i != quiz["answer"] else None for i in range(len(quiz["options"]))]
+        return json.dumps(quiz)
+    if '"corrected_code"' in prompt:
+        return json.dumps({"roast": TEXT, "corrected_code": "print('fixed')", "explanation": "It works now."})
+    return TEXT
+
+
+def _usage(prompt: str, text: str) -> dict:
+    prompt_tokens, completion_tokens = len(prompt) // 4, len(text) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    prompt = body["messages"][-1]["content"]
+    stats["calls"] += 1
+    stats["prompt_chars"] += len(prompt)
+    stats["in_flight"] += 1
+    stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+    try:
+        latency = asyncio.ensure_future(asyncio.sleep(max(0.0, LATENCY + random.uniform(-JITTER, JITTER))))
+        hangup = asyncio.ensure_future(request.receive())  # the body is read: only a disconnect is left
+        await asyncio.wait({latency, hangup}, return_when=asyncio.FIRST_COMPLETED)
+        hangup.cancel()
+        if not latency.done():
+            latency.cancel()
+            stats["abandoned"] += 1
+            return JSONResponse({}, status_code=499)
+    finally:
+        stats["in_flight"] -= 1
+
+    if random.random() < ERROR_RATE:
+        stats["errors"] += 1
+        return JSONResponse(
+            {"error": {"message": "stub failure", "type": "server_error", "code": None}},
+            status_code=500,
+        )
+
+    text = _reply_text(prompt)
+    base = {"id": f"stub-{stats['calls']}", "created": int(time.time()), "model": body["model"]}
+    if not body.get("stream"):
+        return {
+            **base,
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": _usage(prompt, text),
+        }
+
+    stats["streams"] += 1
+    include_usage = (body.get("stream_options") or {}).get("include_usage")
+
+    async def chunks():
+        for i in range(0, len(text), CHUNK_SIZE):
+            delta = {"content": text[i:i + CHUNK_SIZE]}
+            chunk = {**base, "object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+            yield f"data: {json.dumps(chunk)}\n\n"
+            await asyncio.sleep(CHUNK_DELAY)
+        last = {**base, "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        yield f"data: {json.dumps(last)}\n\n"
+        if include_usage:
+            usage = {**base, "object": "chat.completion.chunk", "choices": [], "usage": _usage(prompt, text)}
+            yield f"data: {json.dumps(usage)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(chunks(), media_type="text/event-stream")
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+@app.post("/reset")
+async def reset():
+    for key in stats:
+        stats[key] = 0
+    return stats
@@ -0,0 +1,185 @@
+import ast
+import builtins
+import random
+from typing import Optional
+
+BLOCK_KEYWORDS = (
+    "if", "elif", "else", "for", "while", "def", "class", "try", "except",
+    "finally", "with", "async", "match", "case",
+)
+MODULE_NAMES = {"__file__", "__builtins__", "__annotations__"}
+MAX_FIXES = 5
+
+ROASTS = {
+    "missing_colon": [
+        "Line {line} is begging for a colon. One character. You had one job.",
+        "Ah yes, the classic 'I'll just skip the colon on line {line}' strategy. Bold. Wrong, but bold.",
+        "Python saw line {line}, waited for a ':' and got ghosted. Rude.",
+    ],
+    "indentation": [
+        "Your indentation on line {line} looks like it was done by a cat walking across the keyboard.",
+        "Line {line} is standing in the wrong spot. In Python, whitespace is not a suggestion.",
+        "Indentation is literally Python's whole personality, and line {line} ignored it.",
+    ],
+}
+EXPLANATIONS = {
+    "missing_colon": "Statements that open a block (if, for, def, class, ...) must end with ':'. Line {line} was missing one.",
+    "indentation": "Python groups code by indentation, so every line in a block must line up. Line {line} was off ({msg}).",
+}
+
+
+def _classify(err: SyntaxError, lines: list) -> Optional[str]:
+    """Name the trivial error kinds we can fix and roast without the LLM."""
+    if isinstance(err, (IndentationError, TabError)):
+        return "indentation"
+    if err.msg == "expected ':'" and err.lineno and err.lineno <= len(lines):
+        line = lines[err.lineno - 1]
+        if "#" not in line and line.strip().split(" ")[0].rstrip(":") in BLOCK_KEYWORDS:
+            return "missing_colon"
+    return None
+
+
+def _indent(line: str) -> int:
+    return len(line) - len(line.lstrip(" "))
+
+
+def _fix(lines: list, kind: str, err: SyntaxError) -> Optional[list]:
+    """Apply one targeted fix for a classified error, or None if we can't."""
+    lines = list(lines)
+    if kind == "indentation" and any("\t" in line for line in lines):
+        return [line.expandtabs(4) for line in lines]
+    n = (err.lineno or 0) - 1
+    if not 0 <= n < len(lines):
+        return None
+    if kind == "missing_colon":
+        lines[n] = lines[n].rstrip() + ":"
+        return lines
+    previous = [line for line in lines[:n] if line.strip()]
+    prev_indent = _indent(previous[-1]) if previous else 0
+    body = lines[n].lstrip(" ")
+    if err.msg.startswith("expected an indented block"):
+        lines[n] = " " * (prev_indent + 4) + body
+    elif err.msg == "unexpected indent":
+        lines[n] = " " * prev_indent + body
+    elif err.msg.startswith("unindent does not match"):
+        levels = sorted({_indent(line) for line in previous if _indent(line) < _indent(lines[n])})
+        lines[n] = " " * (levels[-1] if levels else 0) + body
+    else:
+        return None
+    return lines
+
+
+def undefined_names(tree: ast.AST) -> list:
+    """Names that are read but never bound anywhere in the snippet.
+
+    Deliberately scope-blind, like a quick pyflakes pass: it catches typos and
+    missing imports without false alarms from closures.
+    """
+    bound = set(dir(builtins)) | MODULE_NAMES
+    loaded = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Load):
+                loaded.setdefault(node.id, node.lineno)
+            else:
+                bound.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            bound.add(node.name)
+        elif isinstance(node, ast.arg):
+            bound.add(node.arg)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                if alias.name == "*":
+                    return []
+                bound.add(alias.asname or alias.name.split(".")[0])
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            bound.update(node.names)
+        elif isinstance(node, (ast.MatchAs, ast.MatchStar)) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, ast.MatchMapping) and node.rest:
+            bound.add(node.rest)
+    return [f"{name} (line {line})" for name, line in loaded.items() if name not in bound]
+
+
+def analyze_code(code: str) -> dict:
+    """Run the parser, compile checks and a name check on a snippet.
+
+    Returns a dict with the first syntax error (if any), the error kinds that
+    were fixed locally, the fixed code, undefined names, and whether the
+    snippet is trivial enough to answer without the LLM.
+    """
+    result = {
+        "syntax_error": None,
+        "fixed_kinds": [],
+        "fixed_code": None,
+        "undefined_names": [],
+        "trivial": False,
+    }
+    lines = code.replace("\r\n", "\n").split("\n")
+    for _ in range(MAX_FIXES + 1):
+        source = "\n".join(lines)
+        try:
+            tree = ast.parse(source)
+            compile(tree, "<snippet>", "exec")
+            break
+        except SyntaxError as e:
+            if result["syntax_error"] is None:
+                result["syntax_error"] = {
+                    "type": type(e).__name__, "msg": e.msg, "line": e.lineno, "col": e.offset,
+                }
+            kind = _classify(e, lines)
+            fixed = _fix(lines, kind, e) if kind else None
+            if fixed is None:
+                return result
+            result["fixed_kinds"].append(kind)
+            lines = fixed
+    else:
+        return result
+
+    result["undefined_names"] = undefined_names(tree)
+    if result["fixed_kinds"]:
+        result["fixed_code"] = _pep8(source)
+        result["trivial"] = True
+    return result
+
+
+def _pep8(code: str) -> str:
+    """Tidy already-valid code with autopep8 when it is installed."""
+    try:
+        import autopep8
+    except ImportError:
+        return code
+    try:
+        return autopep8.fix_code(code)
+    except Exception:
+        return code
+
+
+def local_reply(analysis: dict) -> Optional[dict]:
+    """A templated roast for trivial errors, in the roast/corrected_code/explanation shape."""
+    if not analysis["trivial"]:
+        return None
+    err = analysis["syntax_error"]
+    kind = analysis["fixed_kinds"][0]
+    fields = {"line": err["line"], "msg": err["msg"]}
+    explanation = EXPLANATIONS[kind].format(**fields)
+    if analysis["undefined_names"]:
+        explanation += " Also, these names are never defined: " + ", ".join(analysis["undefined_names"]) + "."
+    return {
+        "roast": random.choice(ROASTS[kind]).format(**fields),
+        "corrected_code": analysis["fixed_code"],
+        "explanation": explanation,
+    }
+
+
+def diagnostic_summary(analysis: dict) -> str:
+    """One or two lines of local findings for the LLM prompt; empty if nothing was found."""
+    notes = []
+    err = analysis["syntax_error"]
+    if err:
+        notes.append(f"{err['type']} on line {err['line']}: {err['msg']}")
+    if analysis["undefined_names"]:
+        notes.append("Undefined names: " + ", ".join(analysis["undefined_names"]))
+    return "\n".join(notes)
@@ -0,0 +1,128 @@
+"""Review multi-function submissions one top-level function or class at a time.
+
+split_units() cuts a file into units with ast, each unit gets its own small
+review (run in parallel by the caller), and merge_reviews() stitches the
+results back into the roast/corrected_code/explanation shape of a normal
+code review. Since units are reviewed on their own, a unit's review can be
+cached by its source and reused when other parts of the file change.
+"""
+import ast
+from typing import NamedTuple, Optional
+
+from json_stream import Schema, parse_json
+
+# Every field is optional: whatever is missing comes from the unit itself.
+REVIEW_SCHEMA = Schema("review", required={}, optional={"roast": str, "corrected_code": str, "explanation": str})
+
+
+class Unit(NamedTuple):
+    name: str
+    kind: str  # "function", "class" or "module" (top-level statements)
+    source: str
+    start: int
+    end: int
+
+
+def split_units(code: str) -> Optional[list]:
+    """Top-level functions and classes as units, plus one unit per run of other top-level code.
+
+    Each run of statements between definitions stays its own unit, so that
+    merging in line order keeps code after the definitions it uses. Imports
+    are left out of the units (see imports()). Returns None when the code
+    does not parse.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+    lines = code.splitlines()
+    units, run = [], []
+
+    def close_run():
+        if run:
+            start, end = run[0][0], run[-1][1]
+            units.append(Unit(f"top-level code, line {start}", "module", "\n".join(lines[start - 1:end]), start, end))
+            run.clear()
+
+    for node in tree.body:
+        start = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+        source = "\n".join(lines[start - 1:node.end_lineno])
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            close_run()
+            units.append(Unit(node.name, "function", source, start, node.end_lineno))
+        elif isinstance(node, ast.ClassDef):
+            close_run()
+            units.append(Unit(node.name, "class", source, start, node.end_lineno))
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            close_run()
+        else:
+            run.append((start, node.end_lineno))
+    close_run()
+    return units
+
+
+def imports(code: str) -> str:
+    """The file's top-level import lines, given to every unit as context."""
+    tree = ast.parse(code)
+    lines = code.splitlines()
+    return "\n".join(
+        "\n".join(lines[node.lineno - 1:node.end_lineno])
+        for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))
+    )
+
+
+def unit_prompt(unit: Unit, context: str = "") -> str:
+    label = {"function": "function", "class": "class", "module": "top-level code"}[unit.kind]
+    if context:
+        context = f"""
+        The file imports (for context only, don't review these):
+        {context}
+        """
+    return f"""
+        You are Sassy Python, an overconfident AI tutor.
+        You are reviewing one {label} from a larger file{f" ({unit.name})" if unit.kind != "module" else ""}.
+        Roast it in one or two sarcastic sentences, give a corrected version that
+        keeps its name and signature, and a short explanation of what was wrong.
+        {context}
+        Code:
+        {unit.source}
+
+        Return ONLY a JSON object like:
+        {{
+          "roast": "...",
+          "corrected_code": "...the corrected {label} only...",
+          "explanation": "..."
+        }}
+        """
+
+
+def parse_review(raw: str, unit: Unit) -> dict:
+    """Read a unit review, falling back to the raw text and the original code."""
+    review = REVIEW_SCHEMA.check(parse_json(raw))
+    if review is None:
+        return {"roast": raw.strip(), "corrected_code": unit.source, "explanation": ""}
+    return {
+        "roast": review.get("roast") or "",
+        "corrected_code": review.get("corrected_code") or unit.source,
+        "explanation": review.get("explanation") or "",
+    }
+
+
+def merge_reviews(units: list, reviews: list, header: str = "") -> dict:
+    """Stitch per-unit reviews into one roast/corrected_code/explanation review.
+
+    Corrected units go back in the order of their original lines, after the imports.
+    """
+    roasts, fixed, explanations = [], [header] if header else [], []
+    for unit, review in sorted(zip(units, reviews), key=lambda pair: pair[0].start):
+        title = unit.name if unit.kind == "module" else f"`{unit.name}`"
+        if review["roast"]:
+            roasts.append(f"**{title}**: {review['roast']}")
+        if review["explanation"]:
+            explanations.append(f"**{title}**: {review['explanation']}")
+        fixed.append(review["corrected_code"].strip("\n"))
+    return {
+        "roast": "\n\n".join(roasts),
+        "corrected_code": "\n\n\n".join(fixed) + "\n",
+        "explanation": "\n\n".join(explanations),
+    }
@@ -0,0 +1,306 @@
+"""Prompts, reply parsing and blocking LLM calls shared by both frontends.
+
+main.py (the API) and streamlit_app.py (the standalone app) build the same
+prompts and read quiz/review JSON the same way through this module. Prompt
+templates and regexes are built once at import; the OpenAI SDK is only
+imported when the first client is made, so importing this module is cheap
+and a Streamlit rerun never pays for it.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from code_check import analyze_code, diagnostic_summary, local_reply
+from code_review import imports, merge_reviews, parse_review, split_units, unit_prompt
+from json_stream import JsonAssembler, Schema, parse_json
+from prompt_budget import compact_code, count_tokens, reply_tokens, truncate
+from routing import parse_budgets
+
+load_dotenv()
+
+MODEL_GENERAL = os.getenv("SASSY_MODEL_GENERAL", "gpt-3.5-turbo")
+MODEL_QUIZ = os.getenv("SASSY_MODEL_QUIZ", "gpt-4")
+# Cheaper, faster model for short ask questions and for hedged requests.
+MODEL_FAST = os.getenv("SASSY_MODEL_FAST", "gpt-3.5-turbo")
+TEMP_GENERAL = 0.8
+TEMP_QUIZ = 0.9
+UPSTREAM_TIMEOUT = float(os.getenv("SASSY_UPSTREAM_TIMEOUT", "60"))
+
+# Roasts for every wrong option, written when the quiz is generated:
+# "inline" (same completion), "batch" (one follow-up call, API only) or "off".
+QUIZ_ROASTS = os.getenv("SASSY_QUIZ_ROASTS", "off")
+QUIZ_MAX_TOKENS = 700 if QUIZ_ROASTS == "inline" else 300
+
+# Max prompt input per mode in tokens; longer questions are cut and big code
+# pastes compacted.
+INPUT_BUDGETS = parse_budgets(os.getenv("SASSY_INPUT_BUDGETS", "ask=400,code=1500"))
+# Code with several functions/classes is reviewed one unit at a time, this many at once.
+REVIEW_CONCURRENCY = int(os.getenv("SASSY_REVIEW_CONCURRENCY", "4"))
+
+QUIZ_FALLBACK = {
+    "question": "Oops, my sass broke the quiz format. Try again?",
+    "code": None,
+    "options": ["Python", "Monty", "Coffee", "I give up"],
+    "answer": 0,
+    "hint": "I need a reboot... or coffee.",
+    "score": 1
+}
+# A quiz reply that doesn't parse or fit QUIZ_SCHEMA is asked for again, up to
+# this many tries in all, before the fallback quiz is served.
+QUIZ_ATTEMPTS = int(os.getenv("SASSY_QUIZ_ATTEMPTS", "2"))
+
+QUIZ_SCHEMA = Schema(
+    "quiz",
+    required={"question": str, "options": [str], "answer": int, "hint": str, "score": int},
+    optional={"code": (str, None), "topic": str, "roasts": [(str, None)]},
+    rules={
+        "answer": lambda quiz: 0 <= quiz["answer"] < len(quiz["options"]),
+        # precomputed roasts must line up with options, else they are dropped
+        "roasts": lambda quiz: len(quiz["roasts"]) == len(quiz["options"]),
+    },
+)
+CODE_SCHEMA = Schema("code", required={"roast": str, "corrected_code": str, "explanation": str})
+
+# --- Prompt templates ---
+ASK_PROMPT = """
+        You are Sassy Python, an AI tutor with attitude.
+        Explain this Python concept in a sarcastic, confident tone.
+        Give a real, concise answer with an example if useful (max 150 words).
+
+        Question:
+        {content}
+        """
+
+CODE_NOTES = """
+        Local checks already found (mention these, don't contradict them):
+        {notes}
+        """
+
+# Code roast as plain text (the API streams it).
+CODE_PROMPT = """
+        You are Sassy Python, an overconfident AI tutor.
+        Roast this code first in a sarcastic tone, then give a short, clear explanation for a beginner.
+
+        Code:
+        {content}
+        {notes}"""
+
+# Code roast as JSON with a corrected version (the Streamlit app renders the parts).
+CODE_FIX_PROMPT = """
+        You are Sassy Python, an overconfident AI tutor.
+        Roast this code first in a sarcastic tone.
+        Then give a **corrected version of the code** that actually works, keeping it as close to the user's code as possible.
+        Finally, give a **short, clear explanation** for a beginner about what this code does.
+        AND include a **concise note on what exactly was wrong** in the original code (syntax, missing colons, indentation, etc.).
+
+        Code:
+        {content}
+        {notes}
+        Return a JSON object like:
+        {{
+          "roast": "...your sassy text...",
+          "corrected_code": "...fixed python code...",
+          "explanation": "...brief beginner-friendly explanation including what went wrong..."
+        }}
+        """
+
+QUIZ_PROMPT = """
+    You are Sassy Python, an AI that generates fun Python quiz questions.
+
+    Task:
+    - Generate a {level} Python multiple-choice question.
+    - If needed, include a short Python code snippet in a separate field.
+    - Keep questions clear and concise.
+    - Be mildly sarcastic but still educational.{roasts}
+
+    Return ONLY a JSON object like this:
+    {{
+      "question": "What will the following code output?",
+      "code": "print(2 ** 3)",   // Omit this field if not needed
+      "options": [
+        "6",
+        "8",
+        "9",
+        "Error"
+      ],
+      "answer": 1,{roasts_example}
+      "hint": "Remember what ** means in Python.",
+      "topic": "operators",
+      "score": 3
+    }}
+    """
+QUIZ_ROASTS_TASK = """
+    - Add "roasts": one short sarcastic roast (max 40 words) per option, in the
+      same order, explaining why that pick is wrong. Use null for the correct option."""
+QUIZ_ROASTS_EXAMPLE = """
+      "roasts": ["6? That's 2 * 3, not 2 ** 3.", null, "...", "..."],"""
+
+ROAST_PROMPT = """
+    You are Sassy Python, an AI tutor with attitude.
+    A user answered a quiz question incorrectly.
+    Roast their wrong answer with humor and sarcasm, then briefly explain the correct answer.
+
+    Question:
+    {question}
+
+    User's Answer:
+    {user_answer}
+
+    Correct Answer:
+    {correct_answer}
+
+    Keep it under 150 words.
+    """
+
+
+def ask_prompt(content: str) -> str:
+    return ASK_PROMPT.format(content=content)
+
+
+def code_prompt(content: str, notes: str = "", fix: bool = False) -> str:
+    """The code roast prompt; fix=True asks for JSON with corrected code."""
+    notes = CODE_NOTES.format(notes=notes) if notes else ""
+    return (CODE_FIX_PROMPT if fix else CODE_PROMPT).format(content=content, notes=notes)
+
+
+@lru_cache(maxsize=None)
+def quiz_prompt(difficulty: Optional[str] = None) -> str:
+    inline = QUIZ_ROASTS == "inline"
+    return QUIZ_PROMPT.format(
+        level=difficulty or "beginner or intermediate",
+        roasts=QUIZ_ROASTS_TASK if inline else "",
+        roasts_example=QUIZ_ROASTS_EXAMPLE if inline else "",
+    )
+
+
+def roast_prompt(question: str, user_answer: str, correct_answer: str) -> str:
+    return ROAST_PROMPT.format(question=question, user_answer=user_answer, correct_answer=correct_answer)
+
+
+# --- Reading replies ---
+# parse_json (json_stream.py) reads the first object in a reply in one pass,
+# skipping fences, comments and trailing commas.
+def fallback_quiz() -> dict:
+    """A fresh copy of QUIZ_FALLBACK, safe to hand out and modify."""
+    return dict(QUIZ_FALLBACK, options=list(QUIZ_FALLBACK["options"]))
+
+
+def check_quiz(raw_json: str) -> dict:
+    """Validate quiz JSON structure and return safe version if invalid."""
+    quiz = QUIZ_SCHEMA.check(parse_json(raw_json))
+    return quiz if quiz is not None else fallback_quiz()
+
+
+def parse_code_fix(raw: str, content: str) -> dict:
+    """Read a CODE_FIX_PROMPT reply, falling back to the raw text and the original code."""
+    reply = CODE_SCHEMA.check(parse_json(raw))
+    if reply is not None:
+        return reply
+    return {"roast": raw, "corrected_code": content, "explanation": "No explanation available."}
+
+
+# --- Blocking calls (streamlit_app.py) ---
+def make_client():
+    """A synchronous OpenAI client. The SDK is imported here, on first use."""
+    from openai import OpenAI
+
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=UPSTREAM_TIMEOUT)
+
+
+class Engine:
+    """Blocking LLM calls for a frontend that talks to OpenAI in-process.
+
+    `review_unit` may be swapped for a cached version of Engine.review_unit
+    (streamlit_app.py caches it by the unit's source).
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.review_unit = self._review_unit
+
+    def chat(self, model: str, prompt: str, temperature: float, max_tokens: int = 200) -> str:
+        """Query OpenAI API and return clean text."""
+        response = self.client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+        return response.choices[0].message.content.strip()
+
+    def chat_stream(self, model: str, prompt: str, temperature: float, max_tokens: int = 200):
+        """Query OpenAI API with stream=True and yield text as it arrives."""
+        stream = self.client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True
+        )
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            stream.close()
+
+    def ask_stream(self, question: str):
+        budget = int(INPUT_BUDGETS.get("ask", 0))
+        prompt = ask_prompt(truncate(question, budget) if budget else question)
+        return self.chat_stream(MODEL_GENERAL, prompt, TEMP_GENERAL)
+
+    def _review_unit(self, unit, context: str) -> dict:
+        """Review one top-level function/class."""
+        prompt = unit_prompt(unit, context)
+        max_tokens = reply_tokens(count_tokens(unit.source), base=200, per_input=1.2, ceiling=1200)
+        return parse_review(self.chat(MODEL_GENERAL, prompt, TEMP_GENERAL, max_tokens=max_tokens), unit)
+
+    def review(self, content: str) -> dict:
+        """Roast code as {"roast", "corrected_code", "explanation"}.
+
+        Trivial syntax errors are fixed and roasted locally, without an API
+        call; code with several functions/classes is reviewed per unit, in
+        parallel.
+        """
+        analysis = analyze_code(content)
+        local = local_reply(analysis)
+        if local:
+            return local
+        units = split_units(content)
+        if units and len(units) > 1:
+            context = imports(content)
+            with ThreadPoolExecutor(max_workers=REVIEW_CONCURRENCY) as pool:
+                reviews = list(pool.map(lambda unit: self.review_unit(unit, context), units))
+            return merge_reviews(units, reviews, context)
+        error = analysis["syntax_error"]
+        budget = int(INPUT_BUDGETS.get("code", 0))
+        code = compact_code(content, budget, error["line"] if error else None) if budget else content
+        prompt = code_prompt(code, diagnostic_summary(analysis), fix=True)
+        # The reply repeats the code, so it needs room to grow with it.
+        max_tokens = reply_tokens(count_tokens(code), base=400, per_input=1.2, ceiling=2000)
+        return parse_code_fix(self.chat(MODEL_GENERAL, prompt, TEMP_GENERAL, max_tokens=max_tokens), content)
+
+    def quiz(self, difficulty: Optional[str] = None, attempts: int = QUIZ_ATTEMPTS) -> dict:
+        """Stream a quiz and hang up as soon as its JSON object closes."""
+        assembler = JsonAssembler()
+        deltas = self.chat_stream(MODEL_QUIZ, quiz_prompt(difficulty), TEMP_QUIZ, max_tokens=QUIZ_MAX_TOKENS)
+        for text in deltas:
+            if assembler.feed(text):
+                break
+        deltas.close()
+        quiz = QUIZ_SCHEMA.check(assembler.partial())
+        if quiz is None and attempts > 1:
+            QUIZ_SCHEMA.regenerated()
+            return self.quiz(difficulty, attempts - 1)
+        return quiz if quiz is not None else fallback_quiz()
+
+    def roast_stream(self, question: str, user_answer: str, correct_answer: str):
+        """Roast a wrong answer; answers that look like code get a code review instead."""
+        if any(c in user_answer for c in ["=", "print", "def", ":", "()", "[]", "{}"]):
+            reply = self.review(user_answer)
+            yield f"{reply['roast']}\n\nExplanation: {reply['explanation']}\n\nCorrected Code:\n{reply['corrected_code']}"
+        else:
+            yield from self.chat_stream(MODEL_GENERAL, roast_prompt(question, user_answer, correct_answer), TEMP_GENERAL)
@@ -0,0 +1,23 @@
+"""Signed feature hashing, shared by the quiz bank and the semantic ask cache.
+
+Features (strings) are hashed into `dim` buckets with crc32: the low bits
+pick the bucket and one high bit the sign, so collisions tend to cancel out
+instead of piling up.
+"""
+import zlib
+
+import numpy as np
+
+
+def hash_features(features: list, dim: int, weights=None):
+    """(buckets, values): the sorted distinct buckets hit and the signed weights summed into each.
+
+    Every feature weighs 1 unless `weights` gives one per feature.
+    """
+    hashes = np.array([zlib.crc32(f.encode()) for f in features], dtype=np.uint32)
+    signed = np.ones(len(features), dtype=np.float32) if weights is None else np.array(weights, dtype=np.float32)
+    signed *= np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+    buckets, inverse = np.unique(hashes % dim, return_inverse=True)
+    values = np.zeros(len(buckets), dtype=np.float32)
+    np.add.at(values, inverse, signed)
+    return buckets.astype(np.int64), values
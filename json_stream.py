@@ -0,0 +1,257 @@
+"""Reading JSON out of model replies, whole or as it streams in.
+
+Models wrap their JSON in prose and code fences, copy the `//` comments
+from the prompt's example and leave trailing commas. JsonAssembler reads
+the first object in one pass (brace-balanced, string-aware), dropping
+comments and trailing commas as it goes, and can hand back what has
+arrived so far when the reply is cut off. Schema checks the parsed object
+against a reply shape compiled once at import.
+"""
+import json
+import re
+
+_STRUCTURE = re.compile(r'[{}\[\]",/]')
+_STRING_STOP = re.compile(r'["\\]')
+_CLOSERS = {"{": "}", "[": "]"}
+_DECODER = json.JSONDecoder()
+
+
+class JsonAssembler:
+    """Collect streamed model output and spot when the first JSON object is complete.
+
+    Braces inside JSON strings are ignored, so a quiz whose code snippet
+    contains "{" or "}" does not confuse the depth count. Once the object
+    closes, further chunks are ignored and the caller can stop the stream.
+    """
+
+    def __init__(self):
+        self.buffer = []  # raw chunks, up to the end of the object
+        self.out = []  # the object so far, without comments
+        self.stack = []  # open containers
+        self.start = None
+        self.end = None
+        self.size = 0
+        self.in_string = False
+        self.escaped = False
+        self.comment = None  # "line" or "block"
+        self.slash = False  # a "/" that may start a comment
+        self.star = False  # a "*" that may end a block comment
+        self.safe = (0, "")  # (len(out), closers): the last point the object can be cut and closed
+
+    @property
+    def complete(self) -> bool:
+        return self.end is not None
+
+    def feed(self, chunk: str) -> bool:
+        """Add a chunk of streamed text. Returns True once the object has closed."""
+        if self.complete:
+            return True
+        used = self._scan(chunk)
+        if used is not None:
+            chunk = chunk[:used]
+            self.end = self.size + used
+        self.buffer.append(chunk)
+        self.size += len(chunk)
+        return self.complete
+
+    def _scan(self, chunk: str):
+        """Advance over chunk; returns how much of it was used if the object closed in it."""
+        out = self.out
+        i, n = 0, len(chunk)
+        while i < n:
+            if self.comment == "line":
+                j = chunk.find("\n", i)
+                if j < 0:
+                    return None
+                self.comment, i = None, j + 1
+                continue
+            if self.comment == "block":
+                if self.star and chunk[i] == "/":
+                    self.comment, self.star, i = None, False, i + 1
+                    continue
+                j = chunk.find("*/", i)
+                if j < 0:
+                    self.star = chunk.endswith("*")
+                    return None
+                self.comment, self.star, i = None, False, j + 2
+                continue
+            if self.in_string:
+                if self.escaped:
+                    out.append(chunk[i])
+                    self.escaped, i = False, i + 1
+                    continue
+                match = _STRING_STOP.search(chunk, i)
+                if match is None:
+                    out.append(chunk[i:])
+                    return None
+                j = match.start()
+                out.append(chunk[i:j + 1])
+                if chunk[j] == "\\":
+                    self.escaped = True
+                else:
+                    self.in_string = False
+                i = j + 1
+                continue
+            if self.slash:
+                self.slash = False
+                if chunk[i] in "/*":
+                    self.comment, i = ("line" if chunk[i] == "/" else "block"), i + 1
+                    continue
+                out.append("/")
+            if self.start is None:
+                j = chunk.find("{", i)
+                if j < 0:
+                    return None
+                self.start, i = self.size + j, j
+            match = _STRUCTURE.search(chunk, i)
+            if match is None:
+                out.append(chunk[i:])
+                return None
+            j = match.start()
+            if j > i:
+                out.append(chunk[i:j])
+            ch, i = chunk[j], j + 1
+            if ch == "/":
+                self.slash = True
+            elif ch == '"':
+                out.append(ch)
+                self.in_string = True
+            elif ch in "{[":
+                self.stack.append(ch)
+                out.append(ch)
+                self._mark()
+            elif ch in "}]":
+                self._drop_trailing_comma()
+                self.stack.pop()
+                out.append(ch)
+                if not self.stack:
+                    return i
+                self._mark()
+            else:  # ","
+                self._mark()
+                out.append(ch)
+        return None
+
+    def _mark(self):
+        self.safe = (len(self.out), "".join(_CLOSERS[c] for c in reversed(self.stack)))
+
+    def _drop_trailing_comma(self):
+        out = self.out
+        while out and not out[-1].strip():
+            out.pop()
+        if out:
+            last = out[-1].rstrip()
+            out[-1] = last[:-1] if last.endswith(",") else last
+
+    def text(self) -> str:
+        """The JSON object if it closed, otherwise everything received so far."""
+        if self.complete:
+            return "".join(self.out)
+        return "".join(self.buffer)
+
+    def partial(self):
+        """What has arrived so far, parsed: open containers are closed, and a
+        half-written field is dropped, including one whose string or number
+        was cut off mid-value. None if nothing is readable."""
+        if self.start is None:
+            return None
+        body = "".join(self.out)
+        cut, safe_closers = self.safe
+        candidates = ["".join(self.out[:cut]) + safe_closers]
+        if self.complete:
+            candidates = [body]
+        elif not self.in_string and (body.rstrip()[-1:] in ('"', "]", "}") or body[-1:].isspace()):
+            # The last value ended (a closing quote or bracket, or whitespace after
+            # a number): keep it. Anything else may still be growing, e.g. "12" -> "123".
+            closers = "".join(_CLOSERS[c] for c in reversed(self.stack))
+            candidates.insert(0, body + closers)
+        for candidate in candidates:
+            try:
+                return json.loads(candidate)
+            except ValueError:
+                continue
+        return None
+
+
+def _decode(text: str):
+    """Fast path for a clean reply: the object decoded in C from the first "{", or None."""
+    start = text.find("{")
+    if start < 0:
+        return None
+    try:
+        value, _ = _DECODER.raw_decode(text, start)
+    except ValueError:
+        return None
+    return value if isinstance(value, dict) else None
+
+
+def parse_json(text: str):
+    """The first JSON object in text, salvaging a cut-off one; None if unreadable."""
+    decoded = _decode(text)
+    if decoded is not None:
+        return decoded
+    assembler = JsonAssembler()
+    assembler.feed(text)
+    return assembler.partial()
+
+
+def _compile(spec):
+    """A predicate for one field: a type, a tuple of types (None allowed) or [item spec]."""
+    if isinstance(spec, list):
+        item = _compile(spec[0])
+        return lambda value: isinstance(value, list) and all(map(item, value))
+    types = tuple(type(None) if t is None else t for t in (spec if isinstance(spec, tuple) else (spec,)))
+    if int in types and bool not in types:
+        return lambda value: isinstance(value, types) and not isinstance(value, bool)
+    return lambda value: isinstance(value, types)
+
+
+class Schema:
+    """The shape of a JSON reply, compiled once into per-field checks.
+
+    A reply missing a required field or holding one of the wrong type is
+    rejected; a bad optional field is dropped (a repair). `rules` are extra
+    checks on the whole object, keyed by the field they blame.
+    """
+
+    def __init__(self, name: str, required: dict, optional: dict = None, rules: dict = None):
+        self.name = name
+        self.required = [(key, _compile(spec)) for key, spec in required.items()]
+        self.optional = [(key, _compile(spec)) for key, spec in (optional or {}).items()]
+        self.rules = rules or {}
+        required_keys = set(required)
+        self.required_rules = [(key, rule) for key, rule in self.rules.items() if key in required_keys]
+        self.optional_rules = [(key, rule) for key, rule in self.rules.items() if key not in required_keys]
+        self.counters = {"ok": 0, "repaired": 0, "failed": 0, "regenerated": 0}
+
+    def matches(self, value) -> bool:
+        """Whether value has every required field right (nothing is counted)."""
+        return (
+            isinstance(value, dict)
+            and all(key in value and check(value[key]) for key, check in self.required)
+            and all(rule(value) for _, rule in self.required_rules)
+        )
+
+    def check(self, value):
+        """value with bad optional fields dropped, or None if it doesn't fit."""
+        if not self.matches(value):
+            self.counters["failed"] += 1
+            return None
+        bad = [key for key, check in self.optional if key in value and not check(value[key])]
+        bad += [key for key, rule in self.optional_rules if key in value and key not in bad and not rule(value)]
+        if bad:
+            value = {key: field for key, field in value.items() if key not in bad}
+        self.counters["repaired" if bad else "ok"] += 1
+        return value
+
+    def regenerated(self):
+        """Count a reply thrown away and asked for again because it didn't fit."""
+        self.counters["regenerated"] += 1
+
+    def stats(self) -> dict:
+        checked = self.counters["ok"] + self.counters["repaired"] + self.counters["failed"]
+        return {
+            **self.counters,
+            "failure_rate": round(self.counters["failed"] / checked, 3) if checked else None,
+            "regeneration_rate": round(self.counters["regenerated"] / checked, 3) if checked else None,
+        }
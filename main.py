@@ -1,181 +1,1228 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import aclosing, asynccontextmanager
+from contextvars import ContextVar
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
-from dotenv import load_dotenv
-from openai import OpenAI
+from typing import List, Optional
+from openai import AsyncOpenAI
+from cachetools import TTLCache
+import asyncio
+import httpx
+import openai
 import os
 import json
+import logging
+import random
 import re
+import threading
+import time
+
+from batch_jobs import LocalBatchBackend, OpenAIBatchBackend, load_meta, output_text, request_line, save_meta
+from code_check import analyze_code, diagnostic_summary, local_reply
+from code_review import REVIEW_SCHEMA, Unit, imports, merge_reviews, parse_review, split_units, unit_prompt
+from engine import (
+    INPUT_BUDGETS, MODEL_FAST, MODEL_GENERAL, MODEL_QUIZ, QUIZ_ATTEMPTS, QUIZ_FALLBACK, QUIZ_MAX_TOKENS,
+    QUIZ_ROASTS, QUIZ_SCHEMA, REVIEW_CONCURRENCY, TEMP_GENERAL, TEMP_QUIZ, UPSTREAM_TIMEOUT, ask_prompt,
+    check_quiz, code_prompt, fallback_quiz, quiz_prompt, roast_prompt,
+)
+from json_stream import JsonAssembler
+from json_stream import parse_json as _parse_json
+from metrics import TOKEN_BUCKETS, Registry
+from prefetch import Prefetcher
+from profiler import sample_stacks
+from prompt_budget import compact_code, count_tokens, reply_tokens, truncate
+from quiz_bank import QuizBank
+from quiz_pool import QuizPool
+from resilience import CircuitBreaker, CircuitOpenError, Resilient
+from response_cache import ResponseCache
+from semantic_cache import SemanticCache
+from routing import Router, parse_budgets
+from sessions import SessionStore
+from shared_state import open_state
+from single_flight import SingleFlight
 
 # --- Config ---
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Models, temperatures, quiz roasts and input budgets are shared with
+# streamlit_app.py and read in engine.py.
+
+# SASSY_STATE_DB puts what workers must agree on in one SQLite file (serve.py sets
+# it when started with several workers): the upstream slots and rate budget become
+# global, the quiz pool one shared stock, and the reply cache's SQLite tier defaults
+# to the same file. Unset, each worker keeps its own in memory.
+STATE_DB = os.getenv("SASSY_STATE_DB") or None
+shared_state = open_state(STATE_DB)
+
+# Max upstream LLM calls in flight (per worker, or in total with SASSY_STATE_DB);
+# extra requests wait their turn. SASSY_UPSTREAM_RPM caps how many start per minute (0: no cap).
+UPSTREAM_CONCURRENCY = int(os.getenv("SASSY_UPSTREAM_CONCURRENCY", "100"))
+UPSTREAM_RPM = float(os.getenv("SASSY_UPSTREAM_RPM", "0"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("SASSY_HTTP_MAX_CONNECTIONS", "200"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("SASSY_HTTP_MAX_KEEPALIVE", "50"))
+
+# One pooled client per worker, shared by every request. Retries happen in
+# `resilient` below, so the SDK's own retries are off.
+client = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    timeout=UPSTREAM_TIMEOUT,
+    max_retries=0,
+    http_client=httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        ),
+        timeout=UPSTREAM_TIMEOUT,
+    ),
+)
+upstream_slots = shared_state.slots("upstream", UPSTREAM_CONCURRENCY)
+upstream_budget = shared_state.rate("upstream", UPSTREAM_RPM)
+
+@asynccontextmanager
+async def upstream_slot():
+    """Wait for the rate budget, then hold an upstream slot for one call."""
+    await upstream_budget.take()
+    async with upstream_slots.hold():
+        yield
+
+# Transient upstream errors are retried with jittered backoff (or the server's
+# Retry-After); after SASSY_BREAKER_THRESHOLD failures in a row every call fails
+# fast for SASSY_BREAKER_RESET seconds and requests get a local fallback reply.
+resilient = Resilient(
+    CircuitBreaker(
+        threshold=int(os.getenv("SASSY_BREAKER_THRESHOLD", "5")),
+        reset_after=float(os.getenv("SASSY_BREAKER_RESET", "30")),
+    ),
+    attempts=int(os.getenv("SASSY_RETRY_ATTEMPTS", "3")),
+    max_wait=float(os.getenv("SASSY_RETRY_MAX_WAIT", "4")),
+)
+# Errors that mean "upstream is unavailable" rather than a bug on our side.
+UPSTREAM_ERRORS = (openai.APIError, CircuitOpenError, asyncio.TimeoutError)
+
+# Latency budget per mode ("mode=seconds,..."). A call still running after its model's
+# recent p<SASSY_HEDGE_PERCENTILE> latency (capped by the budget) is hedged to
+# SASSY_HEDGE_MODEL, and nothing runs past budget * SASSY_DEADLINE_FACTOR.
+router = Router(
+    parse_budgets(os.getenv("SASSY_LATENCY_BUDGETS", "ask=4,code=6,quiz=10,roast=4")),
+    hedge_model=os.getenv("SASSY_HEDGE_MODEL", MODEL_FAST) or None,
+    hedge_percentile=float(os.getenv("SASSY_HEDGE_PERCENTILE", "90")),
+    deadline_factor=float(os.getenv("SASSY_DEADLINE_FACTOR", "3")),
+    fast_model=MODEL_FAST,
+    short_ask_chars=int(os.getenv("SASSY_SHORT_ASK_CHARS", "120")),
+)
+
+# Pre-generated quizzes, one bucket per difficulty. Size 0 turns the pool off.
+QUIZ_DIFFICULTIES = [d.strip() for d in os.getenv("SASSY_QUIZ_DIFFICULTIES", "beginner,intermediate").split(",") if d.strip()]
+QUIZ_POOL_SIZE = int(os.getenv("SASSY_QUIZ_POOL_SIZE", "10"))
+QUIZ_POOL_LOW_WATER = int(os.getenv("SASSY_QUIZ_POOL_LOW_WATER", "3"))
+QUIZ_POOL_CONCURRENCY = int(os.getenv("SASSY_QUIZ_POOL_CONCURRENCY", "2"))
+
+# Every generated quiz is kept in SASSY_QUIZ_BANK (SQLite, "" turns it off), minus
+# near-duplicates. Requests with a session_id are served unseen bank quizzes first.
+QUIZ_BANK = os.getenv("SASSY_QUIZ_BANK", "quiz_bank.db")
+quiz_bank = QuizBank(QUIZ_BANK, threshold=float(os.getenv("SASSY_QUIZ_DUP_THRESHOLD", "0.75"))) if QUIZ_BANK else None
+# While a session answers a quiz its next one is fetched and held SASSY_PREFETCH_TTL
+# seconds (0 turns prefetching off), for at most SASSY_PREFETCH_SESSIONS sessions at once.
+PREFETCH_TTL = float(os.getenv("SASSY_PREFETCH_TTL", "120"))
+PREFETCH_SESSIONS = int(os.getenv("SASSY_PREFETCH_SESSIONS", "1000"))
+# Quiz sessions (open question, score, streaks, quizzes seen) live server-side in
+# SASSY_SESSION_DB (SQLite, shareable by workers; ":memory:" keeps them in-process).
+sessions = SessionStore(os.getenv("SASSY_SESSION_DB", "sessions.db"))
+# (question, wrong answer) -> roast, so /roast can answer precomputed roasts without a call.
+precomputed_roasts = TTLCache(maxsize=int(os.getenv("SASSY_ROAST_LOOKUP_SIZE", "4096")), ttl=86400)
+
+# Reply cache for ask/code. SASSY_CACHE_DB (default: SASSY_STATE_DB) adds a SQLite
+# tier shared across workers.
+response_cache = ResponseCache(
+    maxsize=int(os.getenv("SASSY_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("SASSY_CACHE_TTL", "3600")),
+    path=os.getenv("SASSY_CACHE_DB") or STATE_DB,
+    disk_maxsize=int(os.getenv("SASSY_CACHE_DB_SIZE", "10000")),
+    disk_ttl=float(os.getenv("SASSY_CACHE_DB_TTL", "86400")),
+)
+# Behind it for ask: a reply to a paraphrase of the question, above SASSY_SEMANTIC_THRESHOLD
+# cosine similarity of local TF-IDF vectors. SASSY_SEMANTIC_SIZE=0 turns it off.
+semantic_cache = SemanticCache(
+    maxsize=int(os.getenv("SASSY_SEMANTIC_SIZE", "2000")),
+    threshold=float(os.getenv("SASSY_SEMANTIC_THRESHOLD", "0.85")),
+    ttl=float(os.getenv("SASSY_SEMANTIC_TTL", "3600")),
+)
+
+# Code replies get 200 tokens plus a quarter of the (compacted) code's size,
+# up to SASSY_CODE_MAX_TOKENS.
+CODE_MAX_TOKENS = int(os.getenv("SASSY_CODE_MAX_TOKENS", "600"))
+
+# Identical ask/code/roast requests already in flight share one upstream call.
+single_flight = SingleFlight()
+
+# POST /batch fans items out with this much parallelism (per batch, under UPSTREAM_CONCURRENCY).
+BATCH_CONCURRENCY = int(os.getenv("SASSY_BATCH_CONCURRENCY", "8"))
+BATCH_MAX_ITEMS = int(os.getenv("SASSY_BATCH_MAX_ITEMS", "100"))
+# Offline batches go to the OpenAI Batch API, or with "local" are worked off from SASSY_BATCH_DIR.
+BATCH_BACKEND = os.getenv("SASSY_BATCH_BACKEND", "openai")
+BATCH_DIR = os.getenv("SASSY_BATCH_DIR", ".batches")
+
+async def _complete(body: dict) -> dict:
+    async def once():
+        async with upstream_slot():
+            return (await client.chat.completions.create(**body)).model_dump()
+    return await resilient.call(once)
+
+if BATCH_BACKEND == "local":
+    batch_backend = LocalBatchBackend(BATCH_DIR, _complete, concurrency=BATCH_CONCURRENCY)
+else:
+    batch_backend = OpenAIBatchBackend(client)
+
+# --- Metrics ---
+# SASSY_REQUEST_LOG=1 logs one JSON line per request; SASSY_PROFILER=1 enables /debug/profile.
+REQUEST_LOG = os.getenv("SASSY_REQUEST_LOG") == "1"
+PROFILER = os.getenv("SASSY_PROFILER") == "1"
+
+registry = Registry()
+REQUEST_SECONDS = registry.histogram(
+    "sassy_request_duration_seconds", "Time until response headers, per route.", ["route", "mode", "status"])
+UPSTREAM_SECONDS = registry.histogram(
+    "sassy_upstream_latency_seconds", "OpenAI call latency.", ["model", "mode", "outcome"])
+QUEUE_SECONDS = registry.histogram(
+    "sassy_upstream_queue_wait_seconds", "Wait for a free upstream slot.", ["mode"])
+TOKENS = registry.histogram(
+    "sassy_tokens", "Tokens per OpenAI call.", ["model", "mode", "kind"], buckets=TOKEN_BUCKETS)
+PARSE_SECONDS = registry.histogram(
+    "sassy_parse_seconds", "Time spent parsing model output.", ["step"])
+QUIZ_VALIDATIONS = registry.counter(
+    "sassy_quiz_validations_total", "validate_quiz_json results; result=fallback means the quiz was unusable.", ["result"])
+CACHE_EVENTS = registry.counter("sassy_cache_events_total", "Response cache outcomes.", ["outcome"])
+SEMANTIC_EVENTS = registry.counter(
+    "sassy_semantic_cache_events_total", "Semantic ask cache hits, misses, stores and evictions.", ["event"])
+SEMANTIC_SIZE = registry.gauge("sassy_semantic_cache_entries", "Questions in the semantic ask cache.")
+POOL_EVENTS = registry.counter("sassy_quiz_pool_events_total", "Quiz pool hits, misses and refills.", ["event"])
+BANK_EVENTS = registry.counter("sassy_quiz_bank_events_total", "Quiz bank stores, duplicates and serves.", ["event"])
+BANK_SIZE = registry.gauge("sassy_quiz_bank_size", "Quizzes stored in the bank.")
+PARSE_RESULTS = registry.counter(
+    "sassy_parse_results_total", "Model JSON replies checked against their schema: ok, repaired, failed, regenerated.",
+    ["schema", "result"])
+PREFETCH_EVENTS = registry.counter(
+    "sassy_quiz_prefetch_total", "Next-quiz prefetches started, taken (hit/joined), missed, wasted, failed and stale.", ["event"])
+PREFETCH_HELD = registry.gauge("sassy_quiz_prefetch_held", "Prefetched quizzes waiting to be taken.")
+SESSION_TOTALS = registry.counter(
+    "sassy_quiz_session_events_total", "Quiz sessions created and answers scored (all workers).", ["event"])
+POOL_STOCK = registry.gauge("sassy_quiz_pool_stock", "Ready quizzes per difficulty.", ["difficulty"])
+SINGLE_FLIGHT = registry.counter("sassy_single_flight_total", "Upstream calls made vs. saved by coalescing.", ["result"])
+UPSTREAM_RESILIENCE = registry.counter(
+    "sassy_upstream_resilience_total", "Retries, failed calls and calls short-circuited by the breaker.", ["event"])
+BREAKER_OPEN = registry.gauge("sassy_upstream_breaker_open", "1 while the upstream circuit breaker is open.")
+FALLBACKS = registry.counter("sassy_fallbacks_total", "Replies served locally because upstream failed.", ["mode"])
+ROUTE_DECISIONS = registry.counter(
+    "sassy_route_decisions_total", "Router outcomes: primary, hedged, primary_won, hedge_won, timeout, short_ask.",
+    ["mode", "decision"])
+WS_CONNECTIONS = registry.gauge("sassy_ws_connections", "Open /ws quiz connections.")
+WS_MESSAGES = registry.counter("sassy_ws_messages_total", "Messages received on /ws, by type.", ["type"])
+ROUTE_LATENCY = registry.gauge(
+    "sassy_route_latency_seconds", "Rolling upstream latency the router decides on.", ["model", "mode", "quantile"])
+STATE_EVENTS = registry.counter(
+    "sassy_shared_state_events_total", "Waits for an upstream slot or the rate budget, and expired slots/leases.",
+    ["event"])
+UPSTREAM_IN_USE = registry.gauge(
+    "sassy_upstream_slots_in_use", "Upstream calls in flight (across workers with SASSY_STATE_DB).")
+
+@registry.on_collect
+def _collect_component_stats():
+    for outcome, value in response_cache.counters.items():
+        CACHE_EVENTS.set_total(value, outcome=outcome)
+    for event, value in semantic_cache.counters.items():
+        SEMANTIC_EVENTS.set_total(value, event=event)
+    SEMANTIC_SIZE.set(semantic_cache.size)
+    for event, value in quiz_pool.counters.items():
+        POOL_EVENTS.set_total(value, event=event)
+    if quiz_bank is not None:
+        for event, value in quiz_bank.counters.items():
+            BANK_EVENTS.set_total(value, event=event)
+        BANK_SIZE.set(quiz_bank.size)
+    for event, value in quiz_prefetch.counters.items():
+        PREFETCH_EVENTS.set_total(value, event=event)
+    for schema in (QUIZ_SCHEMA, REVIEW_SCHEMA):
+        for result, value in schema.counters.items():
+            PARSE_RESULTS.set_total(value, schema=schema.name, result=result)
+    PREFETCH_HELD.set(quiz_prefetch.held)
+    for event, value in sessions.totals().items():
+        SESSION_TOTALS.set_total(value, event=event)
+    for difficulty, stock in quiz_pool.buckets.items():
+        POOL_STOCK.set(len(stock), difficulty=difficulty)
+    for result, value in single_flight.counters.items():
+        SINGLE_FLIGHT.set_total(value, result=result)
+    for event, value in {**resilient.counters, **resilient.breaker.counters}.items():
+        UPSTREAM_RESILIENCE.set_total(value, event=event)
+    BREAKER_OPEN.set(int(resilient.breaker.state == "open"))
+    for event, value in shared_state.counters.items():
+        STATE_EVENTS.set_total(value, event=event)
+    UPSTREAM_IN_USE.set(upstream_slots.in_use)
+    for (mode, decision), value in router.decisions.items():
+        ROUTE_DECISIONS.set_total(value, mode=mode, decision=decision)
+    for (model, mode), window in router.windows.items():
+        for quantile in (50, 95):
+            value = window.percentile(quantile)
+            if value is not None:
+                ROUTE_LATENCY.set(value, model=model, mode=mode, quantile=f"0.{quantile}")
+        hedge_after = router.hedge_delay(mode, model)
+        if hedge_after is not None:
+            ROUTE_LATENCY.set(hedge_after, model=model, mode=mode, quantile="hedge_after")
 
-MODEL_GENERAL = "gpt-3.5-turbo"
-MODEL_QUIZ = "gpt-4"
-TEMP_GENERAL = 0.8
-TEMP_QUIZ = 0.9
+# Per-request fields collected along the hot path, for metrics labels and request logs.
+request_info: ContextVar[Optional[dict]] = ContextVar("request_info", default=None)
+request_log = logging.getLogger("sassy.requests")
+if REQUEST_LOG:
+    request_log.addHandler(logging.StreamHandler())
+    request_log.setLevel(logging.INFO)
+    request_log.propagate = False
+
+def _note(**fields):
+    """Attach fields to the current request's log line."""
+    info = request_info.get()
+    if info is not None:
+        info.update(fields)
 
 # --- FastAPI App ---
-app = FastAPI(title="Sassy Python")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    quiz_pool.start()
+    yield
+    quiz_prefetch.stop()
+    await quiz_pool.stop()
+    if isinstance(batch_backend, LocalBatchBackend):
+        await batch_backend.stop()
+    await client.close()
+    response_cache.close()
+    if quiz_bank is not None:
+        quiz_bank.close()
+    sessions.close()
+    shared_state.close()
+
+app = FastAPI(title="Sassy Python", lifespan=lifespan)
+
+@app.middleware("http")
+async def instrument(request: Request, call_next):
+    info = {"route": request.url.path}
+    token = request_info.set(info)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        request_info.reset(token)
+        # The matched route's template ("/session/{session_id}"); unmatched paths share one label.
+        matched = request.scope.get("route")
+        route = getattr(matched, "path", "other")
+        REQUEST_SECONDS.observe(elapsed, route=route, mode=info.get("mode", ""), status=status)
+        if REQUEST_LOG:
+            request_log.info(json.dumps({**info, "status": status, "duration_ms": round(elapsed * 1000, 1)}))
 
 # --- Request Models ---
 class ChatRequest(BaseModel):
-    mode: str  # "ask", "code", or "quiz"
+    mode: str  # "ask", "code", "review" (per-function code review) or "quiz"
     content: Optional[str] = None
+    difficulty: Optional[str] = None  # quiz only, e.g. "beginner" or "intermediate"
+    session_id: Optional[str] = None  # quiz only: becomes the session's open question, no repeats
+    no_cache: bool = False  # skip the response cache lookup for this request
+
+class BatchRequest(BaseModel):
+    items: List[ChatRequest]
+    concurrency: Optional[int] = None
 
 class RoastRequest(BaseModel):
-    question: str
-    user_answer: str
-    correct_answer: str
+    # Either a session and the chosen option (graded against the session's open question)...
+    session_id: Optional[str] = None
+    option: Optional[int] = None
+    # ...or the question and both answers spelled out.
+    question: Optional[str] = None
+    user_answer: Optional[str] = None
+    correct_answer: Optional[str] = None
+
+class SessionRequest(BaseModel):
+    name: Optional[str] = None
 
 # --- Helpers ---
-def extract_json(text: str) -> str:
-    """Extract the first JSON object from text."""
-    match = re.search(r"\{.*\}", text, re.DOTALL)
-    return match.group(0) if match else text
+# Canned sass for when upstream is down; roasts still name the right answer.
+SASS_FALLBACKS = {
+    "ask": [
+        "My brain (the expensive cloud part) is out to lunch. Try again in a minute, or ask the docs: docs.python.org.",
+        "I'm too busy being rate-limited to explain that right now. Come back shortly.",
+    ],
+    "code": [
+        "I'd roast this code, but my roasting servers are down. Run it and let the traceback roast you instead.",
+        "Can't review right now. Tip while you wait: read the last line of the traceback first.",
+    ],
+    "roast": [
+        "Wrong. It's \"{correct_answer}\". I'd roast you properly, but even my sarcasm needs a working API.",
+        "Nope, the answer is \"{correct_answer}\". Consider yourself roasted at a discount.",
+    ],
+}
+
+def _fallback(mode: str, error: Exception, **fields):
+    """Local reply for a mode when upstream failed: a pooled or static quiz, else canned sass."""
+    FALLBACKS.inc(mode=mode)
+    _note(fallback=type(error).__name__)
+    if mode == "quiz":
+        banked = quiz_bank.next(None, set()) if quiz_bank else None
+        return _pooled() or banked or fallback_quiz()
+    return random.choice(SASS_FALLBACKS[mode]).format(**fields)
+
+def parse_json(text: str):
+    """The first JSON object in text, or None."""
+    with PARSE_SECONDS.time(step="parse_json"):
+        return _parse_json(text)
 
 def validate_quiz_json(raw_json: str):
     """Validate quiz JSON structure and return safe version if invalid."""
-    fallback = {
-        "question": "Oops, my sass broke the quiz format. Try again?",
-        "code": None,
-        "options": ["Python", "Monty", "Coffee", "I give up"],
-        "answer": 0,
-        "hint": "I need a reboot... or coffee.",
-        "score": 1
-    }
-    try:
-        raw_json = extract_json(raw_json)
-        quiz = json.loads(raw_json)
-
-        required_keys = ["question", "options", "answer", "hint", "score"]
-        if not all(key in quiz for key in required_keys):
-            return fallback
+    with PARSE_SECONDS.time(step="validate_quiz_json"):
+        quiz = check_quiz(raw_json)
+    fallback = quiz == QUIZ_FALLBACK
+    QUIZ_VALIDATIONS.inc(result="fallback" if fallback else "ok")
+    if fallback:
+        _note(quiz_fallback=True)
+    return quiz
 
-        if not isinstance(quiz["options"], list) or not all(isinstance(opt, str) for opt in quiz["options"]):
-            return fallback
-        if not isinstance(quiz["answer"], int):
-            return fallback
-        if not isinstance(quiz["score"], int):
-            return fallback
+def _observe_upstream(model: str, mode: str, queued: float, started: float, outcome: str, usage=None):
+    """Record latency, queue wait and token usage for one OpenAI call."""
+    elapsed = time.perf_counter() - started
+    QUEUE_SECONDS.observe(started - queued, mode=mode)
+    if outcome == "ok":
+        router.observe(model, mode, elapsed)
+    UPSTREAM_SECONDS.observe(elapsed, model=model, mode=mode, outcome=outcome)
+    fields = {"model": model, "upstream_ms": round(elapsed * 1000, 1), "queue_ms": round((started - queued) * 1000, 1)}
+    if usage is not None:
+        TOKENS.observe(usage.prompt_tokens, model=model, mode=mode, kind="prompt")
+        TOKENS.observe(usage.completion_tokens, model=model, mode=mode, kind="completion")
+        fields.update(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+    _note(**fields)
 
-        # Optional: ensure 'code' is None or str
-        if "code" in quiz and not (quiz["code"] is None or isinstance(quiz["code"], str)):
-            quiz["code"] = None
+async def _chat(model: str, prompt: str, temperature: float, max_tokens: int = 200, mode: str = "other",
+                valid=None) -> str:
+    """Query OpenAI through the router, which may hedge a slow call to the fast model."""
+    return await router.run(
+        mode, model,
+        lambda m, on_slot: resilient.call(lambda: _chat_once(m, prompt, temperature, max_tokens, mode, on_slot)),
+        valid)
 
-        return quiz
-    except Exception:
-        return fallback
-
-def _chat(model: str, prompt: str, temperature: float, max_tokens: int = 200) -> str:
-    """Query OpenAI API and return clean text."""
-    response = client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=temperature,
-        max_tokens=max_tokens
-    )
+async def _chat_once(model: str, prompt: str, temperature: float, max_tokens: int, mode: str, on_slot=None) -> str:
+    """Query OpenAI API and return clean text; on_slot() is called once an upstream slot is held."""
+    queued = time.perf_counter()
+    async with upstream_slot():
+        if on_slot is not None:
+            on_slot()
+        started = time.perf_counter()
+        try:
+            response = await client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+        except asyncio.CancelledError:
+            # Lost a hedge race; kept out of the router's window.
+            _observe_upstream(model, mode, queued, started, "cancelled")
+            raise
+        except Exception:
+            _observe_upstream(model, mode, queued, started, "error")
+            raise
+    _observe_upstream(model, mode, queued, started, "ok", response.usage)
     return response.choices[0].message.content.strip()
 
+async def _chat_stream(model: str, prompt: str, temperature: float, max_tokens: int = 200, mode: str = "other"):
+    """Query OpenAI API with stream=True and yield text as it arrives."""
+    queued = time.perf_counter()
+    async with upstream_slot():
+        started = time.perf_counter()
+        outcome, usage = "error", None
+        try:
+            # No retries once a stream is open: text may already be on the wire.
+            stream = await resilient.attempt(lambda: client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                stream_options={"include_usage": True}
+            ))
+            try:
+                async for chunk in stream:
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+                outcome = "ok"
+            finally:
+                await stream.close()
+        except GeneratorExit:
+            # The consumer hung up early on purpose (e.g. the quiz JSON closed).
+            outcome = "ok"
+            raise
+        finally:
+            _observe_upstream(model, mode, queued, started, outcome, usage)
+
+def _caching(mode: str) -> bool:
+    return response_cache.enabled or (mode == "ask" and semantic_cache.enabled)
+
+def _cache_get(mode: str, content: str, model: str, key: str) -> Optional[str]:
+    """An exact cache hit, else for ask the reply to a paraphrase of the question."""
+    cached = response_cache.get(key) if response_cache.enabled else None
+    if cached is None and mode == "ask" and semantic_cache.enabled:
+        cached = semantic_cache.get(content, model)
+        if cached is not None:
+            _note(cache="semantic")
+            return cached
+    _note(cache="miss" if cached is None else "hit")
+    return cached
+
+def _cache_set(mode: str, content: str, model: str, key: str, reply: str):
+    if response_cache.enabled:
+        response_cache.set(key, reply)
+    if mode == "ask" and semantic_cache.enabled:
+        semantic_cache.set(content, reply, model)
+
+async def _cached_chat(mode: str, content: str, model: str, prompt: str, temperature: float, use_cache: bool = True) -> str:
+    """Serve a reply from the response cache, calling _chat only on a miss.
+
+    Misses for the same key that overlap in time share a single _chat call.
+    """
+    key = response_cache.key(mode, content, model, temperature)
+    if not _caching(mode):
+        return await single_flight.do(key, lambda: _chat(model, prompt, temperature, _max_tokens(mode, prompt), mode))
+    if use_cache:
+        cached = _cache_get(mode, content, model, key)
+        if cached is not None:
+            return cached
+    else:
+        response_cache.bypass()
+        _note(cache="bypass")
+
+    async def fetch():
+        reply = await _chat(model, prompt, temperature, _max_tokens(mode, prompt), mode)
+        _cache_set(mode, content, model, key, reply)
+        return reply
+
+    return await single_flight.do(key, fetch)
+
+async def _cached_chat_stream(mode: str, content: str, model: str, prompt: str, temperature: float, use_cache: bool = True):
+    """Streaming twin of _cached_chat: replay a cached reply or stream and then store it."""
+    key = response_cache.key(mode, content, model, temperature) if _caching(mode) else None
+    if key and use_cache:
+        cached = _cache_get(mode, content, model, key)
+        if cached is not None:
+            yield cached
+            return
+    elif key:
+        response_cache.bypass()
+        _note(cache="bypass")
+    parts = []
+    async with aclosing(_chat_stream(model, prompt, temperature, _max_tokens(mode, prompt), mode)) as deltas:
+        async for text in deltas:
+            parts.append(text)
+            yield text
+    if key:
+        _cache_set(mode, content, model, key, "".join(parts).strip())
+
 # --- Core Functions ---
-def sassy_reply(mode: str, content: str):
-    """Generate a sassy AI reply depending on mode."""
-    if mode in ["ask", "code"] and not content:
-        return "You forgot to give me something to sass about."
+def _prepare(mode: str, content: str):
+    """Return (prompt, None), or (None, reply) when code mode can answer locally.
+
+    Code goes through the local checks first: trivial syntax errors get a
+    templated roast with zero API calls, anything else found is summarized
+    for the LLM. Input over the mode's token budget is cut down first.
+    """
+    budget = int(INPUT_BUDGETS.get(mode, 0))
+    if mode != "code":
+        return ask_prompt(truncate(content, budget) if budget else content), None
+    analysis = analyze_code(content)
+    local = local_reply(analysis)
+    if local:
+        reply = f"{local['roast']}\n\n{local['explanation']}\n\n```python\n{local['corrected_code']}```"
+        return None, reply
+    if budget:
+        error = analysis["syntax_error"]
+        code = compact_code(content, budget, error["line"] if error else None)
+        if code != content:
+            _note(compacted_from=count_tokens(content))
+        content = code
+    return code_prompt(content, diagnostic_summary(analysis)), None
 
-    if mode == "ask":
-        prompt = f"""
-        You are Sassy Python, an AI tutor with attitude.
-        Explain this Python concept in a sarcastic, confident tone.
-        Give a real, concise answer with an example if useful (max 150 words).
+def _max_tokens(mode: str, prompt: str) -> int:
+    """Reply budget: code reviews grow with the code, everything else gets 200."""
+    if mode == "code":
+        return reply_tokens(count_tokens(prompt), base=200, per_input=0.25, ceiling=max(200, CODE_MAX_TOKENS))
+    if mode == "review":
+        # Unit reviews repeat the unit's corrected code.
+        return reply_tokens(count_tokens(prompt), base=200, per_input=1.2, ceiling=max(400, 2 * CODE_MAX_TOKENS))
+    return 200
 
-        Question:
-        {content}
-        """
-        return _chat(MODEL_GENERAL, prompt, TEMP_GENERAL)
+async def sassy_reply(mode: str, content: str, difficulty: Optional[str] = None, use_cache: bool = True,
+                      session_id: Optional[str] = None):
+    """Generate a sassy AI reply depending on mode."""
+    if mode in ["ask", "code", "review"] and not content:
+        return "You forgot to give me something to sass about."
 
-    elif mode == "code":
-        prompt = f"""
-        You are Sassy Python, an overconfident AI tutor.
-        Roast this code first in a sarcastic tone, then give a short, clear explanation for a beginner.
+    if mode in ["ask", "code"]:
+        prompt, local = _prepare(mode, content)
+        if local:
+            return local
+        model = router.model_for(mode, MODEL_GENERAL, content)
+        try:
+            return await _cached_chat(mode, content, model, prompt, TEMP_GENERAL, use_cache)
+        except UPSTREAM_ERRORS as e:
+            return _fallback(mode, e)
 
-        Code:
-        {content}
-        """
-        return _chat(MODEL_GENERAL, prompt, TEMP_GENERAL)
+    elif mode == "review":
+        return await review_code(content, use_cache)
 
     elif mode == "quiz":
-        prompt = """
-        You are Sassy Python, an AI that generates fun Python quiz questions.
-
-        Task:
-        - Generate a beginner or intermediate Python multiple-choice question.
-        - If needed, include a short Python code snippet in a separate field.
-        - Keep questions clear and concise.
-        - Be mildly sarcastic but still educational.
-
-        Return ONLY a JSON object like this:
-        {
-          "question": "What will the following code output?",
-          "code": "print(2 ** 3)",   // Omit this field if not needed
-          "options": [
-            "6",
-            "8",
-            "9",
-            "Error"
-          ],
-          "answer": 1,
-          "hint": "Remember what ** means in Python.",
-          "score": 3
-        }
-        """
-        response = client.chat.completions.create(
-            model=MODEL_QUIZ,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=TEMP_QUIZ,
-            max_tokens=300
-        )
-
-        raw = response.choices[0].message.content.strip()
-        return validate_quiz_json(raw)
+        # A session's quiz is graded server-side, so its answer and roasts stay there.
+        quiz = await next_quiz(difficulty, session_id)
+        return _public_quiz(quiz) if session_id else quiz
 
     else:
         return "Invalid mode."
 
-def generate_roast(question: str, user_answer: str, correct_answer: str) -> str:
-    """Generate a roast for a wrong quiz answer."""
+async def review_code(content: str, use_cache: bool = True) -> dict:
+    """Review code one top-level function/class at a time, in parallel.
+
+    Returns the {"roast", "corrected_code", "explanation"} shape. Unit replies
+    are cached by the unit's source, so after an edit only changed units go
+    upstream again.
+    """
+    analysis = analyze_code(content)
+    local = local_reply(analysis)
+    if local:
+        return local
+    units = split_units(content)
+    header = imports(content) if units else ""
+    if not units:
+        # Does not parse: review it whole.
+        units = [Unit("your code", "module", content, 1, content.count("\n") + 1)]
+    limit = asyncio.Semaphore(REVIEW_CONCURRENCY)
+
+    async def review(unit: Unit) -> dict:
+        async with limit:
+            prompt = unit_prompt(unit, header)
+            try:
+                raw = await _cached_chat("review", unit.source, MODEL_GENERAL, prompt, TEMP_GENERAL, use_cache)
+            except UPSTREAM_ERRORS as e:
+                return {"roast": _fallback("code", e), "corrected_code": unit.source, "explanation": ""}
+            return parse_review(raw, unit)
+
+    _note(review_units=len(units))
+    reviews = await asyncio.gather(*(review(unit) for unit in units))
+    return merge_reviews(units, reviews, header)
+
+async def _batch_roasts(quiz: dict) -> Optional[list]:
+    """Write a roast for every wrong option of a quiz in one follow-up call."""
+    correct = quiz["answer"]
+    wrong = "\n".join(f"{i}: {opt}" for i, opt in enumerate(quiz["options"]) if i != correct)
     prompt = f"""
     You are Sassy Python, an AI tutor with attitude.
-    A user answered a quiz question incorrectly.
-    Roast their wrong answer with humor and sarcasm, then briefly explain the correct answer.
+    For each wrong answer below, write a short sarcastic roast (max 40 words)
+    that also explains why it is wrong.
 
     Question:
-    {question}
-
-    User's Answer:
-    {user_answer}
+    {quiz["question"]}
+    {quiz.get("code") or ""}
 
     Correct Answer:
-    {correct_answer}
+    {quiz["options"][correct]}
+
+    Wrong Answers:
+    {wrong}
+
+    Return ONLY a JSON object mapping each wrong answer number to its roast, like {{"0": "..."}}.
+    """
+    try:
+        by_index = parse_json(await _chat(MODEL_GENERAL, prompt, TEMP_GENERAL, max_tokens=400, mode="quiz_roasts"))
+    except Exception:
+        return None
+    if not isinstance(by_index, dict):
+        return None
+    roasts = [by_index.get(str(i)) if i != correct else None for i in range(len(quiz["options"]))]
+    return [r if isinstance(r, str) else None for r in roasts]
+
+async def _with_roasts(quiz: dict) -> dict:
+    """Attach precomputed roasts if configured and register them for /roast lookups."""
+    if quiz == QUIZ_FALLBACK or not 0 <= quiz["answer"] < len(quiz["options"]):
+        return quiz
+    if QUIZ_ROASTS == "batch" and "roasts" not in quiz:
+        roasts = await _batch_roasts(quiz)
+        if roasts:
+            quiz["roasts"] = roasts
+    _remember_roasts(quiz)
+    return quiz
+
+def _remember_roasts(quiz: dict):
+    for option, roast_text in zip(quiz["options"], quiz.get("roasts") or []):
+        if roast_text:
+            precomputed_roasts[(quiz["question"], option)] = roast_text
+
+def _bank(quiz: dict, difficulty: Optional[str]) -> dict:
+    """Store a fresh quiz in the bank and tag it with its bank id."""
+    if quiz_bank is not None and quiz != QUIZ_FALLBACK:
+        quiz["id"] = quiz_bank.add(quiz, difficulty or "mixed")
+    return quiz
+
+def _regenerate(quiz: dict, attempts: int) -> bool:
+    """Whether an unusable quiz reply should be asked for again."""
+    if quiz != QUIZ_FALLBACK or attempts <= 1:
+        return False
+    QUIZ_SCHEMA.regenerated()
+    _note(quiz_regenerated=True)
+    return True
+
+async def generate_quiz(difficulty: Optional[str] = None, attempts: int = QUIZ_ATTEMPTS) -> dict:
+    """Ask the quiz model for a fresh question and validate it."""
+    raw = await _chat(MODEL_QUIZ, quiz_prompt(difficulty), TEMP_QUIZ, max_tokens=QUIZ_MAX_TOKENS, mode="quiz",
+                      valid=lambda text: QUIZ_SCHEMA.matches(parse_json(text)))
+    quiz = validate_quiz_json(raw)
+    if _regenerate(quiz, attempts):
+        return await generate_quiz(difficulty, attempts - 1)
+    return _bank(await _with_roasts(quiz), difficulty)
+
+async def generate_quiz_stream(difficulty: Optional[str] = None, attempts: int = QUIZ_ATTEMPTS) -> dict:
+    """Stream a fresh quiz, hanging up as soon as its JSON object closes."""
+    assembler = JsonAssembler()
+    deltas = _chat_stream(MODEL_QUIZ, quiz_prompt(difficulty), TEMP_QUIZ, max_tokens=QUIZ_MAX_TOKENS, mode="quiz")
+    async with aclosing(deltas):
+        async for text in deltas:
+            if assembler.feed(text):
+                break
+    # A reply cut off by max_tokens still yields the fields that did arrive.
+    quiz = validate_quiz_json(assembler.text())
+    if _regenerate(quiz, attempts):
+        return await generate_quiz_stream(difficulty, attempts - 1)
+    return _bank(await _with_roasts(quiz), difficulty)
+
+async def next_quiz(difficulty: Optional[str] = None, session_id: Optional[str] = None, stream: bool = False) -> dict:
+    """Serve a quiz. A session gets its prefetched quiz if there is one.
+
+    With a session the quiz also becomes the session's open question and
+    the one after it starts prefetching.
+    """
+    if not session_id:
+        return await _pick_quiz(difficulty, None, stream)
+    sessions.ensure(session_id)
+    # Seen is checked again on take: sessions are shared by workers, prefetches are not.
+    quiz = None
+    if PREFETCH_TTL > 0:
+        quiz = await quiz_prefetch.take(session_id, difficulty, lambda q: q.get("id") not in sessions.seen(session_id))
+    if quiz is not None:
+        _remember_roasts(quiz)
+        _note(quiz_source="prefetch")
+    else:
+        quiz = await _pick_quiz(difficulty, session_id, stream)
+    _open_question(session_id, quiz)
+    if PREFETCH_TTL > 0:
+        quiz_prefetch.start(session_id, difficulty)
+    return quiz
+
+async def _pick_quiz(difficulty: Optional[str], session_id: Optional[str], stream: bool) -> dict:
+    """An unseen bank quiz for a session, else the pool, else a fresh one.
 
-    Keep it under 150 words.
+    A fresh quiz that turns out to duplicate one the session has already
+    seen is regenerated once.
     """
-    return _chat(MODEL_GENERAL, prompt, 0.85)
+    seen = None
+    if session_id and quiz_bank is not None:
+        seen = sessions.seen(session_id)
+        quiz = quiz_bank.next(difficulty, seen)
+        if quiz:
+            _remember_roasts(quiz)
+            _note(quiz_source="bank")
+            return quiz
+    for _ in range(2):
+        quiz = _pooled(difficulty)
+        if quiz is None:
+            try:
+                quiz = await (generate_quiz_stream if stream else generate_quiz)(difficulty)
+            except UPSTREAM_ERRORS as e:
+                quiz = _fallback("quiz", e)
+                break
+        if seen is None or quiz.get("id") not in seen:
+            break
+    return quiz
+
+def _open_question(session_id: str, quiz: dict):
+    """Make quiz the session's open question; the static fallback quiz is practice and scores nothing."""
+    if quiz == QUIZ_FALLBACK:
+        sessions.set_quiz(session_id, None)
+        return
+    if "id" in quiz:
+        sessions.mark_seen(session_id, quiz["id"])
+    sessions.set_quiz(session_id, quiz)
+
+async def _prefetch_quiz(difficulty: Optional[str], session_id: str):
+    """A session's next quiz, picked ahead of time; nothing (rather than a fallback) if upstream fails."""
+    seen = sessions.seen(session_id)
+    quiz = quiz_bank.next(difficulty, seen) if quiz_bank is not None else None
+    if quiz is None:
+        quiz = _pooled(difficulty) or await generate_quiz(difficulty)
+    return None if quiz == QUIZ_FALLBACK or quiz.get("id") in seen else quiz
+
+def _public_quiz(quiz: Optional[dict]):
+    """A quiz as shown to the player: without the answer or the roasts that give it away."""
+    if quiz is None:
+        return None
+    return {k: v for k, v in quiz.items() if k not in ("answer", "roasts")}
+
+def _grade(req: RoastRequest):
+    """Score a session's answer; returns the outcome or raises the HTTP error to send."""
+    if req.option is None:
+        raise HTTPException(status_code=422, detail="option is required with session_id.")
+    try:
+        result = sessions.answer(req.session_id, req.option)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown session.")
+    except IndexError:
+        raise HTTPException(status_code=422, detail="No such option.")
+    if result is None:
+        raise HTTPException(status_code=409, detail="No open question; ask for a quiz first.")
+    _note(correct=result["correct"])
+    return result
+
+def _graded(result: dict, roast_text: Optional[str]) -> dict:
+    return {
+        "correct": result["correct"],
+        "points": result["points"],
+        "correct_answer": result["correct_answer"],
+        "hint": result["quiz"].get("hint"),
+        "roast": roast_text,
+        "stats": result["stats"],
+    }
+
+def _session_roast(result: dict, option: int):
+    """(the roast request for a graded session answer, the roast stored with its question or None).
+
+    The stored roast travels with the session's quiz, so it is found after a
+    restart or on another worker, where precomputed_roasts is empty.
+    """
+    req = RoastRequest(question=result["quiz"]["question"], user_answer=result["user_answer"],
+                       correct_answer=result["correct_answer"])
+    roasts = result["quiz"].get("roasts") or []
+    stored = roasts[option] if option < len(roasts) else None
+    return req, stored if isinstance(stored, str) and stored else None
+
+def _require_answers(req: RoastRequest):
+    if req.question is None or req.user_answer is None or req.correct_answer is None:
+        raise HTTPException(status_code=422, detail="Send session_id and option, or question, user_answer and correct_answer.")
+
+async def _pool_quiz(difficulty: str):
+    """Generate a quiz for the pool, dropping fallbacks so they are never stocked."""
+    quiz = await generate_quiz(difficulty)
+    return None if quiz == QUIZ_FALLBACK else quiz
+
+quiz_pool = QuizPool(
+    _pool_quiz,
+    QUIZ_DIFFICULTIES,
+    size=QUIZ_POOL_SIZE,
+    low_water=QUIZ_POOL_LOW_WATER,
+    concurrency=QUIZ_POOL_CONCURRENCY,
+    queue=lambda bucket: shared_state.queue(f"quiz_pool:{bucket}"),
+    lease=lambda bucket: shared_state.lease(f"quiz_pool:{bucket}", ttl=120),
+)
+
+def _pooled(difficulty: Optional[str] = None) -> Optional[dict]:
+    """A quiz from the pool; its roasts are registered here too, as another worker may have made it."""
+    quiz = quiz_pool.get(difficulty)
+    if quiz is not None:
+        _remember_roasts(quiz)
+    return quiz
+
+quiz_prefetch = Prefetcher(_prefetch_quiz, ttl=PREFETCH_TTL, max_sessions=PREFETCH_SESSIONS)
+
+async def generate_roast(question: str, user_answer: str, correct_answer: str) -> str:
+    """Generate a roast for a wrong quiz answer."""
+    precomputed = precomputed_roasts.get((question, user_answer))
+    if precomputed:
+        return precomputed
+    prompt = roast_prompt(question, user_answer, correct_answer)
+    key = response_cache.key("roast", prompt, MODEL_GENERAL, 0.85)
+    try:
+        return await single_flight.do(key, lambda: _chat(MODEL_GENERAL, prompt, 0.85, mode="roast"))
+    except UPSTREAM_ERRORS as e:
+        return _fallback("roast", e, correct_answer=correct_answer)
+
+def _sse(event: str, data) -> str:
+    """Format one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _chat_events(req: ChatRequest):
+    """SSE events for /chat/stream: text deltas, then a done event with the full reply."""
+    content = req.content or ""
+    try:
+        if req.mode in ["ask", "code"] and content:
+            prompt, reply = _prepare(req.mode, content)
+            if reply:
+                yield _sse("delta", {"text": reply})
+            else:
+                parts = []
+                model = router.model_for(req.mode, MODEL_GENERAL, content)
+                deltas = _cached_chat_stream(req.mode, content, model, prompt, TEMP_GENERAL, not req.no_cache)
+                try:
+                    async with aclosing(deltas):
+                        async for text in deltas:
+                            parts.append(text)
+                            yield _sse("delta", {"text": text})
+                except UPSTREAM_ERRORS as e:
+                    if parts:
+                        raise
+                    parts = [_fallback(req.mode, e)]
+                    yield _sse("delta", {"text": parts[0]})
+                reply = "".join(parts).strip()
+        elif req.mode == "quiz":
+            reply = await next_quiz(req.difficulty, req.session_id, stream=True)
+            if req.session_id:
+                reply = _public_quiz(reply)
+        else:
+            reply = await sassy_reply(req.mode, content)
+        yield _sse("done", {"mode": req.mode, "reply": reply})
+    except Exception as e:
+        yield _sse("error", {"detail": str(e)})
+
+async def _roast_deltas(req: RoastRequest, stored: Optional[str] = None):
+    """Roast text as it arrives: a precomputed roast, the streamed reply, or a fallback."""
+    precomputed = stored or precomputed_roasts.get((req.question, req.user_answer))
+    if precomputed:
+        yield precomputed
+        return
+    streamed = False
+    prompt = roast_prompt(req.question, req.user_answer, req.correct_answer)
+    try:
+        async with aclosing(_chat_stream(MODEL_GENERAL, prompt, 0.85, mode="roast")) as deltas:
+            async for text in deltas:
+                streamed = True
+                yield text
+    except UPSTREAM_ERRORS as e:
+        if streamed:
+            raise
+        yield _fallback("roast", e, correct_answer=req.correct_answer)
+
+async def _roast_events(req: RoastRequest, graded: Optional[dict] = None, stored: Optional[str] = None):
+    """SSE events for /roast/stream; `graded` (a session answer) is added to the done event."""
+    graded = graded or {}
+    if graded.get("correct"):
+        yield _sse("done", {**graded, "roast": None})
+        return
+    parts = []
+    try:
+        async with aclosing(_roast_deltas(req, stored)) as deltas:
+            async for text in deltas:
+                parts.append(text)
+                yield _sse("delta", {"text": text})
+        yield _sse("done", {**graded, "roast": "".join(parts).strip()})
+    except Exception as e:
+        yield _sse("error", {"detail": str(e)})
 
 # --- API Routes ---
 @app.post("/chat")
 async def chat(req: ChatRequest):
+    _note(mode=req.mode)
     try:
-        reply = sassy_reply(req.mode, req.content or "")
+        reply = await sassy_reply(req.mode, req.content or "", req.difficulty, not req.no_cache, req.session_id)
         return {"mode": req.mode, "reply": reply}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/roast")
 async def roast(req: RoastRequest):
+    """Roast a wrong answer. With session_id and option the answer is graded and scored first."""
+    result = stored = None
+    if req.session_id is not None:
+        result = _grade(req)
+        if result["correct"]:
+            return _graded(result, None)
+        req, stored = _session_roast(result, req.option)
+    else:
+        _require_answers(req)
+    try:
+        roast_text = stored or await generate_roast(req.question, req.user_answer, req.correct_answer)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return _graded(result, roast_text) if result else {"roast": roast_text}
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest):
+    _note(mode=req.mode)
+    return StreamingResponse(_chat_events(req), media_type="text/event-stream")
+
+@app.post("/roast/stream")
+async def roast_stream(req: RoastRequest):
+    graded = stored = None
+    if req.session_id is not None:
+        result = _grade(req)
+        graded = _graded(result, None)
+        req, stored = _session_roast(result, req.option)
+    else:
+        _require_answers(req)
+    return StreamingResponse(_roast_events(req, graded, stored), media_type="text/event-stream")
+
+@app.websocket("/ws")
+async def quiz_socket(websocket: WebSocket):
+    """A whole quiz session over one connection (message types are listed in the README).
+
+    Answers are graded like /roast with a session; the next question is
+    fetched as soon as an answer arrives and pushed while the roast is
+    still streaming.
+    """
+    await websocket.accept()
+    WS_CONNECTIONS.inc()
+    send_lock = asyncio.Lock()
+    quiz_lock = asyncio.Lock()  # one push at a time: the last quiz sent is the open question
+    tasks = set()
+    state = {"session_id": None, "difficulty": None}
+
+    async def send(message: dict):
+        async with send_lock:
+            await websocket.send_json(message)
+
+    async def reporting(coro):
+        """Run a message's work; whatever it raises goes to the client as an error message."""
+        try:
+            await coro
+        except WebSocketDisconnect:
+            pass
+        except Exception as e:
+            try:
+                await send({"type": "error", "status": 500, "detail": str(e)})
+            except (WebSocketDisconnect, RuntimeError):
+                pass  # the socket is gone too
+
+    def spawn(coro):
+        task = asyncio.create_task(reporting(coro))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    def start(message: dict) -> dict:
+        session_id = message.get("session_id") or sessions.create(message.get("name"))
+        sessions.ensure(session_id, message.get("name"))
+        state.update(session_id=session_id, difficulty=message.get("difficulty"))
+        return {"type": "session", "session_id": session_id, "stats": sessions.stats(session_id),
+                "quiz": _public_quiz(sessions.active_quiz(session_id))}
+
+    async def push_quiz():
+        async with quiz_lock:
+            quiz = await next_quiz(state["difficulty"], state["session_id"])
+            await send({"type": "quiz", "quiz": _public_quiz(quiz)})
+
+    async def answer(option):
+        try:
+            result = _grade(RoastRequest(session_id=state["session_id"], option=option))
+        except HTTPException as e:
+            await send({"type": "error", "status": e.status_code, "detail": e.detail})
+            return
+        graded = _graded(result, None)
+        del graded["roast"]
+        await send({"type": "result", **graded})
+        spawn(push_quiz())
+        if result["correct"]:
+            return
+        parts = []
+        req, stored = _session_roast(result, option)
+        try:
+            async with aclosing(_roast_deltas(req, stored)) as deltas:
+                async for text in deltas:
+                    parts.append(text)
+                    await send({"type": "roast_delta", "text": text})
+            await send({"type": "roast_done", "roast": "".join(parts).strip()})
+        except UPSTREAM_ERRORS as e:
+            await send({"type": "error", "status": 502, "detail": str(e)})
+
+    try:
+        while True:
+            try:
+                message = await websocket.receive_json()
+            except ValueError:
+                await send({"type": "error", "status": 400, "detail": "Messages must be JSON objects."})
+                continue
+            kind = message.get("type") if isinstance(message, dict) else None
+            WS_MESSAGES.inc(type=kind if kind in ("start", "quiz", "answer") else "other")
+            if kind == "start":
+                await send(start(message))
+            elif kind in ("quiz", "answer") and state["session_id"] is None:
+                await send({"type": "error", "status": 409, "detail": "Send a start message first."})
+            elif kind == "quiz":
+                state["difficulty"] = message.get("difficulty", state["difficulty"])
+                spawn(push_quiz())
+            elif kind == "answer" and isinstance(message.get("option"), int):
+                spawn(answer(message["option"]))
+            else:
+                await send({"type": "error", "status": 400, "detail": "Expected start, quiz or answer {option}."})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        WS_CONNECTIONS.inc(-1)
+        for task in tasks:
+            task.cancel()
+        if state["session_id"]:
+            quiz_prefetch.cancel(state["session_id"])
+
+@app.post("/session")
+async def create_session(req: SessionRequest):
+    session_id = sessions.create(req.name)
+    return {"session_id": session_id, "stats": sessions.stats(session_id)}
+
+@app.get("/session/{session_id}")
+async def session_state(session_id: str):
+    """Score and streaks for a session, plus its open question (without the answer)."""
+    try:
+        stats = sessions.stats(session_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown session.")
+    return {"session_id": session_id, "stats": stats, "quiz": _public_quiz(sessions.active_quiz(session_id))}
+
+@app.get("/leaderboard")
+async def leaderboard(limit: int = 10):
+    return {"leaders": sessions.leaderboard(max(1, min(limit, 100))), "totals": sessions.totals()}
+
+async def _batch_lines(items: List[ChatRequest], concurrency: int):
+    """Run batch items concurrently and yield one NDJSON line per item as it finishes."""
+    limit = asyncio.Semaphore(concurrency)
+
+    async def run(index: int, item: ChatRequest) -> dict:
+        async with limit:
+            try:
+                reply = await sassy_reply(item.mode, item.content or "", item.difficulty, not item.no_cache, item.session_id)
+                return {"index": index, "ok": True, "mode": item.mode, "reply": reply}
+            except Exception as e:
+                return {"index": index, "ok": False, "mode": item.mode, "error": str(e)}
+
+    tasks = [asyncio.create_task(run(i, item)) for i, item in enumerate(items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield json.dumps(await next_done) + "\n"
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def _check_batch_size(items: list):
+    if not items:
+        raise HTTPException(status_code=400, detail="Batch has no items.")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Batch is limited to {BATCH_MAX_ITEMS} items.")
+
+@app.post("/batch")
+async def batch(req: BatchRequest):
+    _check_batch_size(req.items)
+    concurrency = max(1, min(req.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY))
+    return StreamingResponse(_batch_lines(req.items, concurrency), media_type="application/x-ndjson")
+
+@app.post("/batch/offline")
+async def batch_offline(req: BatchRequest):
+    """Submit a batch in Batch API format; answers that need no LLM are settled right away."""
+    _check_batch_size(req.items)
+    if any(item.mode == "review" for item in req.items):
+        # A review is one call per function: it would run online, item by item, inside this request.
+        raise HTTPException(status_code=400, detail="Review mode isn't available offline; use POST /batch.")
+    lines, meta = [], {}
+    for index, item in enumerate(req.items):
+        custom_id = f"item-{index}"
+        entry = meta[custom_id] = {"index": index, "mode": item.mode}
+        content = item.content or ""
+        if item.mode == "quiz":
+            lines.append(request_line(custom_id, MODEL_QUIZ, quiz_prompt(item.difficulty), TEMP_QUIZ, QUIZ_MAX_TOKENS))
+        elif item.mode in ["ask", "code"] and content:
+            prompt, local = _prepare(item.mode, content)
+            if local:
+                entry["reply"] = local
+            else:
+                model = router.model_for(item.mode, MODEL_GENERAL, content)
+                lines.append(request_line(custom_id, model, prompt, TEMP_GENERAL, _max_tokens(item.mode, prompt)))
+        else:
+            entry["reply"] = await sassy_reply(item.mode, content)
     try:
-        roast_text = generate_roast(req.question, req.user_answer, req.correct_answer)
-        return {"roast": roast_text}
+        batch_id = await batch_backend.submit(lines) if lines else f"settled_{os.urandom(6).hex()}"
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=502, detail=str(e))
+    save_meta(BATCH_DIR, batch_id, meta)
+    return {"batch_id": batch_id, "submitted": len(lines), "settled": len(meta) - len(lines)}
+
+@app.get("/batch/offline/{batch_id}")
+async def batch_offline_results(batch_id: str):
+    if not re.fullmatch(r"[A-Za-z0-9_-]+", batch_id):
+        raise HTTPException(status_code=404, detail="Unknown batch.")
+    try:
+        meta = load_meta(BATCH_DIR, batch_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Unknown batch.")
+    status = "completed"
+    if not batch_id.startswith("settled_"):
+        try:
+            status = await batch_backend.status(batch_id)
+        except KeyError:
+            raise HTTPException(status_code=404, detail="Unknown batch.")
+    if status != "completed":
+        return {"batch_id": batch_id, "status": status}
+
+    outputs = {} if batch_id.startswith("settled_") else {
+        line["custom_id"]: output_text(line) for line in await batch_backend.output(batch_id)
+    }
+    results = []
+    for custom_id, entry in meta.items():
+        result = {"index": entry["index"], "mode": entry["mode"]}
+        if "reply" in entry:
+            result.update(ok=True, reply=entry["reply"])
+        else:
+            text, error = outputs.get(custom_id, (None, "missing from batch output"))
+            if error:
+                result.update(ok=False, error=error)
+            else:
+                result.update(ok=True, reply=validate_quiz_json(text) if entry["mode"] == "quiz" else text)
+        results.append(result)
+    return {"batch_id": batch_id, "status": status, "results": sorted(results, key=lambda r: r["index"])}
+
+@app.get("/quiz/pool")
+async def quiz_pool_stats():
+    return quiz_pool.stats()
+
+@app.get("/quiz/prefetch")
+async def quiz_prefetch_stats():
+    return quiz_prefetch.stats()
+
+@app.get("/quiz/bank")
+async def quiz_bank_stats():
+    if quiz_bank is None:
+        raise HTTPException(status_code=404, detail="The quiz bank is turned off.")
+    return quiz_bank.stats()
+
+@app.get("/parse")
+async def parse_stats():
+    return {schema.name: schema.stats() for schema in (QUIZ_SCHEMA, REVIEW_SCHEMA)}
+
+@app.get("/cache")
+async def cache_stats():
+    return response_cache.stats()
+
+@app.get("/cache/semantic")
+async def semantic_cache_stats():
+    return semantic_cache.stats()
+
+@app.get("/singleflight")
+async def single_flight_stats():
+    return single_flight.stats()
+
+@app.get("/upstream")
+async def upstream_stats():
+    return resilient.stats()
+
+@app.get("/routing")
+async def routing_stats():
+    return router.stats()
+
+@app.get("/state")
+async def shared_state_stats():
+    return shared_state.stats()
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+if PROFILER:
+    @app.get("/debug/profile")
+    async def profile(seconds: float = 5.0, interval: float = 0.005):
+        """Sample the event loop thread and return folded stacks (flamegraph.pl / speedscope)."""
+        loop_thread = threading.get_ident()
+        stacks = await asyncio.to_thread(sample_stacks, loop_thread, min(seconds, 60.0), interval)
+        return PlainTextResponse(stacks)
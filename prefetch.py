@@ -0,0 +1,99 @@
+"""Speculative prefetch of each session's next quiz.
+
+As soon as a session is shown a quiz, the one after it is fetched in the
+background and held for `ttl` seconds, so "Next" can hand it over without
+waiting. A prefetch nobody takes in time is cancelled (if it is still
+running) and counted as wasted; a session that goes idle stops costing
+upstream calls after one.
+"""
+import asyncio
+
+
+class Prefetcher:
+    def __init__(self, fetch, ttl=120.0, max_sessions=1000):
+        self.fetch = fetch  # async (difficulty, key) -> quiz, or None when nothing suitable
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        # hit: ready when taken; joined: still running when taken, awaited instead of starting over;
+        # stale: turned down on take (e.g. seen meanwhile through another worker).
+        self.counters = {"started": 0, "hit": 0, "joined": 0, "miss": 0, "wasted": 0, "failed": 0, "stale": 0,
+                         "skipped": 0}
+        self._entries = {}  # key -> (difficulty, task, expiry timer)
+
+    def start(self, key, difficulty):
+        """Start fetching key's next quiz, unless one is already held or too many are."""
+        if key in self._entries:
+            return
+        if len(self._entries) >= self.max_sessions:
+            self.counters["skipped"] += 1
+            return
+        task = asyncio.create_task(self.fetch(difficulty, key))
+        timer = asyncio.get_running_loop().call_later(self.ttl, self._expire, key, task)
+        self._entries[key] = (difficulty, task, timer)
+        self.counters["started"] += 1
+
+    def _expire(self, key, task):
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] is task:
+            self.cancel(key)
+
+    def cancel(self, key):
+        """Drop key's prefetch (cancelling it if it is still running); it counts as wasted."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        _, task, timer = entry
+        timer.cancel()
+        if task.done():
+            if not task.cancelled():
+                task.exception()  # retrieved, so asyncio doesn't log it as unhandled
+        else:
+            task.cancel()
+        self.counters["wasted"] += 1
+
+    async def take(self, key, difficulty, fresh=None):
+        """key's prefetched quiz, waiting for it if it's still running; None if there is none.
+
+        fresh(quiz), if given, is checked now rather than when the prefetch
+        started; a quiz that fails it is dropped and None returned.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.counters["miss"] += 1
+            return None
+        if entry[0] != difficulty:
+            self.cancel(key)
+            self.counters["miss"] += 1
+            return None
+        _, task, timer = self._entries.pop(key)
+        timer.cancel()
+        self.counters["hit" if task.done() else "joined"] += 1
+        try:
+            quiz = await task
+        except Exception:
+            quiz = None
+        if quiz is None:
+            self.counters["failed"] += 1
+        elif fresh is not None and not fresh(quiz):
+            self.counters["stale"] += 1
+            quiz = None
+        return quiz
+
+    @property
+    def held(self) -> int:
+        return len(self._entries)
+
+    def stop(self):
+        for key in list(self._entries):
+            self.cancel(key)
+
+    def stats(self) -> dict:
+        taken = self.counters["hit"] + self.counters["joined"]
+        asked = taken + self.counters["miss"]
+        return {
+            **self.counters,
+            "held": self.held,
+            "running": sum(not task.done() for _, task, _ in self._entries.values()),
+            "hit_rate": round((taken - self.counters["failed"] - self.counters["stale"]) / asked, 3) if asked else None,
+            "ttl": self.ttl,
+        }
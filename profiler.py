@@ -0,0 +1,25 @@
+import sys
+import time
+from collections import Counter
+
+
+def sample_stacks(thread_id: int, seconds: float = 5.0, interval: float = 0.005) -> str:
+    """Sample one thread's Python stack and return folded stacks for flamegraph tools.
+
+    Runs in the caller's thread (call it via asyncio.to_thread from the
+    server) and only reads sys._current_frames(), so the event loop being
+    profiled keeps running undisturbed.
+    """
+    stacks = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        parts = []
+        while frame is not None:
+            code = frame.f_code
+            parts.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+            frame = frame.f_back
+        if parts:
+            stacks[";".join(reversed(parts))] += 1
+        time.sleep(interval)
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
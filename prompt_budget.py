@@ -0,0 +1,255 @@
+"""Keep prompts inside a token budget: local token counts and code compaction.
+
+Large pastes are shrunk before they reach the model. Comments and blank
+lines go first; if that is not enough, code that parses is reduced to its
+imports and signatures, with the most complex functions kept in full, and
+code that does not parse keeps the region around the SyntaxError plus the
+def/class lines elsewhere. Every cut leaves a marker with the original line
+numbers so local diagnostics still line up.
+"""
+import ast
+import io
+import re
+import tokenize
+from functools import lru_cache
+
+_PIECES = re.compile(r"[A-Za-z_]+|\d+|\S")
+# Runs of dropped statements share one "omitted" marker, so each costs little.
+DROPPED_COST = 2
+_DEF_LINE = re.compile(r"^\s*(async\s+def|def|class)\s")
+BRANCHES = (
+    ast.If, ast.For, ast.AsyncFor, ast.While, ast.Try, ast.ExceptHandler, ast.With, ast.AsyncWith,
+    ast.BoolOp, ast.IfExp, ast.comprehension, ast.match_case,
+)
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    """Exact token count when tiktoken is installed, otherwise a close estimate."""
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    # BPE vocabularies average about four characters per word piece, one per symbol.
+    return sum((len(piece) + 3) // 4 for piece in _PIECES.findall(text)) + text.count("\n")
+
+
+def truncate(text: str, budget: int, model: str = "gpt-3.5-turbo") -> str:
+    """Cut plain text to roughly `budget` tokens, on a word boundary."""
+    if count_tokens(text, model) <= budget:
+        return text
+    words = text.split()
+    low, high = 0, len(words)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_tokens(" ".join(words[:mid]), model) <= budget:
+            low = mid
+        else:
+            high = mid - 1
+    return " ".join(words[:low]) + " [...]"
+
+
+def strip_code(code: str) -> str:
+    """Drop comments and blank lines, leaving multi-line strings untouched."""
+    lines = code.splitlines()
+    try:
+        tokens = list(tokenize.generate_tokens(io.StringIO(code).readline))
+    except (tokenize.TokenError, SyntaxError):
+        return "\n".join(line for line in lines if line.strip() and not line.lstrip().startswith("#"))
+    comments = {}
+    in_string = set()
+    for tok in tokens:
+        if tok.type == tokenize.COMMENT:
+            comments[tok.start[0]] = tok.start[1]
+        elif tok.type == tokenize.STRING and tok.end[0] > tok.start[0]:
+            in_string.update(range(tok.start[0] + 1, tok.end[0] + 1))
+    kept = []
+    for number, line in enumerate(lines, 1):
+        if number in comments:
+            line = line[:comments[number]].rstrip()
+        if line.strip() or number in in_string:
+            kept.append(line)
+    return "\n".join(kept)
+
+
+def complexity(node: ast.AST) -> int:
+    """Rough cyclomatic complexity: 1 + branch points inside the node."""
+    return 1 + sum(isinstance(child, BRANCHES) for child in ast.walk(node))
+
+
+def _span(node: ast.AST) -> tuple:
+    start = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+    return start, node.end_lineno
+
+
+def _omitted(indent: str, start: int, end: int) -> str:
+    return f"{indent}# ... lines {start}-{end} omitted" if end > start else f"{indent}# ... line {start} omitted"
+
+
+class _Piece:
+    """A slice of the file that is shown either in full or as a shorter outline."""
+
+    def __init__(self, span: tuple, full: str, outline, score: int, model: str):
+        # outline None means the piece is dropped (leaving only an "omitted" marker).
+        self.span = span
+        self.full = full
+        self.outline = outline
+        self.score = score
+        # +1 for the newline joining it to the next piece.
+        self.full_cost = count_tokens(full, model) + 1
+        self.outline_cost = count_tokens(outline, model) + 1 if outline is not None else DROPPED_COST
+        self.keep_full = self.full_cost <= self.outline_cost
+
+    def drop(self) -> int:
+        """Replace the outline with an "omitted" marker; returns the tokens saved."""
+        before = self.full_cost if self.keep_full else self.outline_cost
+        self.outline = None
+        self.keep_full = False
+        self.outline_cost = DROPPED_COST
+        return before - self.outline_cost
+
+
+def _pieces(lines: list, nodes: list):
+    """Top-level statements as pieces; classes split into their header and body statements."""
+    for node in nodes:
+        start, end = _span(node)
+        full = strip_code("\n".join(lines[start - 1:end]))
+        if isinstance(node, ast.ClassDef) and node.body:
+            header = strip_code("\n".join(lines[start - 1:node.body[0].lineno - 1]))
+            yield (start, node.body[0].lineno - 1), header, header, 0
+            yield from _pieces(lines, node.body)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            body_start = node.body[0].lineno
+            header = strip_code("\n".join(lines[start - 1:body_start - 1]))
+            indent = re.match(r"\s*", lines[body_start - 1]).group(0)
+            outline = f"{header}\n{indent}...  {_omitted('', body_start, end).lstrip()}"
+            yield (start, end), full, outline, complexity(node)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            yield (start, end), full, full, 0
+        else:
+            # Other statements only stay if there is room for them.
+            yield (start, end), full, None, complexity(node) - 1
+
+
+def _outline_tree(code: str, tree: ast.Module, budget: int, model: str) -> str:
+    pieces = [_Piece(*parts, model) for parts in _pieces(code.splitlines(), tree.body)]
+    total = sum(p.full_cost if p.keep_full else p.outline_cost for p in pieces)
+    # Too many signatures to list them all: drop the simplest functions first,
+    # imports and class headers last.
+    for piece in sorted(pieces, key=lambda p: (p.outline == p.full, p.score)):
+        if total <= budget:
+            break
+        if piece.outline is not None:
+            total -= piece.drop()
+    for piece in sorted(pieces, key=lambda p: -p.score):
+        extra = piece.full_cost - piece.outline_cost
+        if not piece.keep_full and total + extra <= budget:
+            piece.keep_full = True
+            total += extra
+    out, dropped = [], None
+    for piece in pieces:
+        if not piece.keep_full and piece.outline is None:
+            dropped = (dropped or piece.span)[0], piece.span[1]
+            continue
+        if dropped:
+            out.append(_omitted("", *dropped))
+            dropped = None
+        text = piece.full if piece.keep_full else piece.outline
+        if text:
+            out.append(text)
+    if dropped:
+        out.append(_omitted("", *dropped))
+    return "\n".join(out)
+
+
+def _around_error(code: str, error_line: int, budget: int, model: str) -> str:
+    """Keep the lines around a SyntaxError, then def/class lines from the rest of the file."""
+    lines = code.splitlines()
+    error_line = min(max(error_line, 1), len(lines))
+    cost = [count_tokens(line, model) + 1 for line in lines]
+    keep = {error_line}
+    spent = cost[error_line - 1]
+    low = high = error_line
+    grew = True
+    while grew:
+        grew = False
+        for n in (low - 1, high + 1):
+            if 1 <= n <= len(lines) and spent + cost[n - 1] <= budget * 0.7:
+                keep.add(n)
+                spent += cost[n - 1]
+                grew = True
+        low, high = min(keep), max(keep)
+    for n, line in enumerate(lines, 1):
+        if n not in keep and _DEF_LINE.match(line) and spent + cost[n - 1] <= budget:
+            keep.add(n)
+            spent += cost[n - 1]
+
+    out, gap_start = [], None
+    for n, line in enumerate(lines, 1):
+        if n in keep:
+            if gap_start is not None:
+                out.append(_omitted(re.match(r"\s*", line).group(0), gap_start, n - 1))
+                gap_start = None
+            if line.strip() and not line.lstrip().startswith("#"):
+                out.append(line)
+        elif gap_start is None:
+            gap_start = n
+    if gap_start is not None:
+        out.append(_omitted("", gap_start, len(lines)))
+    return "\n".join(out)
+
+
+def _truncate_lines(text: str, budget: int, model: str) -> str:
+    kept, spent = [], 0
+    lines = text.splitlines()
+    marker = count_tokens(f"# ... {len(lines)} more lines omitted", model)
+    for line in lines:
+        cost = count_tokens(line, model) + 1
+        if spent + cost + marker > budget:
+            kept.append(f"# ... {len(lines) - len(kept)} more lines omitted")
+            break
+        kept.append(line)
+        spent += cost
+    return "\n".join(kept)
+
+
+def compact_code(code: str, budget: int, error_line=None, model: str = "gpt-3.5-turbo") -> str:
+    """Return code unchanged if it fits `budget` tokens, else a compacted view of it."""
+    if count_tokens(code, model) <= budget:
+        return code
+    stripped = strip_code(code)
+    if count_tokens(stripped, model) <= budget:
+        return stripped
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        tree, error_line = None, error_line or e.lineno or 1
+    # Cuts are chosen on line costs; the "omitted" markers and joins come on
+    # top, so re-count and ask for less until the result fits.
+    target = budget
+    for _ in range(3):
+        if tree is None:
+            compacted = _around_error(code, error_line, target, model)
+        else:
+            compacted = _outline_tree(code, tree, target, model)
+        over = count_tokens(compacted, model) - budget
+        if over <= 0:
+            return compacted
+        target -= over
+    # Even the outline is too big: keep its start.
+    return _truncate_lines(compacted, budget, model)
+
+
+def reply_tokens(input_tokens: int, base: int, per_input: float, ceiling: int) -> int:
+    """max_tokens for a reply that grows with the input it talks about."""
+    return min(ceiling, base + int(input_tokens * per_input))
@@ -0,0 +1,160 @@
+"""Persistent quiz bank with near-duplicate detection.
+
+Every validated quiz is stored in SQLite (WAL, so several workers can share
+the file) with its difficulty, topic and score. Before an insert the quiz's
+hashed n-gram vector is compared against every stored one with a single
+matrix product; anything above the similarity threshold counts as a
+duplicate of the existing quiz and is not stored again. The correct answer
+is part of the vector, so "print(2 ** 3)" and "print(3 ** 2)" stay apart.
+"""
+import json
+import random
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from feature_hash import hash_features
+
+DIM = 1024  # per part
+PARTS = 4  # question, options, code, correct answer
+_WORDS = re.compile(r"\w+|[^\w\s]")
+
+
+def _hashed(features: list) -> np.ndarray:
+    vector = np.zeros(DIM, dtype=np.float32)
+    buckets, values = hash_features(features, DIM)
+    vector[buckets] = values
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def quiz_vector(quiz: dict) -> np.ndarray:
+    """Unit-length hashed n-gram vector; cosine similarity is a dot product.
+
+    Question, options, code and the correct option are hashed separately and
+    weighted, so two quizzes that share stock wording ("What will this code
+    output?") but not code or answers stay apart, and one-character code
+    changes that change the answer do too. Code whitespace is ignored.
+    """
+    words = _WORDS.findall(quiz.get("question", "").lower())
+    question = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    choices = [' '.join(str(o).lower().split()) for o in quiz.get("options", [])]
+    options = [f"opt:{o}" for o in choices]
+    answer = quiz.get("answer")
+    correct = [f"ans:{choices[answer]}"] if isinstance(answer, int) and 0 <= answer < len(choices) else []
+    code = re.sub(r"\s+", "", quiz.get("code") or "")
+    code_grams = [code[i:i + 3] for i in range(max(0, len(code) - 2))]
+    parts = [(1.0, question), (1.0, options), (1.4, code_grams), (1.4, correct)]
+    vector = np.concatenate([weight * _hashed(features) for weight, features in parts])
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class QuizBank:
+    """Quizzes stored by difficulty/topic/score, served without repeats per session."""
+
+    def __init__(self, path: str, threshold: float = 0.75):
+        self.threshold = threshold
+        self.counters = {"stored": 0, "duplicates": 0, "served": 0, "exhausted": 0}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS quizzes ("
+            "id INTEGER PRIMARY KEY, difficulty TEXT NOT NULL, topic TEXT NOT NULL, score INTEGER NOT NULL, "
+            "body TEXT NOT NULL, vector BLOB NOT NULL, created REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS quizzes_lookup ON quizzes (difficulty, topic, score)")
+        # In-memory mirror of the table: ids per difficulty and the vector matrix,
+        # whose first len(self._ids) rows are in use; it doubles when full.
+        self._ids = []
+        self._by_difficulty = {}
+        self._vectors = np.zeros((64, PARTS * DIM), dtype=np.float32)
+        self._last_id = 0
+        self._sync()
+
+    def _sync(self):
+        """Pick up rows written since the last look, by this or another worker."""
+        rows = self._db.execute(
+            "SELECT id, difficulty, vector, body FROM quizzes WHERE id > ? ORDER BY id", (self._last_id,)
+        ).fetchall()
+        if not rows:
+            return
+        start, end = len(self._ids), len(self._ids) + len(rows)
+        if end > len(self._vectors):
+            grown = np.zeros((max(end, 2 * len(self._vectors)), PARTS * DIM), dtype=np.float32)
+            grown[:start] = self._vectors[:start]
+            self._vectors = grown
+        for row, (quiz_id, difficulty, vector, body) in enumerate(rows, start):
+            vector = np.frombuffer(vector, dtype=np.float32)
+            if vector.size != PARTS * DIM:
+                vector = quiz_vector(json.loads(body))  # stored before the answer was part of it
+            self._vectors[row] = vector
+            self._ids.append(quiz_id)
+            self._by_difficulty.setdefault(difficulty, []).append(quiz_id)
+        self._last_id = rows[-1][0]
+
+    @property
+    def size(self) -> int:
+        return len(self._ids)
+
+    def find_duplicate(self, vector: np.ndarray):
+        """Id of the most similar stored quiz if it is above the threshold, else None."""
+        if not len(self._ids):
+            return None
+        similarity = self._vectors[:len(self._ids)] @ vector
+        best = int(np.argmax(similarity))
+        return self._ids[best] if similarity[best] >= self.threshold else None
+
+    def add(self, quiz: dict, difficulty: str) -> int:
+        """Store a quiz and return its id, or the id of the near-duplicate already stored."""
+        vector = quiz_vector(quiz)
+        topic = str(quiz.get("topic") or "general").strip().lower()[:40]
+        body = json.dumps({k: v for k, v in quiz.items() if k != "id"})
+        with self._lock:
+            self._sync()
+            duplicate = self.find_duplicate(vector)
+            if duplicate is not None:
+                self.counters["duplicates"] += 1
+                return duplicate
+            cursor = self._db.execute(
+                "INSERT INTO quizzes (difficulty, topic, score, body, vector, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (difficulty, topic, int(quiz.get("score", 1)), body, vector.tobytes(), time.time()),
+            )
+            self.counters["stored"] += 1
+            self._sync()
+            return cursor.lastrowid
+
+    def get(self, quiz_id: int):
+        with self._lock:
+            row = self._db.execute("SELECT body FROM quizzes WHERE id = ?", (quiz_id,)).fetchone()
+        return dict(json.loads(row[0]), id=quiz_id) if row else None
+
+    def next(self, difficulty, seen: set):
+        """A random stored quiz of this difficulty (None: any) not in `seen`, or None when exhausted."""
+        with self._lock:
+            self._sync()
+            ids = self._ids if difficulty is None else self._by_difficulty.get(difficulty, [])
+        unseen = [quiz_id for quiz_id in ids if quiz_id not in seen]
+        if not unseen:
+            self.counters["exhausted"] += 1
+            return None
+        self.counters["served"] += 1
+        return self.get(random.choice(unseen))
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT difficulty, topic, COUNT(*) FROM quizzes GROUP BY difficulty, topic"
+            ).fetchall()
+        by_difficulty = {}
+        for difficulty, topic, count in rows:
+            by_difficulty.setdefault(difficulty, {})[topic] = count
+        return {**self.counters, "size": self.size, "threshold": self.threshold, "quizzes": by_difficulty}
+
+    def close(self):
+        self._db.close()
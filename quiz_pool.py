@@ -0,0 +1,109 @@
+import asyncio
+import random
+from collections import deque
+
+
+class QuizPool:
+    """Per-difficulty stock of validated quizzes, refilled in the background."""
+
+    def __init__(self, generate, buckets, size=10, low_water=3, concurrency=2, queue=None, lease=None):
+        # generate(difficulty) -> awaitable quiz dict, or None if it came back unusable
+        self.generate = generate
+        self.size = size
+        self.low_water = low_water
+        self.concurrency = max(1, concurrency)
+        # queue(bucket) -> a deque-like stock; lease(bucket) -> a refill lease with
+        # acquire()/release(). shared_state provides both across workers.
+        self.buckets = {name: (queue or (lambda _: deque()))(name) for name in buckets}
+        self.lease = lease
+        self.tasks = {}
+        self.counters = {"hits": 0, "misses": 0, "generated": 0, "rejected": 0, "errors": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0 and bool(self.buckets)
+
+    def pick_bucket(self, difficulty=None):
+        """Return the bucket for a difficulty, or the best-stocked one if unspecified."""
+        if difficulty in self.buckets:
+            return difficulty
+        if difficulty is None and self.buckets:
+            most = max(len(q) for q in self.buckets.values())
+            return random.choice([name for name, q in self.buckets.items() if len(q) == most])
+        return None
+
+    def get(self, difficulty=None):
+        """Pop a ready quiz, or return None on a miss. Kicks a refill when running low."""
+        bucket = self.pick_bucket(difficulty)
+        if not self.enabled or bucket is None:
+            return None
+        stock = self.buckets[bucket]
+        try:
+            quiz = stock.popleft()
+        except IndexError:
+            quiz = None
+        self.counters["hits" if quiz else "misses"] += 1
+        if len(stock) < self.low_water:
+            self.refill(bucket)
+        return quiz
+
+    def refill(self, bucket):
+        """Start a background refill for a bucket unless one is already running."""
+        task = self.tasks.get(bucket)
+        if task is None or task.done():
+            self.tasks[bucket] = asyncio.create_task(self._refill(bucket))
+
+    async def _refill(self, bucket):
+        """Top a bucket up; with a lease, only the worker holding it refills that bucket."""
+        lease = self.lease(bucket) if self.lease else None
+        try:
+            await self._fill(bucket, lease)
+        finally:
+            if lease is not None:
+                lease.release()
+
+    async def _fill(self, bucket, lease):
+        stock = self.buckets[bucket]
+        while len(stock) < self.size:
+            if lease is not None and not lease.acquire():
+                break
+            batch = min(self.concurrency, self.size - len(stock))
+            results = await asyncio.gather(
+                *(self.generate(bucket) for _ in range(batch)), return_exceptions=True
+            )
+            added = 0
+            for quiz in results:
+                if isinstance(quiz, BaseException):
+                    self.counters["errors"] += 1
+                elif quiz is None:
+                    self.counters["rejected"] += 1
+                else:
+                    stock.append(quiz)
+                    added += 1
+            self.counters["generated"] += added
+            if not added:
+                # Upstream is unhappy; stop here and let the next miss retry.
+                break
+
+    def start(self):
+        """Fill every bucket in the background."""
+        if self.enabled:
+            for bucket in self.buckets:
+                self.refill(bucket)
+
+    async def stop(self):
+        tasks = [t for t in self.tasks.values() if not t.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.tasks.clear()
+
+    def stats(self) -> dict:
+        served = self.counters["hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_rate": round(self.counters["hits"] / served, 3) if served else 0.0,
+            "stock": {name: len(q) for name, q in self.buckets.items()},
+            "size": self.size,
+            "low_water": self.low_water,
+        }
@@ -0,0 +1,168 @@
+"""Retries with backoff and a circuit breaker for upstream OpenAI calls."""
+import asyncio
+import email.utils
+import time
+
+import openai
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling upstream while the breaker is open."""
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, (openai.APIConnectionError, asyncio.TimeoutError)):
+        return True
+    return isinstance(exc, openai.APIStatusError) and exc.status_code in RETRYABLE_STATUS
+
+
+def retry_after(exc: BaseException):
+    """Seconds the server asked us to wait (Retry-After / retry-after-ms), or None."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """Open after `threshold` consecutive failures and fail fast for `reset_after` seconds.
+
+    Once the cool-down is over a single trial call is let through (half-open);
+    its success closes the breaker, its failure opens it again.
+    """
+
+    def __init__(self, threshold=5, reset_after=30.0):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.open_until = 0.0
+        self.trial = False
+        self.counters = {"opened": 0, "short_circuited": 0}
+
+    @property
+    def state(self) -> str:
+        if self.failures < self.threshold:
+            return "closed"
+        return "open" if time.monotonic() < self.open_until or self.trial else "half_open"
+
+    def check(self) -> bool:
+        """Raise CircuitOpenError unless a call may go upstream right now; True if it is the trial."""
+        state = self.state
+        if state == "open":
+            self.counters["short_circuited"] += 1
+            raise CircuitOpenError(f"upstream circuit open for another {self.open_until - time.monotonic():.1f}s")
+        if state == "half_open":
+            self.trial = True
+            return True
+        return False
+
+    def success(self):
+        self.failures = 0
+        self.trial = False
+
+    def abandon(self):
+        """The trial call was cancelled before it finished; let the next one be the trial."""
+        self.trial = False
+
+    def failure(self, wait=None):
+        """Count a failed call; `wait` (e.g. Retry-After) stretches the cool-down."""
+        self.failures += 1
+        self.trial = False
+        if self.failures >= self.threshold:
+            if time.monotonic() >= self.open_until:
+                self.counters["opened"] += 1
+            self.open_until = time.monotonic() + max(self.reset_after, wait or 0.0)
+
+    def stats(self) -> dict:
+        return {**self.counters, "state": self.state, "consecutive_failures": self.failures}
+
+
+class _WaitRetryAfter:
+    """tenacity wait: the server's Retry-After if it sent one, else jittered exponential backoff."""
+
+    def __init__(self, initial: float, max_wait: float):
+        self.backoff = wait_random_exponential(multiplier=initial, max=max_wait)
+
+    def __call__(self, retry_state) -> float:
+        exc = retry_state.outcome.exception()
+        wait = retry_after(exc) if exc is not None else None
+        return wait if wait is not None else self.backoff(retry_state)
+
+
+class Resilient:
+    """Run upstream calls through the breaker with jittered retries for transient errors.
+
+    A Retry-After longer than max_wait is not worth waiting for inside a
+    request: the call fails right away so the caller can fall back.
+    """
+
+    def __init__(self, breaker: CircuitBreaker, attempts=3, initial_wait=0.25, max_wait=4.0):
+        self.breaker = breaker
+        self.attempts = attempts
+        self.initial_wait = initial_wait
+        self.max_wait = max_wait
+        self.counters = {"retries": 0, "failed": 0}
+
+    def _should_retry(self, exc: BaseException) -> bool:
+        if not is_retryable(exc):
+            return False
+        wait = retry_after(exc)
+        return wait is None or wait <= self.max_wait
+
+    async def call(self, fn):
+        """Return await fn(), retrying retryable failures; raises CircuitOpenError when open."""
+        retrying = AsyncRetrying(
+            stop=stop_after_attempt(self.attempts),
+            wait=_WaitRetryAfter(self.initial_wait, self.max_wait),
+            retry=retry_if_exception(self._should_retry),
+            before_sleep=lambda _: self._count("retries"),
+            reraise=True,
+        )
+        try:
+            async for attempt in retrying:
+                with attempt:
+                    return await self.attempt(fn)
+        except Exception:
+            # Including CircuitOpenError: the caller still gets no reply from upstream.
+            self._count("failed")
+            raise
+
+    async def attempt(self, fn):
+        """One breaker-guarded call, without retries (used directly for streams)."""
+        trial = self.breaker.check()
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            if trial:
+                self.breaker.abandon()
+            raise
+        except Exception as e:
+            if is_retryable(e):
+                self.breaker.failure(retry_after(e))
+            else:
+                # Upstream answered, just not happily (e.g. a 400): it is up.
+                self.breaker.success()
+            raise
+        self.breaker.success()
+        return result
+
+    def _count(self, name: str):
+        self.counters[name] += 1
+
+    def stats(self) -> dict:
+        return {**self.counters, "breaker": self.breaker.stats()}
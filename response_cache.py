@@ -0,0 +1,125 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from cachetools import TTLCache
+
+
+def normalize_content(mode: str, content: str) -> str:
+    """Normalize user input so trivially different submissions share a cache key.
+
+    Questions are case- and whitespace-insensitive. Code keeps its case and
+    indentation; only line endings, trailing spaces and surrounding blank
+    lines are dropped.
+    """
+    if mode == "ask":
+        return " ".join(content.split()).casefold()
+    lines = [line.rstrip() for line in content.replace("\r\n", "\n").split("\n")]
+    return "\n".join(lines).strip("\n")
+
+
+class ResponseCache:
+    """Two-tier reply cache: in-memory LRU with TTL, plus an optional SQLite file.
+
+    The SQLite tier survives restarts and can be shared by several uvicorn
+    workers pointing at the same path (it runs in WAL mode).
+    """
+
+    def __init__(self, maxsize=1024, ttl=3600, path=None, disk_maxsize=10000, disk_ttl=86400):
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl) if maxsize > 0 else None
+        self.disk_maxsize = disk_maxsize
+        self.disk_ttl = disk_ttl
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0, "stores": 0}
+        self._db = None
+        self._lock = threading.Lock()
+        self._writes = 0
+        if path:
+            self._db = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    @property
+    def enabled(self) -> bool:
+        return self.memory is not None or self._db is not None
+
+    @staticmethod
+    def key(mode: str, content: str, model: str, temperature: float) -> str:
+        raw = json.dumps([mode, normalize_content(mode, content), model, temperature])
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        if self.memory is not None and key in self.memory:
+            self.counters["memory_hits"] += 1
+            return self.memory[key]
+        value = self._disk_get(key)
+        if value is not None:
+            self.counters["disk_hits"] += 1
+            if self.memory is not None:
+                self.memory[key] = value
+            return value
+        self.counters["misses"] += 1
+        return None
+
+    def set(self, key: str, value: str):
+        if self.memory is not None:
+            self.memory[key] = value
+        self._disk_set(key, value)
+        self.counters["stores"] += 1
+
+    def bypass(self):
+        """Record a request that skipped the lookup on purpose."""
+        self.counters["bypassed"] += 1
+
+    def _disk_get(self, key: str) -> Optional[str]:
+        if self._db is None:
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM responses WHERE key = ? AND expires > ?", (key, now)
+            ).fetchone()
+            if row:
+                self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        return row[0] if row else None
+
+    def _disk_set(self, key: str, value: str):
+        if self._db is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now + self.disk_ttl, now),
+            )
+            self._writes += 1
+            # Trimming scans the table, so only do it every so often.
+            if self._writes % 100 == 0:
+                self._db.execute("DELETE FROM responses WHERE expires <= ?", (now,))
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    "SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                    (self.disk_maxsize,),
+                )
+
+    def stats(self) -> dict:
+        hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+        lookups = hits + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "memory_entries": len(self.memory) if self.memory is not None else 0,
+            "disk_enabled": self._db is not None,
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,183 @@
+import asyncio
+import math
+import time
+from collections import deque
+
+
+def parse_budgets(spec: str) -> dict:
+    """Parse "ask=4,quiz=10" into {"ask": 4.0, "quiz": 10.0}."""
+    budgets = {}
+    for part in spec.split(","):
+        mode, _, seconds = part.partition("=")
+        if mode.strip() and seconds.strip():
+            budgets[mode.strip()] = float(seconds)
+    return budgets
+
+
+class LatencyWindow:
+    """Recent upstream latencies, bounded by count and age."""
+
+    def __init__(self, size=200, max_age=300.0):
+        self.samples = deque(maxlen=size)
+        self.max_age = max_age
+
+    def add(self, seconds: float):
+        self.samples.append((time.monotonic(), seconds))
+
+    def values(self) -> list:
+        cutoff = time.monotonic() - self.max_age
+        while self.samples and self.samples[0][0] < cutoff:
+            self.samples.popleft()
+        return [seconds for _, seconds in self.samples]
+
+    def percentile(self, pct: float):
+        values = sorted(self.values())
+        if not values:
+            return None
+        return values[max(0, math.ceil(pct / 100 * len(values)) - 1)]
+
+
+class Router:
+    """Pick a model per call and hedge slow calls to a faster model.
+
+    Each mode has a latency budget. A call starts on its primary model; if it
+    is still running the primary's recent p<hedge_percentile> latency (capped
+    by the budget) after it got an upstream slot, a second request goes to
+    the hedge model. The
+    first valid result wins and the other request is cancelled. Nothing is
+    allowed to run longer than budget * deadline_factor.
+    """
+
+    def __init__(self, budgets: dict, hedge_model=None, hedge_percentile=90.0, min_samples=20,
+                 deadline_factor=3.0, fast_model=None, short_ask_chars=0, window_size=200, window_age=300.0):
+        self.budgets = budgets
+        self.hedge_model = hedge_model
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.deadline_factor = deadline_factor
+        self.fast_model = fast_model
+        self.short_ask_chars = short_ask_chars
+        self.window_size = window_size
+        self.window_age = window_age
+        self.windows = {}
+        self.decisions = {}
+
+    def _count(self, mode: str, decision: str):
+        key = (mode, decision)
+        self.decisions[key] = self.decisions.get(key, 0) + 1
+
+    def window(self, model: str, mode: str) -> LatencyWindow:
+        key = (model, mode)
+        if key not in self.windows:
+            self.windows[key] = LatencyWindow(self.window_size, self.window_age)
+        return self.windows[key]
+
+    def observe(self, model: str, mode: str, seconds: float):
+        """Feed a finished call's latency into the rolling window."""
+        self.window(model, mode).add(seconds)
+
+    def model_for(self, mode: str, model: str, content: str = "") -> str:
+        """Send short ask questions to the fast model; everything else keeps its model."""
+        if (mode == "ask" and self.fast_model and self.fast_model != model
+                and len(content) <= self.short_ask_chars):
+            self._count(mode, "short_ask")
+            return self.fast_model
+        return model
+
+    def hedge_delay(self, mode: str, model: str):
+        """Seconds to wait before hedging, or None if this mode has no budget."""
+        budget = self.budgets.get(mode)
+        if budget is None:
+            return None
+        window = self.window(model, mode)
+        if len(window.values()) < self.min_samples:
+            return budget
+        return min(budget, window.percentile(self.hedge_percentile))
+
+    async def run(self, mode: str, model: str, call, valid=None):
+        """Await call(model, on_slot), hedging to the hedge model if it runs past the delay.
+
+        The callee calls on_slot() once it holds an upstream slot: the hedge
+        delay is upstream latency, so it is counted from there, and a call
+        still queued for a slot is never hedged (that would only add load
+        while every slot is taken). valid(result) -> bool lets a caller
+        reject a result (e.g. an unusable quiz) so the other request gets a
+        chance; if nothing better arrives the rejected result is still returned.
+        """
+        delay = self.hedge_delay(mode, model)
+        if delay is None:
+            return await call(model, lambda: None)
+        deadline = self.budgets[mode] * self.deadline_factor
+        can_hedge = self.hedge_model is not None
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        slotted = asyncio.Event()
+        slot_at = None
+
+        def on_slot():
+            nonlocal slot_at
+            if slot_at is None:
+                slot_at = loop.time() - started
+                slotted.set()
+
+        attempts = {asyncio.ensure_future(call(model, on_slot)): "primary"}
+        slot_wait = asyncio.ensure_future(slotted.wait()) if can_hedge else None
+        hedged = False
+        rejected = None
+        error = None
+        try:
+            while attempts:
+                hedge_at = None
+                waiting = set(attempts)
+                if can_hedge and not hedged:
+                    if slot_at is None:
+                        waiting.add(slot_wait)
+                    else:
+                        hedge_at = slot_at + delay
+                wait_until = deadline if hedge_at is None else min(deadline, hedge_at)
+                done, _ = await asyncio.wait(
+                    waiting, timeout=max(0.0, wait_until - (loop.time() - started)),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if slot_wait in done:
+                    done.discard(slot_wait)
+                    if not done:
+                        continue  # the primary got its slot: the hedge clock starts
+                if not done:
+                    if hedge_at is None or hedge_at >= deadline:
+                        self._count(mode, "timeout")
+                        raise asyncio.TimeoutError(f"{mode} exceeded its {deadline:.1f}s deadline")
+                    attempts[asyncio.ensure_future(call(self.hedge_model, lambda: None))] = "hedge"
+                    hedged = True
+                    self._count(mode, "hedged")
+                    continue
+                for task in done:
+                    role = attempts.pop(task)
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    if valid is not None and not valid(task.result()):
+                        rejected = task.result()
+                        continue
+                    self._count(mode, f"{role}_won" if hedged else "primary")
+                    return task.result()
+            if rejected is not None:
+                return rejected
+            raise error
+        finally:
+            for task in attempts:
+                task.cancel()
+            if slot_wait is not None:
+                slot_wait.cancel()
+
+    def stats(self) -> dict:
+        latency = {}
+        for (model, mode), window in self.windows.items():
+            latency[f"{model}/{mode}"] = {
+                "samples": len(window.values()),
+                "p50": window.percentile(50),
+                "p95": window.percentile(95),
+                "hedge_after": self.hedge_delay(mode, model),
+            }
+        decisions = {f"{mode}/{decision}": n for (mode, decision), n in self.decisions.items()}
+        return {"decisions": decisions, "latency": latency}
@@ -0,0 +1,215 @@
+"""Semantic cache for ask replies, so paraphrased questions share one answer.
+
+Questions are embedded locally, without a model: their content words
+(question filler like "what is", "explain", "pls" dropped, plural and verb
+endings trimmed), Python keywords and operators (`is`, `not`, `==`, `//`,
+which is what many questions are about), word bigrams and per-word
+character trigrams are hashed
+into `dim` buckets and weighted by TF-IDF over the cached questions. The
+vectors sit in one preallocated float32 matrix, stored bucket-major, so a
+lookup only reads the rows of the buckets the question hashed into (a few
+dozen) rather than the whole index, and a cached reply is reused when the
+best cosine similarity reaches the threshold. Entries expire after `ttl`; when the
+index is full the least recently used one is evicted. The IDF weights are
+snapshotted and the matrix rebuilt each time the index has changed size by
+a quarter, so rows and queries are always weighted alike.
+"""
+import re
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from feature_hash import hash_features
+
+# Words, and operators longest first so "**=" is not read as "*", "*", "=".
+_TOKENS = re.compile(r"[a-z0-9_]+|\*\*=?|//=?|>>=?|<<=?|[=!<>:]=|->|[-+*/%@&|^~<>=]=?")
+_HYPHEN = re.compile(r"(?<=[a-z0-9])-(?=[a-z])")  # "f-string" is one word, not a minus
+# Phrases that only frame the question; the keywords in them count elsewhere.
+_FILLER = re.compile(r"\b(?:what|whats|how|why|where|which|who)\s+(?:is|are|was|does|do|did)\b|\b(?:in|with|for)\s+python\b")
+# Words that say how a question is asked rather than what about. Python
+# keywords (is, and, or, in, for, not...) are not here: "is vs ==" and
+# "and vs or" are different questions.
+STOP_WORDS = frozenset("""
+    a an the are was be been what whats how do does did i im you me my we our to of on at
+    can could would should will please pls plz thanks explain tell show about python py
+    work works working mean means meaning this that these it its keyword use used using way ways
+    some any there here just really actually like vs versus
+""".split())
+_ENDINGS = ("ing", "ions", "ion", "es", "s", "ed")
+WORD_WEIGHT = 1.0
+GRAM_WEIGHT = 1.0  # shared by a word's trigrams, so long words don't outweigh short ones
+BIGRAM_WEIGHT = 1.0  # keeps word order: "list to string" is not "string to list"
+
+
+def _stem(word: str) -> str:
+    for ending in _ENDINGS:
+        if len(word) - len(ending) >= 3 and word.endswith(ending):
+            return word[:-len(ending)]
+    return word
+
+
+def question_terms(question: str) -> list:
+    """(feature, weight) pairs for a question; empty if it is all filler."""
+    text = _FILLER.sub(" ", _HYPHEN.sub(" ", question.lower()))
+    words = [_stem(w) for w in _TOKENS.findall(text) if w not in STOP_WORDS]
+    terms = [(f"w:{w}", WORD_WEIGHT) for w in words]
+    for word in words:
+        if not word[0].isalnum() and word[0] != "_":
+            continue  # operators have no spelling variants to match
+        padded = f"<{word}>"
+        grams = [padded[i:i + 3] for i in range(len(padded) - 2)]
+        terms += [(f"c:{g}", GRAM_WEIGHT / len(grams)) for g in grams]
+    terms += [(f"b:{a} {b}", BIGRAM_WEIGHT) for a, b in zip(words, words[1:])]
+    return terms
+
+
+class SemanticCache:
+    """Ask replies keyed by what the question means, within a scope (the model)."""
+
+    def __init__(self, maxsize=2000, threshold=0.85, ttl=3600, dim=1024, max_chars=300):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.ttl = ttl
+        self.dim = dim
+        self.max_chars = max_chars  # longer questions (pasted code, tracebacks) skip the cache
+        self.counters = {"hits": 0, "misses": 0, "skipped": 0, "stores": 0, "evicted": 0, "expired": 0, "rebuilds": 0}
+        self._lock = threading.Lock()
+        self._index = np.zeros((dim, maxsize), dtype=np.float32)  # one column per slot
+        self._expires = np.zeros(maxsize)  # 0: empty slot
+        self._accessed = np.zeros(maxsize)
+        self._scopes = np.full(maxsize, -1, dtype=np.int32)
+        self._scope_ids = {}
+        self._terms = [None] * maxsize  # (buckets, values) per slot, to rebuild rows from
+        self._replies = [None] * maxsize
+        self._df = np.zeros(dim)
+        self._idf = np.ones(dim, dtype=np.float32)
+        self._live = 0  # slots holding an entry, expired or not
+        self._snapshot = 0  # _live when the IDF weights were last taken
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def _sparse(self, question: str):
+        """Hashed term frequencies as (buckets, values), or None if there are no terms."""
+        terms = question_terms(question)
+        if not terms:
+            return None
+        return hash_features([term for term, _ in terms], self.dim, [weight for _, weight in terms])
+
+    def _weigh(self, buckets, values) -> np.ndarray:
+        """TF-IDF weights for the buckets, scaled to unit length."""
+        weights = values * self._idf[buckets]
+        norm = np.linalg.norm(weights)
+        return weights / norm if norm else weights
+
+    def _scope(self, scope: str) -> int:
+        return self._scope_ids.setdefault(scope, len(self._scope_ids))
+
+    def _best(self, buckets, weights, scope: int, now: float):
+        """(slot, similarity) of the closest live entry in scope, or (None, -1)."""
+        if not self._live:
+            return None, -1.0
+        similarity = weights @ self._index[buckets]
+        similarity[(self._expires <= now) | (self._scopes != scope)] = -1.0
+        slot = int(np.argmax(similarity))
+        return (slot, float(similarity[slot])) if similarity[slot] > -1.0 else (None, -1.0)
+
+    def get(self, question: str, scope: str = "") -> Optional[str]:
+        """The reply cached for a question close enough to this one, or None."""
+        sparse = self._sparse(question) if len(question) <= self.max_chars else None
+        if sparse is None:
+            self.counters["skipped"] += 1
+            return None
+        now = time.time()
+        with self._lock:
+            buckets, values = sparse
+            slot, similarity = self._best(buckets, self._weigh(buckets, values), self._scope(scope), now)
+            if slot is None or similarity < self.threshold:
+                self.counters["misses"] += 1
+                return None
+            self._accessed[slot] = now
+            self.counters["hits"] += 1
+            return self._replies[slot]
+
+    def set(self, question: str, reply: str, scope: str = ""):
+        sparse = self._sparse(question) if len(question) <= self.max_chars else None
+        if sparse is None:
+            return
+        now = time.time()
+        with self._lock:
+            scope_id = self._scope(scope)
+            buckets, values = sparse
+            weights = self._weigh(buckets, values)
+            slot, similarity = self._best(buckets, weights, scope_id, now)
+            if slot is None or similarity < 0.999:
+                slot = self._free_slot(now)
+            self._drop(slot)
+            self._terms[slot] = sparse
+            self._replies[slot] = reply
+            self._scopes[slot] = scope_id
+            self._expires[slot] = now + self.ttl
+            self._accessed[slot] = now
+            self._df[buckets] += 1
+            self._live += 1
+            self.counters["stores"] += 1
+            if abs(self._live - self._snapshot) >= max(16, self._snapshot // 4):
+                self._rebuild()
+            else:
+                self._index[buckets, slot] = weights
+
+    def _free_slot(self, now: float) -> int:
+        """An empty or expired slot, else the least recently used one."""
+        slot = int(np.argmin(self._expires))
+        if self._terms[slot] is None:
+            return slot
+        if self._expires[slot] <= now:
+            self.counters["expired"] += 1
+            return slot
+        self.counters["evicted"] += 1
+        return int(np.argmin(self._accessed))
+
+    def _drop(self, slot: int):
+        if self._terms[slot] is None:
+            return
+        buckets = self._terms[slot][0]
+        self._df[buckets] -= 1
+        self._index[buckets, slot] = 0
+        self._terms[slot] = self._replies[slot] = None
+        self._expires[slot] = 0
+        self._scopes[slot] = -1
+        self._live -= 1
+
+    def _rebuild(self):
+        """Re-take the IDF weights and re-weight every entry with them.
+
+        Only the entries' own buckets are written: they are the only
+        non-zero cells, so nothing else needs clearing.
+        """
+        self._idf = (np.log((1 + self._live) / (1 + self._df)) + 1).astype(np.float32)
+        slots = [slot for slot, terms in enumerate(self._terms) if terms is not None]
+        if slots:
+            columns = np.concatenate([np.full(len(self._terms[s][0]), s) for s in slots])
+            buckets = np.concatenate([self._terms[s][0] for s in slots])
+            weights = np.concatenate([self._terms[s][1] for s in slots]) * self._idf[buckets]
+            norms = np.sqrt(np.bincount(columns, weights=weights.astype(np.float64) ** 2, minlength=self.maxsize))
+            self._index[buckets, columns] = weights / np.where(norms > 0, norms, 1)[columns]
+        self._snapshot = self._live
+        self.counters["rebuilds"] += 1
+
+    @property
+    def size(self) -> int:
+        return int((self._expires > time.time()).sum())
+
+    def stats(self) -> dict:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_rate": round(self.counters["hits"] / lookups, 3) if lookups else 0.0,
+            "entries": self.size,
+            "maxsize": self.maxsize,
+            "threshold": self.threshold,
+            "index_bytes": self._index.nbytes,
+        }
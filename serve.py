@@ -0,0 +1,44 @@
+"""Run the API under several uvicorn workers that share their state.
+
+    python serve.py --workers 4 --port 8000
+
+With more than one worker SASSY_STATE_DB (default sassy_state.db) is set
+for all of them, so the upstream concurrency limit, the rate budget, the
+quiz pool and the reply cache are shared instead of multiplied by the
+worker count. Sessions and the quiz bank are SQLite files every worker
+opens already.
+"""
+import argparse
+import os
+import sys
+
+import uvicorn
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SASSY_WORKERS", os.cpu_count() or 1)))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--state-db", default=os.getenv("SASSY_STATE_DB", "sassy_state.db"),
+                        help="SQLite file for state shared by the workers")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+
+    if args.workers > 1:
+        if os.getenv("SASSY_SESSION_DB") == ":memory:":
+            parser.error("SASSY_SESSION_DB=:memory: would give every worker its own sessions")
+        os.environ["SASSY_STATE_DB"] = args.state_db
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        log_level=args.log_level,
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
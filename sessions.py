@@ -0,0 +1,154 @@
+"""Server-side quiz sessions: the active question, score and streaks per session.
+
+Backed by SQLite in WAL mode so several workers can share one file; pass
+":memory:" for a throwaway in-process store. Scores are updated in place
+on every answer and the leaderboard reads them through an index, so
+neither per-user stats nor the leaderboard ever scan answer history.
+"""
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Optional
+
+STAT_FIELDS = ("answered", "correct", "score", "streak", "best_streak")
+
+
+class SessionStore:
+    def __init__(self, path: str = ":memory:"):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "id TEXT PRIMARY KEY, name TEXT, created REAL NOT NULL, updated REAL NOT NULL, quiz TEXT, "
+            "answered INTEGER NOT NULL DEFAULT 0, correct INTEGER NOT NULL DEFAULT 0, "
+            "score INTEGER NOT NULL DEFAULT 0, streak INTEGER NOT NULL DEFAULT 0, "
+            "best_streak INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_score ON sessions (score DESC)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS seen (session_id TEXT NOT NULL, quiz_id INTEGER NOT NULL, "
+            "PRIMARY KEY (session_id, quiz_id))"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS totals (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def create(self, name=None) -> str:
+        session_id = uuid.uuid4().hex
+        self.ensure(session_id, name)
+        return session_id
+
+    def ensure(self, session_id: str, name=None):
+        """Create the session if it doesn't exist yet (clients may pick their own ids)."""
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO sessions (id, name, created, updated) VALUES (?, ?, ?, ?)",
+                (session_id, name, now, now),
+            )
+            if cursor.rowcount:
+                self._bump("sessions", 1)
+
+    def _bump(self, key: str, amount: int):
+        self._db.execute(
+            "INSERT INTO totals (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = value + ?",
+            (key, amount, amount),
+        )
+
+    def set_quiz(self, session_id: str, quiz: Optional[dict]):
+        """Make quiz the session's open question; None leaves it with none."""
+        body = json.dumps(quiz) if quiz is not None else None
+        with self._lock:
+            self._db.execute("UPDATE sessions SET quiz = ?, updated = ? WHERE id = ?", (body, time.time(), session_id))
+
+    def active_quiz(self, session_id: str):
+        with self._lock:
+            row = self._db.execute("SELECT quiz FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def seen(self, session_id: str) -> set:
+        with self._lock:
+            rows = self._db.execute("SELECT quiz_id FROM seen WHERE session_id = ?", (session_id,)).fetchall()
+        return {row[0] for row in rows}
+
+    def mark_seen(self, session_id: str, quiz_id: int):
+        with self._lock:
+            self._db.execute("INSERT OR IGNORE INTO seen (session_id, quiz_id) VALUES (?, ?)", (session_id, quiz_id))
+
+    def answer(self, session_id: str, option: int):
+        """Score an answer to the open question and close it.
+
+        Returns the outcome, or None if the session has no open question.
+        Raises KeyError for an unknown session and IndexError for an option
+        the question doesn't have.
+        """
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT quiz, streak, best_streak FROM sessions WHERE id = ?", (session_id,)
+                ).fetchone()
+                if row is None:
+                    raise KeyError(session_id)
+                if not row[0]:
+                    self._db.execute("ROLLBACK")
+                    return None
+                quiz, streak, best_streak = json.loads(row[0]), row[1], row[2]
+                if not 0 <= option < len(quiz["options"]):
+                    raise IndexError(option)
+                correct = option == quiz["answer"]
+                points = int(quiz.get("score", 1)) if correct else 0
+                streak = streak + 1 if correct else 0
+                self._db.execute(
+                    "UPDATE sessions SET quiz = NULL, updated = ?, answered = answered + 1, correct = correct + ?, "
+                    "score = score + ?, streak = ?, best_streak = ? WHERE id = ?",
+                    (time.time(), int(correct), points, streak, max(best_streak, streak), session_id),
+                )
+                self._bump("answered", 1)
+                self._bump("correct", int(correct))
+                self._db.execute("COMMIT")
+            except BaseException:
+                if self._db.in_transaction:
+                    self._db.execute("ROLLBACK")
+                raise
+        return {
+            "quiz": quiz,
+            "correct": correct,
+            "points": points,
+            "user_answer": quiz["options"][option],
+            "correct_answer": quiz["options"][quiz["answer"]],
+            "stats": self.stats(session_id),
+        }
+
+    def stats(self, session_id: str) -> dict:
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT name, {', '.join(STAT_FIELDS)} FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+        if row is None:
+            raise KeyError(session_id)
+        stats = dict(zip(("name",) + STAT_FIELDS, row))
+        stats["accuracy"] = round(stats["correct"] / stats["answered"], 3) if stats["answered"] else 0.0
+        return stats
+
+    def leaderboard(self, limit: int = 10) -> list:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, name, score, answered, correct, best_streak FROM sessions "
+                "ORDER BY score DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [
+            {"session_id": sid[:8], "name": name or "anonymous", "score": score,
+             "answered": answered, "correct": correct, "best_streak": best_streak}
+            for sid, name, score, answered, correct, best_streak in rows
+        ]
+
+    def totals(self) -> dict:
+        with self._lock:
+            rows = self._db.execute("SELECT key, value FROM totals").fetchall()
+        return {"sessions": 0, "answered": 0, "correct": 0, **dict(rows)}
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,383 @@
+"""State that several API workers must agree on, behind one small interface.
+
+A state hands out four primitives by name:
+    slots(name, limit)     at most `limit` holders at once (upstream calls in flight)
+    rate(name, per_minute) a token bucket that paces how fast holders start
+    queue(name)            a deque-like FIFO (append, popleft, len), e.g. the quiz pool
+    lease(name, ttl)       one holder at a time, renewed by re-acquiring (pool refills)
+
+LocalState keeps them in the process: the default, for one worker.
+SQLiteState keeps them in a SQLite file in WAL mode that every worker
+opens, so limits hold across workers instead of being multiplied by their
+count. Its slots and leases expire after `ttl` seconds, so a worker that
+dies holding one doesn't leak it. Waiting for a slot or for the rate
+budget is one poller per worker (the rest queue behind it in-process), so
+the file isn't hammered while the limit is reached, and a slot freed in the
+same worker wakes it at once. The writes behind every upstream call (slots
+and rate budget) run on the state's own thread, so a worker waiting on
+another's lock on the file never stalls its event loop.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+
+POLL = 0.005  # first wait between tries for a shared slot, doubling up to MAX_POLL
+MAX_POLL = 0.05
+
+
+def _take(tokens: float, updated: float, now: float, rate: float, burst: float):
+    """One token bucket step: (tokens left, seconds to wait); no wait means one was taken."""
+    tokens = min(burst, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+class RateBudget:
+    """At most `per_minute` starts a minute, in bursts of up to a second's worth."""
+
+    def __init__(self, per_minute: float, try_take, counters: dict):
+        # await try_take(rate, burst) -> seconds to wait, 0 once a token was taken
+        self.per_minute = per_minute
+        self.rate = per_minute / 60
+        self.burst = max(1.0, self.rate)
+        self._try_take = try_take
+        self._counters = counters
+        self._turn = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.per_minute > 0
+
+    async def take(self):
+        """Wait until the budget allows one more start."""
+        if not self.enabled:
+            return
+        async with self._turn:
+            wait = await self._try_take(self.rate, self.burst)
+            if wait:
+                self._counters["rate_waits"] += 1
+            while wait:
+                await asyncio.sleep(wait)
+                wait = await self._try_take(self.rate, self.burst)
+
+
+class _Slots:
+    @asynccontextmanager
+    async def hold(self):
+        token = await self.acquire()
+        try:
+            yield
+        finally:
+            self.release(token)
+
+
+class LocalSlots(_Slots):
+    def __init__(self, limit: int, counters: dict):
+        self.limit = limit
+        self.in_use = 0
+        self._semaphore = asyncio.Semaphore(limit)
+        self._counters = counters
+
+    async def acquire(self):
+        if self._semaphore.locked():
+            self._counters["slot_waits"] += 1
+        await self._semaphore.acquire()
+        self.in_use += 1
+
+    def release(self, token):
+        self.in_use -= 1
+        self._semaphore.release()
+
+
+class LocalLease:
+    """Always held: in one process the pool's own task bookkeeping is enough."""
+
+    def acquire(self) -> bool:
+        return True
+
+    def release(self):
+        pass
+
+
+class LocalState:
+    backend = "local"
+
+    def __init__(self):
+        self.counters = {"slot_waits": 0, "rate_waits": 0, "expired": 0}
+        self._slots = {}
+        self._rates = {}
+        self._queues = {}
+
+    def slots(self, name: str, limit: int) -> LocalSlots:
+        return self._slots.setdefault(name, LocalSlots(limit, self.counters))
+
+    def rate(self, name: str, per_minute: float) -> RateBudget:
+        if name not in self._rates:
+            bucket = {}
+
+            async def try_take(rate, burst):
+                now = time.monotonic()
+                tokens, updated = bucket.get("tokens", burst), bucket.get("updated", now)
+                bucket["tokens"], wait = _take(tokens, updated, now, rate, burst)
+                bucket["updated"] = now
+                return wait
+
+            self._rates[name] = RateBudget(per_minute, try_take, self.counters)
+        return self._rates[name]
+
+    def queue(self, name: str) -> deque:
+        return self._queues.setdefault(name, deque())
+
+    def lease(self, name: str, ttl: float) -> LocalLease:
+        return LocalLease()
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            **self.counters,
+            "slots": {name: {"limit": s.limit, "in_use": s.in_use} for name, s in self._slots.items()},
+            "rates": {name: r.per_minute for name, r in self._rates.items()},
+            "queues": {name: len(q) for name, q in self._queues.items()},
+        }
+
+    def close(self):
+        pass
+
+
+class SharedSlots(_Slots):
+    def __init__(self, state: "SQLiteState", name: str, limit: int):
+        self.state = state
+        self.name = name
+        self.limit = limit
+        self._turn = asyncio.Lock()
+        self._released = asyncio.Event()  # a slot freed in this worker: no need to wait out the poll
+
+    async def _try(self):
+        """A slot's token or None, taken on the state's thread.
+
+        If the caller is cancelled meanwhile (e.g. a hedge that lost) a slot
+        the thread still takes is given back rather than left to expire.
+        """
+        attempt = self.state._run(self.state._try_slot, self.name, self.limit)
+
+        def give_back(done):
+            if not done.cancelled() and done.exception() is None and done.result() is not None:
+                self.release(done.result())
+
+        try:
+            return await asyncio.shield(attempt)
+        except asyncio.CancelledError:
+            attempt.add_done_callback(give_back)
+            raise
+
+    async def acquire(self) -> str:
+        if not self._turn.locked():
+            token = await self._try()
+            if token is not None:
+                return token
+        self.state.counters["slot_waits"] += 1
+        async with self._turn:
+            delay = POLL
+            while True:
+                self._released.clear()  # before trying, so a release during the try still wakes us
+                token = await self._try()
+                if token is not None:
+                    break
+                try:
+                    await asyncio.wait_for(self._released.wait(), delay)
+                except asyncio.TimeoutError:
+                    delay = min(delay * 2, MAX_POLL)
+        return token
+
+    def release(self, token: str):
+        """Give the slot back on the state's thread; this worker's waiter retries once it is gone."""
+        done = self.state._run(self.state._execute, "DELETE FROM slots WHERE id = ?", (token,))
+        done.add_done_callback(lambda _: self._released.set())
+
+    @property
+    def in_use(self) -> int:
+        return self.state._scalar("SELECT COUNT(*) FROM slots WHERE name = ? AND expires > ?", (self.name, time.time()))
+
+
+class SharedQueue:
+    """A FIFO of JSON values in the state file, used like a deque."""
+
+    def __init__(self, state: "SQLiteState", name: str):
+        self.state = state
+        self.name = name
+
+    def append(self, item):
+        self.state._execute("INSERT INTO queue (name, item) VALUES (?, ?)", (self.name, json.dumps(item)))
+
+    def popleft(self):
+        """The oldest item; IndexError if there is none (another worker may have just taken it)."""
+        with self.state._write() as db:
+            row = db.execute("SELECT id, item FROM queue WHERE name = ? ORDER BY id LIMIT 1", (self.name,)).fetchone()
+            if row is None:
+                raise IndexError("pop from an empty queue")
+            db.execute("DELETE FROM queue WHERE id = ?", (row[0],))
+        return json.loads(row[1])
+
+    def __len__(self) -> int:
+        return self.state._scalar("SELECT COUNT(*) FROM queue WHERE name = ?", (self.name,))
+
+
+class SharedLease:
+    def __init__(self, state: "SQLiteState", name: str, ttl: float):
+        self.state = state
+        self.name = name
+        self.ttl = ttl
+
+    def acquire(self) -> bool:
+        """Take the lease, or renew it if this worker holds it; False if another worker does."""
+        now = time.time()
+        owner = self.state.owner
+        with self.state._write() as db:
+            expired = db.execute("DELETE FROM leases WHERE name = ? AND expires <= ?", (self.name, now)).rowcount
+            db.execute(
+                "INSERT INTO leases VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET expires = excluded.expires WHERE owner = excluded.owner",
+                (self.name, owner, now + self.ttl),
+            )
+            holder = db.execute("SELECT owner FROM leases WHERE name = ?", (self.name,)).fetchone()[0]
+        self.state.counters["expired"] += expired
+        return holder == owner
+
+    def release(self):
+        self.state._execute("DELETE FROM leases WHERE name = ? AND owner = ?", (self.name, self.state.owner))
+
+
+class SQLiteState:
+    backend = "sqlite"
+
+    def __init__(self, path: str, ttl: float = 300):
+        self.path = path
+        self.ttl = ttl  # a held slot is given up after this long, in case its worker died
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.counters = {"slot_waits": 0, "rate_waits": 0, "expired": 0}
+        self._slots = {}
+        self._rates = {}
+        self._queues = {}
+        self._lock = threading.Lock()
+        self._thread = ThreadPoolExecutor(1, thread_name_prefix="sassy-state")
+        self._db = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        for attempt in range(50):
+            try:
+                self._db.execute("PRAGMA journal_mode=WAL")
+                break
+            except sqlite3.OperationalError:
+                # Workers starting together race to switch a new file to WAL; that
+                # fails with "locked" at once rather than waiting out the timeout.
+                if attempt == 49:
+                    raise
+                time.sleep(0.1)
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS slots (id TEXT PRIMARY KEY, name TEXT NOT NULL, owner TEXT NOT NULL, "
+            "expires REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS slots_name ON slots (name, expires)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rates (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS queue (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, "
+            "item TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS queue_name ON queue (name, id)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+
+    def _run(self, fn, *args):
+        """fn(*args) on the state's thread rather than the event loop, as a future to await."""
+        return asyncio.get_running_loop().run_in_executor(self._thread, fn, *args)
+
+    @contextmanager
+    def _write(self):
+        """A short write transaction, locked up front so workers queue instead of deadlocking."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def _execute(self, sql: str, params=()):
+        with self._lock:
+            self._db.execute(sql, params)
+
+    def _scalar(self, sql: str, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchone()[0]
+
+    def _try_slot(self, name: str, limit: int):
+        """A new slot's id, or None if `limit` live ones are held already."""
+        now = time.time()
+        with self._write() as db:
+            expired = db.execute("DELETE FROM slots WHERE name = ? AND expires <= ?", (name, now)).rowcount
+            held = db.execute("SELECT COUNT(*) FROM slots WHERE name = ?", (name,)).fetchone()[0]
+            token = uuid.uuid4().hex if held < limit else None
+            if token is not None:
+                db.execute("INSERT INTO slots VALUES (?, ?, ?, ?)", (token, name, self.owner, now + self.ttl))
+        self.counters["expired"] += expired
+        return token
+
+    def slots(self, name: str, limit: int) -> SharedSlots:
+        return self._slots.setdefault(name, SharedSlots(self, name, limit))
+
+    def rate(self, name: str, per_minute: float) -> RateBudget:
+        if name not in self._rates:
+            def take_now(rate, burst):
+                now = time.time()
+                with self._write() as db:
+                    row = db.execute("SELECT tokens, updated FROM rates WHERE name = ?", (name,)).fetchone()
+                    tokens, wait = _take(*(row or (burst, now)), now, rate, burst)
+                    db.execute("INSERT OR REPLACE INTO rates VALUES (?, ?, ?)", (name, tokens, now))
+                return wait
+
+            async def try_take(rate, burst):
+                return await self._run(take_now, rate, burst)
+
+            self._rates[name] = RateBudget(per_minute, try_take, self.counters)
+        return self._rates[name]
+
+    def queue(self, name: str) -> SharedQueue:
+        return self._queues.setdefault(name, SharedQueue(self, name))
+
+    def lease(self, name: str, ttl: float) -> SharedLease:
+        return SharedLease(self, name, ttl)
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "path": self.path,
+            "owner": self.owner,
+            **self.counters,
+            "slots": {name: {"limit": s.limit, "in_use": s.in_use} for name, s in self._slots.items()},
+            "rates": {name: r.per_minute for name, r in self._rates.items()},
+            "queues": {name: len(q) for name, q in self._queues.items()},
+        }
+
+    def close(self):
+        """Give back whatever this worker still holds."""
+        self._thread.shutdown(wait=True)
+        with self._lock:
+            self._db.execute("DELETE FROM slots WHERE owner = ?", (self.owner,))
+            self._db.execute("DELETE FROM leases WHERE owner = ?", (self.owner,))
+            self._db.close()
+
+
+def open_state(path: str = None):
+    """SQLiteState on path if given, else LocalState."""
+    return SQLiteState(path) if path else LocalState()
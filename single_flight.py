@@ -0,0 +1,37 @@
+import asyncio
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one in-flight call.
+
+    The first caller for a key starts the work; anyone arriving with the same
+    key before it finishes awaits the same result (or exception). The shared
+    call is shielded, so one caller disconnecting does not cancel it for the
+    others.
+    """
+
+    def __init__(self):
+        self.inflight = {}
+        self.counters = {"calls": 0, "saved_calls": 0}
+
+    async def do(self, key, fn):
+        """Return await fn(), sharing the call with any concurrent caller using the same key."""
+        future = self.inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self.inflight[key] = future
+            future.add_done_callback(lambda f: self._forget(key, f))
+            self.counters["calls"] += 1
+        else:
+            self.counters["saved_calls"] += 1
+        return await asyncio.shield(future)
+
+    def _forget(self, key, future):
+        if self.inflight.get(key) is future:
+            del self.inflight[key]
+        # Mark the exception as seen if every waiter went away before it landed.
+        if not future.cancelled():
+            future.exception()
+
+    def stats(self) -> dict:
+        return {**self.counters, "in_flight": len(self.inflight)}
@@ -1,186 +1,80 @@
 import streamlit as st
-from dotenv import load_dotenv
-from openai import OpenAI
 import os
-import json
-import re
-import ast
-import autopep8
+import threading
 
-# --- Config ---
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-MODEL_GENERAL = "gpt-3.5-turbo"
-MODEL_QUIZ = "gpt-4"
-TEMP_GENERAL = 0.8
-TEMP_QUIZ = 0.9
-
-# --- Helpers ---
-def extract_json(text: str) -> str:
-    """Extract the first JSON object from text."""
-    match = re.search(r"\{.*\}", text, re.DOTALL)
-    return match.group(0) if match else text
-
-def validate_quiz_json(raw_json: str):
-    """Validate quiz JSON structure and return safe version if invalid."""
-    fallback = {
-        "question": "Oops, my sass broke the quiz format. Try again?",
-        "code": None,
-        "options": ["Python", "Monty", "Coffee", "I give up"],
-        "answer": 0,
-        "hint": "I need a reboot... or coffee.",
-        "score": 1
-    }
-    try:
-        raw_json = extract_json(raw_json)
-        quiz = json.loads(raw_json)
-
-        required_keys = ["question", "options", "answer", "hint", "score"]
-        if not all(key in quiz for key in required_keys):
-            return fallback
-
-        if not isinstance(quiz["options"], list) or not all(isinstance(opt, str) for opt in quiz["options"]):
-            return fallback
-        if not isinstance(quiz["answer"], int):
-            return fallback
-        if not isinstance(quiz["score"], int):
-            return fallback
-
-        if "code" in quiz and not (quiz["code"] is None or isinstance(quiz["code"], str)):
-            quiz["code"] = None
-
-        return quiz
-    except Exception:
-        return fallback
-
-def _chat(model: str, prompt: str, temperature: float, max_tokens: int = 200) -> str:
-    """Query OpenAI API and return clean text."""
-    response = client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=temperature,
-        max_tokens=max_tokens
-    )
-    return response.choices[0].message.content.strip()
-
-# --- Core Functions ---
-def sassy_reply(mode: str, content: str):
-    """Generate a sassy AI reply depending on mode."""
-    if mode in ["ask", "code"] and not content:
-        return "You forgot to give me something to sass about."
-
-    if mode == "ask":
-        prompt = f"""
-        You are Sassy Python, an AI tutor with attitude.
-        Explain this Python concept in a sarcastic, confident tone.
-        Give a real, concise answer with an example if useful (max 150 words).
-
-        Question:
-        {content}
-        """
-        return _chat(MODEL_GENERAL, prompt, TEMP_GENERAL)
-
-    elif mode == "code":
-        prompt = f"""
-        You are Sassy Python, an overconfident AI tutor.
-        Roast this code first in a sarcastic tone.
-        Then give a **corrected version of the code** that actually works, keeping it as close to the user's code as possible.
-        Finally, give a **short, clear explanation** for a beginner about what this code does.
-        AND include a **concise note on what exactly was wrong** in the original code (syntax, missing colons, indentation, etc.).
-        
-        Code:
-        {content}
+from cachetools import LRUCache
 
-        Return a JSON object like:
-        {{
-          "roast": "...your sassy text...",
-          "corrected_code": "...fixed python code...",
-          "explanation": "...brief beginner-friendly explanation including what went wrong..."
-        }}
-        """
-        raw_reply = _chat(MODEL_GENERAL, prompt, TEMP_GENERAL, max_tokens=400)
-        try:
-            return json.loads(raw_reply)
-        except Exception:
-            return {"roast": raw_reply, "corrected_code": content, "explanation": "No explanation available."}
-
-    elif mode == "quiz":
-        prompt = """
-        You are Sassy Python, an AI that generates fun Python quiz questions.
-
-        Task:
-        - Generate a beginner or intermediate Python multiple-choice question.
-        - If needed, include a short Python code snippet in a separate field.
-        - Keep questions clear and concise.
-        - Be mildly sarcastic but still educational.
-
-        Return ONLY a JSON object like this:
-        {
-          "question": "What will the following code output?",
-          "code": "print(2 ** 3)",   // Omit this field if not needed
-          "options": [
-            "6",
-            "8",
-            "9",
-            "Error"
-          ],
-          "answer": 1,
-          "hint": "Remember what ** means in Python.",
-          "score": 3
-        }
-        """
-        response = client.chat.completions.create(
-            model=MODEL_QUIZ,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=TEMP_QUIZ,
-            max_tokens=300
-        )
-        raw = response.choices[0].message.content.strip()
-        return validate_quiz_json(raw)
-
-    else:
-        return "Invalid mode."
+import background
+from engine import Engine, make_client
 
+# --- Config ---
+# Models, budgets and prompts come from engine.py, shared with the API.
+# While a quiz is on screen the next one is generated in the background and kept
+# for SASSY_PREFETCH_TTL seconds (0 turns prefetching off).
+PREFETCH_TTL = float(os.getenv("SASSY_PREFETCH_TTL", "120"))
 
-def generate_roast(question: str, user_answer: str, correct_answer: str) -> str:
-    """
-    Generate a roast for a wrong quiz answer.
-    Uses dynamic sassy text instead of hardcoding.
+# --- Helpers ---
+# Streamlit re-runs this script on every click, so anything costly is built
+# once per process in st.cache_resource and only when first needed.
+@st.cache_resource(show_spinner=False)
+def get_engine() -> Engine:
+    """The OpenAI client and engine, made on first use and shared by every browser session."""
+    engine = Engine(make_client())
+    engine.review_unit = _cached_review_unit(engine)
+    return engine
+
+def _cached_review_unit(engine: Engine, maxsize: int = 512):
+    """engine.review_unit cached by the unit's source, not the rest of the file.
+
+    It runs on Engine.review's pool threads, so the cache is a plain locked
+    LRU rather than st.cache_data.
     """
-    code_like = any(c in user_answer for c in ["=", "print", "def", ":", "()", "[]", "{}"])
-
-    if code_like:
-        # Treat as Python code
-        try:
-            ast.parse(user_answer)
-            corrected_code = user_answer
-            explanation = f"Explanation: Your code is syntactically correct. Here's what it does:\n{user_answer}"
-        except SyntaxError as e:
-            explanation = f"Explanation: Syntax error: {e.msg} at line {e.lineno}, column {e.offset}."
-            try:
-                corrected_code = autopep8.fix_code(user_answer)
-            except Exception:
-                corrected_code = "Could not auto-correct the code."
-
-        roast = sassy_reply("code", user_answer)
-        result = f"{roast}\n\n{explanation}\n\nCorrected Code:\n{corrected_code}"
-
+    cache, lock = LRUCache(maxsize=maxsize), threading.Lock()
+
+    def review_unit(unit, context: str) -> dict:
+        with lock:
+            review = cache.get(unit.source)
+        if review is None:
+            review = engine._review_unit(unit, context)
+            with lock:
+                cache[unit.source] = review
+        return review
+
+    return review_unit
+
+# LLM calls run as background jobs (background.py), so the page stays live
+# while they stream and can be cancelled. Jobs get the engine passed in:
+# st.cache_resource is only read from the script thread.
+def _quiz_job(job, engine: Engine) -> dict:
+    return engine.quiz()
+
+def _stream_job(job, deltas) -> str:
+    return job.stream(deltas)
+
+def _review_job(job, engine: Engine, code: str) -> dict:
+    return engine.review(code)
+
+def prefetch_quiz():
+    """Start generating the next quiz unless one is already on its way."""
+    if PREFETCH_TTL > 0 and background.get("next_quiz") is None:
+        background.start("next_quiz", _quiz_job, get_engine(), label="Preparing the next question")
+
+def next_quiz():
+    """Make the prefetched quiz the current one while it is fresh, else start a new one."""
+    job = background.get("next_quiz")
+    if job is not None and job.elapsed <= PREFETCH_TTL and job.state in ("running", "done"):
+        background.rename("next_quiz", "quiz")
     else:
-        # Treat as multiple-choice / text answer
-        prompt = f"""
-        You are Sassy Python, an AI tutor with attitude.
-        A user answered this quiz question incorrectly:
-        Question: {question}
-        User Answer: {user_answer}
-        Correct Answer: {correct_answer}
-        Roast their wrong answer in a funny, sarcastic way and give a brief explanation.
-        Keep it under 100 words.
-        """
-        roast = _chat(MODEL_GENERAL, prompt, TEMP_GENERAL)
-        result = roast
+        background.cancel("next_quiz")
+        background.start("quiz", _quiz_job, get_engine(), label="Writing a question")
 
-    return result
+def show_failure(job):
+    if job.error is not None:
+        st.error(f"Request failed: {job.error}")
+    else:
+        st.info(f"Request {job.state}.")
+    if job.parts:
+        st.markdown(job.text)
 
 # --- Streamlit UI ---
 st.set_page_config(page_title="Sassy Python", page_icon="🐍", layout="wide")
@@ -203,8 +97,13 @@ with tab_ask:
         if not question.strip():
             st.warning("Please type something first.")
         else:
-            reply = sassy_reply("ask", question)
-            st.markdown(reply)
+            background.start("ask", _stream_job, get_engine().ask_stream(question), label="Thinking")
+    job = background.get("ask")
+    if job is not None and job.state == "done":
+        st.markdown(job.result())
+    elif job is not None and job.state != "running":
+        show_failure(job)
+    background.watch("ask")
 
 # --- Code tab ---
 with tab_code:
@@ -215,26 +114,43 @@ with tab_code:
         if not code.strip():
             st.warning("Please paste your code first.")
         else:
-            reply = sassy_reply("code", code)
+            background.start("code", _review_job, get_engine(), code, label="Reading your code")
+    job = background.get("code")
+    if job is not None and job.state == "done":
+        reply = job.result()
 
-            st.subheader("🔥 Roast")
-            st.write(reply.get("roast", "No roast available."))
+        st.subheader("🔥 Roast")
+        st.write(reply.get("roast", "No roast available."))
 
-            st.subheader("✅ Corrected Code")
-            st.code(reply.get("corrected_code", ""), language="python")
+        st.subheader("✅ Corrected Code")
+        st.code(reply.get("corrected_code", ""), language="python")
 
-            st.subheader("💡 Explanation")
-            st.write(reply.get("explanation", "No explanation provided."))
+        st.subheader("💡 Explanation")
+        st.write(reply.get("explanation", "No explanation provided."))
+    elif job is not None and job.state != "running":
+        show_failure(job)
+    background.watch("code")
 
 # --- Quiz tab ---
 with tab_quiz:
     st.subheader("Quiz time")
     cols = st.columns([1, 1, 2])
     if cols[0].button("🆕 New Question", key="quiz_new_btn"):
-        st.session_state.quiz_data = sassy_reply("quiz", "")
+        next_quiz()
+
+    job = background.get("quiz")
+    if job is not None and job.state == "done":
+        st.session_state.quiz_data = background.pop("quiz").result()
+        # clear the last answer and the selection for the new question
+        st.session_state.pop("quiz_choice", None)
+        st.session_state.pop("quiz_feedback", None)
+        background.cancel("roast")
+    elif job is not None and job.state != "running":
+        show_failure(background.pop("quiz"))
 
     quiz = st.session_state.quiz_data
     if quiz:
+        prefetch_quiz()
         st.markdown(f"**Q:** {quiz['question']}")
         if quiz.get("code"):
             st.code(quiz["code"], language="python")
@@ -246,22 +162,41 @@ with tab_quiz:
             else:
                 st.session_state.quiz_stats["total"] += 1
                 correct_answer = quiz["options"][quiz["answer"]]
-                if choice == correct_answer:
-                    st.success("Correct! 🎉")
+                feedback = {"correct": choice == correct_answer, "correct_answer": correct_answer, "roast": None}
+                if feedback["correct"]:
                     st.session_state.quiz_stats["correct"] += 1
                     st.session_state.quiz_stats["score"] += quiz["score"]
                 else:
-                    st.error(f"Wrong! Correct answer: {correct_answer}")
-                    roast_text = generate_roast(quiz["question"], choice, correct_answer)
-                    st.markdown(roast_text)
+                    roasts = quiz.get("roasts") or []
+                    feedback["roast"] = roasts[quiz["options"].index(choice)] if roasts else None
+                    if not feedback["roast"]:
+                        # Streams next to the next question's prefetch.
+                        deltas = get_engine().roast_stream(quiz["question"], choice, correct_answer)
+                        background.start("roast", _stream_job, deltas, label="Roasting")
+                st.session_state.quiz_feedback = feedback
+
+        feedback = st.session_state.get("quiz_feedback")
+        if feedback and feedback["correct"]:
+            st.success("Correct! 🎉")
+        elif feedback:
+            st.error(f"Wrong! Correct answer: {feedback['correct_answer']}")
+            roast = background.get("roast")
+            if feedback["roast"]:
+                st.markdown(feedback["roast"])
+            elif roast is not None and roast.state == "done":
+                st.markdown(roast.result())
+            elif roast is not None and roast.state != "running":
+                show_failure(roast)
 
         if st.button("➡️ Next Question", key="quiz_next_btn"):
-            st.session_state.quiz_data = sassy_reply("quiz", "")
-            st.session_state.pop("quiz_choice", None)
+            next_quiz()
+            # The quiz block above has already run; run it again so a finished prefetch shows now.
+            st.rerun()
 
         stats = st.session_state.quiz_stats
         st.markdown("---")
         st.markdown(
             f"**Score:** {stats['score']} points &nbsp;|&nbsp; "
             f"**Correct:** {stats['correct']} / {stats['total']}"
-        )
\ No newline at end of file
+        )
+    background.watch("roast", "quiz")
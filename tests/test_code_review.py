@@ -0,0 +1,33 @@
+import contextlib
+import io
+
+from code_review import imports, merge_reviews, split_units
+
+CODE = "import os\nx = 1\ndef f():\n    return x + 1\nprint(f())\n"
+
+
+def unchanged(units):
+    return [{"roast": "", "corrected_code": unit.source, "explanation": ""} for unit in units]
+
+
+def test_split_units_keeps_runs_of_top_level_code_apart():
+    units = split_units(CODE)
+    assert [(u.kind, u.start, u.end) for u in units] == [("module", 2, 2), ("function", 3, 4), ("module", 5, 5)]
+    assert [u.source for u in units] == ["x = 1", "def f():\n    return x + 1", "print(f())"]
+
+
+def test_merge_reviews_of_unchanged_units_still_runs():
+    units = split_units(CODE)
+    merged = merge_reviews(units, unchanged(units), imports(CODE))["corrected_code"]
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        exec(merged, {})
+    assert out.getvalue() == "2\n"
+
+
+def test_merge_reviews_follows_line_order():
+    code = "def g():\n    return 1\n\nclass C:\n    pass\n\ny = g()\n"
+    units = split_units(code)
+    reviews = unchanged(units)
+    merged = merge_reviews(list(reversed(units)), list(reversed(reviews)))["corrected_code"]
+    assert merged.index("def g") < merged.index("class C") < merged.index("y = g()")
@@ -0,0 +1,23 @@
+from json_stream import JsonAssembler, parse_json
+
+
+def partial(text):
+    assembler = JsonAssembler()
+    assembler.feed(text)
+    return assembler.partial()
+
+
+def test_string_cut_mid_value_is_dropped():
+    assert partial('{"question": "Q", "options": ["1", "2') == {"question": "Q", "options": ["1"]}
+    assert partial('{"question": "What does') == {}
+
+
+def test_number_cut_mid_value_is_dropped():
+    assert partial('{"a": 1, "b": 12') == {"a": 1}
+    assert parse_json('{"answer": 1') == {}
+
+
+def test_finished_values_are_kept():
+    assert partial('{"options": ["1", "2"') == {"options": ["1", "2"]}
+    assert partial('{"a": 12 ') == {"a": 12}
+    assert partial('{"a": {"b": true}') == {"a": {"b": True}}
@@ -0,0 +1,24 @@
+from prompt_budget import compact_code, count_tokens
+
+
+def module(functions=120, broken=None):
+    lines = []
+    for i in range(functions):
+        lines += [f"def handler_{i}(request, retries=3):", f"    total = request.count * {i} + retries",
+                  "    if total > 10:", f"        return total - {i}", "    return total", ""]
+        if i == broken:
+            lines.append("print(handler_0(None)")
+    return "\n".join(lines)
+
+
+def test_code_with_a_syntax_error_fits_the_budget_with_its_markers():
+    code = module(broken=60)
+    for budget in (100, 300, 600):
+        compacted = compact_code(code, budget)
+        assert count_tokens(compacted) <= budget, budget
+        assert "print(handler_0(None)" in compacted.splitlines()
+        assert "omitted" in compacted
+
+
+def test_code_that_parses_fits_the_budget():
+    assert count_tokens(compact_code(module(), 300)) <= 300
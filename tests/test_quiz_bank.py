@@ -0,0 +1,57 @@
+import json
+import sqlite3
+
+import numpy as np
+
+from quiz_bank import QuizBank, quiz_vector
+
+OUTPUT = "What will the following code output?"
+
+
+def quiz(code, options, answer, question=OUTPUT):
+    return {"question": question, "code": code, "options": options, "answer": answer, "hint": "", "score": 1}
+
+
+DIFFERENT_ANSWERS = [
+    (quiz("print(2 ** 3)", ["6", "8", "9", "Error"], 1), quiz("print(3 ** 2)", ["6", "8", "9", "Error"], 2)),
+    (quiz("print(type([]))", ["<class 'list'>", "<class 'dict'>", "Error"], 0),
+     quiz("print(type({}))", ["<class 'list'>", "<class 'dict'>", "Error"], 1)),
+    (quiz("print(len([1,2,3]))", ["3", "4", "2", "Error"], 0), quiz("print(len([1,2,3,4]))", ["3", "4", "2", "Error"], 1)),
+]
+REWORDED = [
+    (quiz("print(2 ** 3)", ["6", "8", "9", "Error"], 1), quiz("print(2**3)", ["8", "6", "9", "Error"], 0, "What does this code print?")),
+    (quiz(None, ["{}", "set()", "[]", "()"], 1, "Which of these creates an empty set?"),
+     quiz(None, ["set()", "{}", "[]", "()"], 0, "Which of the following creates an empty set?")),
+]
+
+
+def test_threshold_separates_different_answers_from_rewordings(tmp_path):
+    bank = QuizBank(str(tmp_path / "bank.db"))
+    for a, b in DIFFERENT_ANSWERS:
+        assert float(quiz_vector(a) @ quiz_vector(b)) < bank.threshold - 0.05
+    for a, b in REWORDED:
+        assert float(quiz_vector(a) @ quiz_vector(b)) > bank.threshold + 0.05
+
+
+def test_add_keeps_different_answers_apart(tmp_path):
+    bank = QuizBank(str(tmp_path / "bank.db"))
+    ids = {bank.add(q, "beginner") for pair in DIFFERENT_ANSWERS for q in pair}
+    assert len(ids) == 6
+    a, b = REWORDED[1]
+    first = bank.add(a, "beginner")
+    assert bank.add(b, "beginner") == first
+
+
+def test_grows_past_its_initial_capacity_and_reads_old_vectors(tmp_path):
+    path = str(tmp_path / "bank.db")
+    bank = QuizBank(path)
+    for i in range(100):
+        bank.add(quiz(f"print({i} * {i} - {i})", [str(i * i - i), "Error"], 0), "beginner")
+    db = sqlite3.connect(path)
+    body = json.dumps(quiz("print('old')", ["old", "Error"], 0))
+    db.execute("INSERT INTO quizzes (difficulty, topic, score, body, vector, created) VALUES ('beginner', 'x', 1, ?, ?, 0)",
+               (body, np.zeros(3 * 1024, dtype=np.float32).tobytes()))
+    db.commit()
+    reopened = QuizBank(path)
+    assert reopened.size == bank.size + 1
+    assert reopened.find_duplicate(quiz_vector(json.loads(body))) == reopened._ids[-1]
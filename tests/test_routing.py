@@ -0,0 +1,74 @@
+import asyncio
+
+from resilience import CircuitBreaker, CircuitOpenError, Resilient
+from routing import Router
+
+
+def router():
+    return Router({"ask": 0.05}, hedge_model="fast", min_samples=1000)
+
+
+def test_no_hedge_while_waiting_for_a_slot():
+    async def scenario():
+        slot = asyncio.Semaphore(0)
+        calls = []
+
+        async def call(model, on_slot):
+            calls.append(model)
+            async with slot:
+                on_slot()
+                await asyncio.sleep(0.01)
+                return model
+
+        run = asyncio.ensure_future(router().run("ask", "main", call))
+        await asyncio.sleep(0.12)  # queued past the hedge delay
+        slot.release()
+        return await run, calls
+
+    result, calls = asyncio.run(scenario())
+    assert result == "main"
+    assert calls == ["main"]
+
+
+def test_hedges_once_the_slot_is_held_past_the_delay():
+    async def call(model, on_slot):
+        on_slot()
+        await asyncio.sleep(0.2 if model == "main" else 0.01)
+        return model
+
+    r = router()
+    assert asyncio.run(r.run("ask", "main", call)) == "fast"
+    assert r.decisions[("ask", "hedge_won")] == 1
+
+
+def test_cancelled_non_trial_call_keeps_the_trial():
+    async def scenario():
+        breaker = CircuitBreaker(threshold=1, reset_after=0)
+        resilient = Resilient(breaker, attempts=1)
+        loser = asyncio.ensure_future(resilient.attempt(lambda: asyncio.sleep(1)))  # started while closed
+        await asyncio.sleep(0)
+        breaker.failure()  # another call failed: half-open from here
+        trial = asyncio.ensure_future(resilient.attempt(lambda: asyncio.sleep(1)))
+        await asyncio.sleep(0)
+        loser.cancel()
+        await asyncio.gather(loser, return_exceptions=True)
+        assert breaker.trial
+        trial.cancel()
+        await asyncio.gather(trial, return_exceptions=True)
+        assert not breaker.trial
+
+    asyncio.run(scenario())
+
+
+def test_short_circuited_calls_count_as_failed():
+    async def scenario():
+        breaker = CircuitBreaker(threshold=1, reset_after=60)
+        breaker.failure()
+        resilient = Resilient(breaker, attempts=1)
+        try:
+            await resilient.call(lambda: asyncio.sleep(0))
+        except CircuitOpenError:
+            pass
+        return resilient.counters["failed"]
+
+    assert asyncio.run(scenario()) == 1
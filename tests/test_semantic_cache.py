@@ -0,0 +1,20 @@
+from semantic_cache import SemanticCache
+
+STORED = "what is the difference between is and =="
+
+
+def cache_with_stored():
+    cache = SemanticCache()
+    cache.set(STORED, "is compares identity, == compares values")
+    return cache
+
+
+def test_paraphrase_hits():
+    cache = cache_with_stored()
+    assert cache.get("explain the difference between is and == pls") is not None
+
+
+def test_other_operators_and_keywords_miss():
+    cache = cache_with_stored()
+    for question in ["difference between = and ==", "/ and //", "and and or", "is not vs !=", "** vs *"]:
+        assert cache.get(question) is None, question
@@ -0,0 +1,11 @@
+from engine import fallback_quiz
+from sessions import SessionStore
+
+
+def test_no_open_question_after_set_quiz_none():
+    store = SessionStore()
+    session_id = store.create()
+    store.set_quiz(session_id, fallback_quiz())
+    store.set_quiz(session_id, None)
+    assert store.active_quiz(session_id) is None
+    assert store.answer(session_id, 0) is None
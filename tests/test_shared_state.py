@@ -0,0 +1,63 @@
+import asyncio
+import sqlite3
+import time
+
+from shared_state import SQLiteState
+
+
+def test_shared_slots_hold_the_limit_and_survive_cancelled_waiters(tmp_path):
+    async def scenario():
+        state = SQLiteState(str(tmp_path / "state.db"))
+        slots = state.slots("upstream", 2)
+        held = [await slots.acquire(), await slots.acquire()]
+        waiter = asyncio.ensure_future(slots.acquire())
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        slots.release(held.pop())
+        token = await asyncio.wait_for(slots.acquire(), 1)
+        await asyncio.sleep(0.05)  # let the state's thread settle
+        in_use = slots.in_use
+        slots.release(token)
+        slots.release(held.pop())
+        await asyncio.sleep(0.05)
+        remaining = slots.in_use
+        state.close()
+        return in_use, remaining
+
+    assert asyncio.run(scenario()) == (2, 0)
+
+
+def test_rate_budget_waits_off_the_event_loop(tmp_path):
+    async def scenario():
+        state = SQLiteState(str(tmp_path / "state.db"))
+        budget = state.rate("upstream", 600)  # 10 a second, bursts of 10
+        for _ in range(10):
+            await budget.take()
+        waits = state.counters["rate_waits"]
+        await budget.take()
+        state.close()
+        return waits, state.counters["rate_waits"]
+
+    assert asyncio.run(scenario()) == (0, 1)
+
+
+def test_locked_file_does_not_stall_the_event_loop(tmp_path):
+    path = str(tmp_path / "state.db")
+
+    async def scenario():
+        state = SQLiteState(path)
+        slots = state.slots("upstream", 1)
+        other_worker = sqlite3.connect(path, isolation_level=None)
+        other_worker.execute("BEGIN IMMEDIATE")
+        acquire = asyncio.ensure_future(slots.acquire())
+        started = time.perf_counter()
+        await asyncio.sleep(0.05)
+        ticked = time.perf_counter() - started
+        other_worker.execute("COMMIT")
+        slots.release(await acquire)
+        state.close()
+        return ticked
+
+    assert asyncio.run(scenario()) < 0.5
@@ -1,21 +1,114 @@
 import streamlit as st
 import requests
+import json
+from requests.adapters import HTTPAdapter
+
+import background
 
 # --- Config ---
 API_URL = "http://localhost:8000"  # change when you deploy
+TIMEOUT = (3.05, background.TIMEOUT)  # seconds to connect, seconds between bytes of a reply
 
 st.set_page_config(page_title="Sassy Python", page_icon="🐍", layout="wide")
 
-# --- Session State ---
-if "quiz_data" not in st.session_state:
-    st.session_state.quiz_data = None
-if "quiz_stats" not in st.session_state:
-    st.session_state.quiz_stats = {"score": 0, "correct": 0, "total": 0}
+# --- Helpers ---
+@st.cache_resource
+def http_session() -> requests.Session:
+    """One keep-alive connection pool to the API, shared by every browser session."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=32)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+http = http_session()
+
+def stream_reply(path: str, payload: dict, done: dict = None):
+    """Yield text deltas from one of the API's Server-Sent Events endpoints.
+
+    The done event's payload is copied into `done` if given.
+    """
+    with http.post(f"{API_URL}{path}", json=payload, stream=True, timeout=TIMEOUT) as res:
+        res.raise_for_status()
+        event = None
+        for line in res.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data = json.loads(line[len("data:"):])
+                if event == "delta":
+                    yield data["text"]
+                elif event == "done" and done is not None:
+                    done.update(data)
+                elif event == "error":
+                    raise RuntimeError(data["detail"])
+
+def fetch_quiz(session_id: str) -> dict:
+    res = http.post(f"{API_URL}/chat", json={"mode": "quiz", "session_id": session_id}, timeout=TIMEOUT)
+    res.raise_for_status()
+    return res.json()["reply"]
+
+# --- Background jobs (these run on the shared pool: no st.* calls inside) ---
+def _reply_job(job, payload: dict) -> str:
+    return job.stream(stream_reply("/chat/stream", payload))
+
+def _quiz_job(job, session_id: str) -> dict:
+    return fetch_quiz(session_id)
+
+def _answer_job(job, session_id: str, option: int) -> dict:
+    """Grade the answer and stream its roast (the API prefetches the next question meanwhile)."""
+    result = {}
+    job.stream(stream_reply("/roast/stream", {"session_id": session_id, "option": option}, done=result))
+    return result
+
+def load_quiz():
+    background.start("quiz", _quiz_job, st.session_state.session_id, label="Fetching a question")
+
+def show_failure(job, what: str):
+    """Render a job that didn't finish: an API error, a cancel or a timeout."""
+    error = job.error
+    if isinstance(error, requests.HTTPError):
+        st.error(f"Error {error.response.status_code}: Could not {what}.")
+    elif error is not None:
+        st.error(f"Request failed: {error}")
+    else:
+        st.info(f"Request {job.state}.")
+    if job.parts:
+        st.markdown(job.text)
+
+def show_reply(name: str, what: str):
+    job = background.get(name)
+    if job is None or job.state == "running":
+        return
+    if job.state == "done":
+        st.markdown(job.result())
+    else:
+        show_failure(job, what)
 
 # --- Header ---
 st.title("🐍 Sassy Python")
 st.caption("Your sarcastic Python tutor. Use the tabs below: Ask • Code • Quiz")
 
+# --- Session State ---
+# Score and the open question live on the server; the session id rides in the
+# URL so a page reload picks the same session back up.
+if "session_id" not in st.session_state:
+    session_id = st.query_params.get("session")
+    try:
+        state = http.get(f"{API_URL}/session/{session_id}", timeout=TIMEOUT) if session_id else None
+        if state is None or not state.ok:
+            state = http.post(f"{API_URL}/session", json={}, timeout=TIMEOUT)
+            state.raise_for_status()
+    except requests.RequestException as e:
+        # Nothing below works without the API; the next rerun tries again.
+        st.error(f"Request failed: {e}")
+        st.stop()
+    state = state.json()
+    st.session_state.session_id = state["session_id"]
+    st.session_state.quiz_stats = state["stats"]
+    st.session_state.quiz_data = state.get("quiz")
+    st.query_params["session"] = state["session_id"]
+
 # --- Tabs ---
 tab_ask, tab_code, tab_quiz = st.tabs(["💬 Ask", "📝 Code", "🎯 Quiz"])
 
@@ -31,14 +124,9 @@ with tab_ask:
         if not question.strip():
             st.warning("Please type something first.")
         else:
-            try:
-                res = requests.post(f"{API_URL}/chat", json={"mode": "ask", "content": question})
-                if res.ok:
-                    st.markdown(res.json()["reply"])
-                else:
-                    st.error(f"Error {res.status_code}: Could not get a reply.")
-            except Exception as e:
-                st.error(f"Request failed: {e}")
+            background.start("ask", _reply_job, {"mode": "ask", "content": question}, label="Thinking")
+    show_reply("ask", "get a reply")
+    background.watch("ask")
 
 # ---------------------------
 # 📝 Code tab
@@ -52,14 +140,9 @@ with tab_code:
         if not code.strip():
             st.warning("Please paste your code first.")
         else:
-            try:
-                res = requests.post(f"{API_URL}/chat", json={"mode": "code", "content": code})
-                if res.ok:
-                    st.markdown(res.json()["reply"])
-                else:
-                    st.error(f"Error {res.status_code}: Could not get a roast.")
-            except Exception as e:
-                st.error(f"Request failed: {e}")
+            background.start("code", _reply_job, {"mode": "code", "content": code}, label="Reading your code")
+    show_reply("code", "get a roast")
+    background.watch("code")
 
 # ---------------------------
 # 🎯 Quiz tab
@@ -70,14 +153,16 @@ with tab_quiz:
 
     cols = st.columns([1, 1, 2])
     if cols[0].button("🆕 New Question", key="quiz_new_btn"):
-        try:
-            res = requests.post(f"{API_URL}/chat", json={"mode": "quiz"})
-            if res.ok:
-                st.session_state.quiz_data = res.json()["reply"]
-            else:
-                st.error(f"Error {res.status_code}: Could not load quiz.")
-        except Exception as e:
-            st.error(f"Request failed: {e}")
+        load_quiz()
+
+    job = background.get("quiz")
+    if job is not None and job.state == "done":
+        st.session_state.quiz_data = background.pop("quiz").result()
+        # clear the last answer and the selection for the new question
+        background.cancel("answer")
+        st.session_state.pop("quiz_choice", None)
+    elif job is not None and job.state != "running":
+        show_failure(background.pop("quiz"), "load quiz")
 
     quiz = st.session_state.quiz_data
 
@@ -92,46 +177,36 @@ with tab_quiz:
             if choice is None:
                 st.warning("Please select an option before submitting.")
             else:
-                st.session_state.quiz_stats["total"] += 1
-                correct_answer = quiz["options"][quiz["answer"]]
-                if choice == correct_answer:
-                    st.success("Correct! 🎉")
-                    st.session_state.quiz_stats["correct"] += 1
-                    st.session_state.quiz_stats["score"] += quiz["score"]
-                else:
-                    st.error(f"Wrong! Correct answer: {correct_answer}")
-                    # Ask backend for a roast
-                    try:
-                        roast_res = requests.post(
-                            f"{API_URL}/roast",
-                            json={
-                                "question": quiz["question"],
-                                "user_answer": choice,
-                                "correct_answer": correct_answer,
-                            },
-                        )
-                        if roast_res.ok:
-                            st.markdown(roast_res.json().get("roast", ""))
-                    except Exception as e:
-                        st.info(f"(Roast unavailable) {e}")
+                # The server grades the answer, keeps score and streams a roast if it was wrong.
+                background.start("answer", _answer_job, st.session_state.session_id,
+                                 quiz["options"].index(choice), label="Grading")
+
+        answer = background.get("answer")
+        if answer is not None and answer.state == "done":
+            result = answer.result()
+            st.session_state.quiz_stats = result["stats"]
+            if result["correct"]:
+                st.success("Correct! 🎉")
+            else:
+                st.error(f"Wrong! Correct answer: {result['correct_answer']}")
+                st.markdown(answer.text or result.get("roast") or "")
+        elif answer is not None and answer.state != "running":
+            error = answer.error
+            if isinstance(error, requests.HTTPError) and error.response.status_code == 409:
+                st.warning("Already answered. Grab the next question.")
+            else:
+                show_failure(answer, "submit the answer")
 
         # Next question shortcut
         if st.button("➡️ Next Question", key="quiz_next_btn"):
-            try:
-                res = requests.post(f"{API_URL}/chat", json={"mode": "quiz"})
-                if res.ok:
-                    st.session_state.quiz_data = res.json()["reply"]
-                    # clear selection for the new question
-                    st.session_state.pop("quiz_choice", None)
-                else:
-                    st.error(f"Error {res.status_code}: Could not load quiz.")
-            except Exception as e:
-                st.error(f"Request failed: {e}")
+            load_quiz()
 
         # Stats
         stats = st.session_state.quiz_stats
         st.markdown("---")
         st.markdown(
             f"**Score:** {stats['score']} points &nbsp;|&nbsp; "
-            f"**Correct:** {stats['correct']} / {stats['total']}"
-        )
\ No newline at end of file
+            f"**Correct:** {stats['correct']} / {stats['answered']} &nbsp;|&nbsp; "
+            f"**Streak:** {stats['streak']} (best {stats['best_streak']})"
+        )
+    background.watch("answer", "quiz")